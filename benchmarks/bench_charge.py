@@ -0,0 +1,167 @@
+from xml.etree import ElementTree
+
+import pytest
+import responses
+from django.conf import settings
+from mock import MagicMock
+from payu.conf import PAYU_TOKENS_URL
+from silver.models import Transaction
+
+from silver_payu import http
+from silver_payu.parsers import parse_alu_response
+
+SUCCESS_RESPONSE = b"""<?xml version="1.0"?>
+<EPAYMENT>
+    <REFNO>123456789</REFNO>
+    <ALIAS>9592b7736c9e277fea8cc79c2e5b5a23</ALIAS>
+    <STATUS>SUCCESS</STATUS>
+    <RETURN_CODE>AUTHORIZED</RETURN_CODE>
+    <RETURN_MESSAGE>Successfull authorized</RETURN_MESSAGE>
+    <DATE>2012-11-06 20:52:20</DATE>
+    <ORDER_REF>7305</ORDER_REF>
+    <AUTH_CODE>13157TUlA15117</AUTH_CODE>
+    <HASH>b560a38e2b3e7bcbac328bbd6218bc60</HASH>
+</EPAYMENT>
+"""
+
+FAILED_RESPONSE = SUCCESS_RESPONSE.replace(b"SUCCESS", b"FAILED").replace(
+    b">AUTHORIZED<", b">AUTHORIZATION_FAILED<"
+)
+
+CUSTOMER = {
+    "BILL_ADDRESS": "Str. Lunga 1",
+    "BILL_CITY": "Timisoara",
+    "BILL_EMAIL": "john@acme.com",
+    "BILL_FNAME": "John",
+    "BILL_LNAME": "Doe",
+    "BILL_PHONE": "+40000000000",
+    "BILL_COUNTRYCODE": "RO",
+}
+
+THREEDS_DATA = {
+    "BROWSER_IP": "111.1.11.111",
+    "BROWSER_ACCEPT_HEADER": "*/*",
+    "BROWSER_USER_AGENT": "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Firefox/120.0",
+}
+
+
+@pytest.fixture(autouse=True)
+def mocked_payu():
+    http.close_session()
+
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body=SUCCESS_RESPONSE)
+    responses.add(responses.POST, PAYU_TOKENS_URL, body='{"code": "0"}')
+
+
+def _prepare(transaction):
+    payment_method = transaction.payment_method
+    payment_method.token = "token"
+    payment_method.archived_customer = CUSTOMER
+    payment_method.threeds_data = THREEDS_DATA
+    payment_method.save()
+
+    def setup():
+        transaction.state = Transaction.States.Pending
+        transaction.data = {}
+        # every charge starts with a freshly loaded payment method
+        payment_method._clear_decrypted_data()
+
+        return (transaction,)
+
+    return setup
+
+
+def _fake_payment(response):
+    return MagicMock(_request={"CC_TOKEN": "token", **CUSTOMER}, _response=response)
+
+
+def bench_charge_transaction_v2(
+    benchmark, payment_processor_triggered_v2, transaction_triggered_v2
+):
+    benchmark(
+        "charge_transaction_v2",
+        payment_processor_triggered_v2._charge_transaction,
+        setup=_prepare(transaction_triggered_v2),
+    )
+
+
+def bench_charge_transaction_v1(
+    benchmark, payment_processor_triggered, billed_transaction_triggered
+):
+    benchmark(
+        "charge_transaction_v1",
+        payment_processor_triggered._charge_transaction,
+        setup=_prepare(billed_transaction_triggered),
+    )
+
+
+@pytest.mark.parametrize("response", [SUCCESS_RESPONSE, FAILED_RESPONSE])
+def bench_parse_result_xml(
+    benchmark, payment_processor_triggered_v2, transaction_triggered_v2, response
+):
+    setup = _prepare(transaction_triggered_v2)
+    payment = _fake_payment(response)
+    status = "success" if response is SUCCESS_RESPONSE else "failed"
+
+    benchmark(
+        f"parse_result_xml_{status}",
+        lambda transaction: payment_processor_triggered_v2._parse_result(
+            transaction, response, payment
+        ),
+        setup=setup,
+    )
+
+
+@pytest.mark.parametrize("response", ['{"code": "0"}', '{"code": "601"}'])
+def bench_parse_result_json(
+    benchmark, payment_processor_triggered, transaction_triggered, response
+):
+    status = "success" if response == '{"code": "0"}' else "failed"
+
+    benchmark(
+        f"parse_result_json_{status}",
+        lambda transaction: payment_processor_triggered._parse_result(
+            transaction, response
+        ),
+        setup=_prepare(transaction_triggered),
+    )
+
+
+def bench_log_request_response(
+    benchmark, payment_processor_triggered_v2, transaction_triggered_v2
+):
+    setup = _prepare(transaction_triggered_v2)
+
+    def failed_setup():
+        (transaction,) = setup()
+        transaction.state = Transaction.States.Failed
+
+        return transaction, _fake_payment(FAILED_RESPONSE)
+
+    benchmark(
+        "log_request_response",
+        payment_processor_triggered_v2._log_request_response,
+        setup=failed_setup,
+    )
+
+
+def bench_parse_alu_response(benchmark):
+    benchmark(
+        "parse_alu_response", parse_alu_response, setup=lambda: (FAILED_RESPONSE,)
+    )
+
+
+def bench_parse_alu_response_elementtree(benchmark):
+    """
+    The element tree based parsing parse_alu_response replaced, for reference.
+    """
+
+    def parse(content):
+        element = ElementTree.fromstring(content)
+        return (
+            element.find("STATUS").text,
+            element.find("RETURN_CODE").text,
+            element.find("RETURN_MESSAGE").text,
+        )
+
+    benchmark("parse_alu_response_elementtree", parse, setup=lambda: (FAILED_RESPONSE,))
@@ -0,0 +1,112 @@
+import itertools
+
+import pytest
+from django.test import RequestFactory
+from mock import MagicMock, patch
+from silver.models import Transaction
+from silver.utils.payments import _get_jwt_token
+
+from silver_payu.payment_processors import payu_ipn_received, payu_token_received
+from silver_payu.views import threeds_data_view
+
+refnos = itertools.count(100000000)
+
+
+@pytest.fixture(autouse=True)
+def mocked_document_state():
+    with patch(
+        "silver.models.transactions.transaction.Transaction.update_document_state"
+    ):
+        yield
+
+
+def bench_ipn_received(benchmark, transaction):
+    def setup():
+        Transaction.objects.filter(pk=transaction.pk).update(
+            state=Transaction.States.Pending
+        )
+
+        return (
+            MagicMock(
+                REFNO=str(next(refnos)),
+                REFNOEXT=str(transaction.uuid),
+                ORDERSTATUS="PAYMENT_AUTHORIZED",
+            ),
+        )
+
+    benchmark("ipn_received", payu_ipn_received, setup=setup)
+
+
+def bench_ipn_redelivered(benchmark, transaction, django_capture_on_commit_callbacks):
+    ipn = MagicMock(
+        REFNO=str(next(refnos)),
+        REFNOEXT=str(transaction.uuid),
+        ORDERSTATUS="PAYMENT_AUTHORIZED",
+    )
+    # IPNs are marked as seen once their transaction commits
+    with django_capture_on_commit_callbacks(execute=True):
+        payu_ipn_received(ipn)
+
+    benchmark("ipn_redelivered", payu_ipn_received, setup=lambda: (ipn,))
+
+
+def bench_token_received(benchmark, transaction_triggered_v2):
+    def setup():
+        return (
+            MagicMock(
+                ipn=MagicMock(
+                    REFNO=str(next(refnos)), REFNOEXT=transaction_triggered_v2.uuid
+                ),
+                TOKEN_HASH="token-hash",
+                IPN_CC_EXP_DATE="2030-07-31",
+                IPN_CC_MASK="4111",
+            ),
+        )
+
+    benchmark("token_received", payu_token_received, setup=setup)
+
+
+def bench_threeds_data_view(benchmark, transaction_triggered_v2):
+    token = _get_jwt_token(transaction_triggered_v2)
+    factory = RequestFactory()
+
+    def setup():
+        request = factory.post(
+            f"/silver-payu/3ds_data/{token}",
+            {
+                "browser-java-enabled": "false",
+                "browser-language": "en-US",
+                "browser-color-depth": "24",
+                "browser-screen-height": "1080",
+                "browser-screen-width": "1920",
+                "browser-timezone": "-120",
+            },
+            REMOTE_ADDR="111.1.11.111",
+            HTTP_USER_AGENT="Mozilla/5.0",
+            HTTP_ACCEPT="*/*",
+        )
+
+        return request, token
+
+    def call(request, token):
+        assert threeds_data_view(request, token).status_code == 200
+
+    benchmark("threeds_data_view", call, setup=setup)
+
+
+def bench_transaction_response(benchmark, payment_processor, transaction):
+    request = RequestFactory().get("/complete", {"ctrl": "ctrl hash"})
+
+    def setup():
+        Transaction.objects.filter(pk=transaction.pk).update(
+            state=Transaction.States.Initial
+        )
+        transaction.state = Transaction.States.Initial
+
+        return (transaction, request)
+
+    benchmark(
+        "transaction_response",
+        payment_processor.handle_transaction_response,
+        setup=setup,
+    )
@@ -0,0 +1,44 @@
+import pytest
+
+import tests.conftest  # noqa: F401, configures Django
+from tests.fixtures import *  # noqa: F401, F403
+
+from benchmarks import harness
+
+_results = {}
+
+
+@pytest.fixture()
+def benchmark(db):
+    """
+    Measures a callable, records the result for the final report and fails if
+    it regressed, see harness.compare and harness.compare_speedups.
+    """
+
+    baseline = harness.load_baseline()
+
+    def run(name, function, setup=None, iterations=200):
+        result = harness.measure(function, setup=setup, iterations=iterations)
+        _results[name] = result
+
+        regressions = harness.compare_speedups(name, _results)
+        if not harness.UPDATE_BASELINE:
+            regressions += harness.compare(result, baseline.get(name))
+        assert not regressions, f"{name}: " + ", ".join(regressions)
+
+        return result
+
+    return run
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+
+    baseline = harness.load_baseline()
+    terminalreporter.write_sep("=", "benchmarks")
+    terminalreporter.write_line(harness.format_report(_results, baseline))
+
+    if harness.UPDATE_BASELINE:
+        harness.save_baseline({**baseline, **_results})
+        terminalreporter.write_line(f"Baseline saved to {harness.BASELINE_PATH}")
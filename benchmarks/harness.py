@@ -0,0 +1,165 @@
+"""
+A small benchmarking harness, reporting per call timings, database queries
+and allocations, and comparing them against a stored baseline.
+
+Timings vary too much across machines and runs to be compared against the
+baseline, so they are only reported. Regressions are found by query counts and
+by the speedups of some benchmarks over others, measured on the same run.
+"""
+
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# the least times the first benchmark's p50 must be lower than the second's
+SPEEDUPS = {
+    ("ipn_redelivered", "ipn_received"): 10,
+    ("parse_alu_response", "parse_alu_response_elementtree"): 1,
+}
+
+UPDATE_BASELINE = os.environ.get("BENCHMARK_UPDATE_BASELINE") == "1"
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_PATH) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results):
+    with open(BASELINE_PATH, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    index = min(int(round(percentile / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def measure(function, setup=None, iterations=200, warmup=10):
+    """
+    Calls `setup` (untimed, if given) and then `function`, `iterations` times.
+
+    Timings are measured in a first pass, while queries and allocations are
+    measured in a second, shorter pass, so their overhead doesn't skew timings.
+    """
+
+    def call():
+        args = setup() if setup else ()
+        start = time.perf_counter_ns()
+        function(*args)
+        return time.perf_counter_ns() - start
+
+    for _ in range(warmup):
+        call()
+
+    gc.collect()
+    gc.disable()
+    try:
+        durations = [call() for _ in range(iterations)]
+    finally:
+        gc.enable()
+
+    profiled_iterations = max(iterations // 10, 5)
+    peaks = []
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            for _ in range(profiled_iterations):
+                args = setup() if setup else ()
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                function(*args)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+    setup_queries = 0
+    if setup:
+        with CaptureQueriesContext(connection) as captured_setup:
+            setup()
+        setup_queries = len(captured_setup)
+
+    total_seconds = sum(durations) / 1e9
+
+    return {
+        "ops_per_sec": round(iterations / total_seconds, 1),
+        "p50_us": round(statistics.median(durations) / 1000, 1),
+        "p99_us": round(_percentile(durations, 99) / 1000, 1),
+        "queries": round(len(queries) / profiled_iterations - setup_queries, 2),
+        "peak_alloc_kib": round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def compare(result, baseline):
+    """
+    :return: A list of human readable regressions, empty if there are none.
+    """
+
+    if not baseline:
+        return []
+
+    regressions = []
+
+    if result["queries"] > baseline["queries"]:
+        regressions.append(
+            f"queries went up from {baseline['queries']} to {result['queries']}"
+        )
+
+    return regressions
+
+
+def compare_speedups(name, results):
+    """
+    Checks the SPEEDUPS involving the `name` benchmark, once both of their
+    benchmarks have results.
+
+    :return: A list of human readable regressions, empty if there are none.
+    """
+
+    regressions = []
+
+    for (fast, slow), min_speedup in SPEEDUPS.items():
+        if name not in (fast, slow) or fast not in results or slow not in results:
+            continue
+
+        speedup = results[slow]["p50_us"] / results[fast]["p50_us"]
+        if speedup < min_speedup:
+            regressions.append(
+                f"{fast} is only {speedup:.1f}x faster than {slow}, "
+                f"instead of at least {min_speedup}x"
+            )
+
+    return regressions
+
+
+def format_report(results, baseline):
+    lines = [
+        f"{'benchmark':<36}{'ops/sec':>12}{'p50 us':>10}{'p99 us':>10}"
+        f"{'queries':>9}{'peak KiB':>10}{'vs base':>9}"
+    ]
+
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        change = (
+            f"{result['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%}" if base else "new"
+        )
+        lines.append(
+            f"{name:<36}{result['ops_per_sec']:>12}{result['p50_us']:>10}"
+            f"{result['p99_us']:>10}{result['queries']:>9}"
+            f"{result['peak_alloc_kib']:>10}{change:>9}"
+        )
+
+    return "\n".join(lines)
@@ -46,6 +46,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=install_requires,
+    extras_require={"async": ["httpx>=0.23"]},
     classifiers=[
         "Environment :: Web Environment",
         "Framework :: Django :: 3.1",
@@ -0,0 +1,109 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SeenSet(object):
+    """
+    A thread-safe set holding at most `max_size` keys, which forgets the least
+    recently seen ones first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key not in self._keys:
+                return False
+
+            self._keys.move_to_end(key)
+            return True
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+seen_ipns = SeenSet(getattr(settings, "SILVER_PAYU_IPN_SEEN_SET_SIZE", 10000))
+
+
+def _enabled():
+    return getattr(settings, "SILVER_PAYU_IPN_DEDUPLICATION", True)
+
+
+def _get_cache():
+    return caches[getattr(settings, "SILVER_PAYU_IPN_CACHE", "default")]
+
+
+def get_ipn_key(ipn, kind):
+    """
+    :return: A 16 bytes digest of the (REFNOEXT, IPN type, REFNO) triplet.
+    """
+
+    value = f"{ipn.REFNOEXT}|{kind}|{ipn.REFNO}".encode("utf-8")
+
+    return hashlib.blake2b(value, digest_size=16).digest()
+
+
+def _get_cache_key(key):
+    return f"silver-payu-ipn-{key.hex()}"
+
+
+def is_duplicate(key):
+    """
+    Checks the in-process seen set first, then the shared cache (the IPN might
+    have been handled by another process).
+    """
+
+    if not _enabled():
+        return False
+
+    if key in seen_ipns:
+        return True
+
+    if _get_cache().get(_get_cache_key(key)) is None:
+        return False
+
+    seen_ipns.add(key)
+
+    return True
+
+
+def mark_as_seen(key):
+    if not _enabled():
+        return
+
+    seen_ipns.add(key)
+
+    timeout = getattr(settings, "SILVER_PAYU_IPN_SEEN_TIMEOUT", 60 * 60 * 24)
+    _get_cache().set(_get_cache_key(key), 1, timeout)
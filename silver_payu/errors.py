@@ -206,4 +206,63 @@ ALU_ERROR_CODES = {
         "silver_code": "default",
         "reason": "CC_TOKEN sent by the Merchant is not valid.",
     },
+    "GW_ERROR_GENERIC": {
+        "silver_code": "default",
+        "reason": "An error occurred during processing. Please retry the operation.",
+    },
+}
+
+# the RESPONSE_CODEs of IRN (refund) requests
+IRN_ERROR_CODES = {
+    "2": "ORDER_REF missing or incorrect.",
+    "3": "ORDER_AMOUNT missing or incorrect.",
+    "4": "ORDER_CURRENCY missing or incorrect.",
+    "5": "IRN_DATE is not in the correct format.",
+    "6": "Error refunding the order.",
+    "7": "The order was already refunded.",
+    "8": "Unknown error.",
+    "9": "Invalid ORDER_REF.",
+    "10": "Invalid ORDER_AMOUNT.",
+    "11": "Invalid ORDER_CURRENCY.",
 }
+
+
+class ErrorKinds(object):
+    # worth retrying after a few minutes
+    Transient = "transient"
+    # the terminal's limits were hit, retrying later (and slower) should work
+    Throttling = "throttling"
+    # retrying won't help
+    Permanent = "permanent"
+    # another charge on the same payment method is in flight, not a failure
+    Contention = "contention"
+    # PayU doesn't know the outcome yet, charging again could charge twice
+    Unknown = "unknown"
+
+
+TRANSIENT_ERROR_CODES = ("603", "605", "GW_ERROR_GENERIC")
+# REQUEST_EXPIRED: the ORDER_DATE went stale while waiting for PayU or for the
+# rate limits, so charges should slow down
+THROTTLING_ERROR_CODES = ("2000", "REQUEST_EXPIRED")
+# ALREADY_AUTHORIZED: an earlier attempt on the same ORDER_REF went through
+UNKNOWN_OUTCOME_ERROR_CODES = ("607", "ALREADY_AUTHORIZED")
+
+
+def get_error_kind(code):
+    """
+    :param code: A TOKEN_ERROR_CODES or ALU_ERROR_CODES code.
+    :return: One of the ErrorKinds.
+    """
+
+    code = str(code)
+
+    if code in TRANSIENT_ERROR_CODES:
+        return ErrorKinds.Transient
+
+    if code in THROTTLING_ERROR_CODES:
+        return ErrorKinds.Throttling
+
+    if code in UNKNOWN_OUTCOME_ERROR_CODES:
+        return ErrorKinds.Unknown
+
+    return ErrorKinds.Permanent
@@ -0,0 +1,171 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cards expire on their IPN_CC_EXP_DATE (stored as `valid_until` when the token
+is received), so there's no point in charging them afterwards: charges on
+expired cards are failed without calling PayU, the `check_payu_card_expiry`
+command fails the ones due ahead of time and sends `payment_method_expiring`
+for the cards about to expire.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as django_transaction
+from django.db.models import Index, Q
+from django.utils import timezone
+from silver.models import Transaction
+from silver.payment_processors import get_all_instances
+
+from silver_payu.models import PayUPaymentMethod
+from silver_payu.signals import payment_method_expiring
+
+logger = logging.getLogger(__name__)
+
+# the silver fail code of charges on expired cards
+EXPIRED_CARD_FAIL_CODE = "expired_card"
+EXPIRED_CARD_FAIL_REASON = "The card has expired."
+
+# the payment methods' expiry lookups, added by the 0007 migration
+EXPIRY_INDEX = Index(
+    fields=["payment_processor", "valid_until"], name="silver_payu_pm_expiry_idx"
+)
+
+
+def get_expiry_cutoff(now=None):
+    """
+    :return: The start of the current day, cards being usable through their
+             expiry date.
+    """
+
+    now = now or timezone.now()
+
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_expired(payment_method, now=None):
+    valid_until = payment_method.valid_until
+
+    return valid_until is not None and valid_until < get_expiry_cutoff(now)
+
+
+def mark_expired_card(data, valid_until):
+    """
+    Records the card's expiry date in a failed transaction's data, as silver
+    doesn't keep the fail reasons.
+    """
+
+    data["expired_card"] = valid_until.isoformat()
+
+
+def get_expiring_payment_methods(before, triggered_only=False):
+    """
+    :param triggered_only: Whether to leave out the payment methods of the
+                           PayUManual processors, whose payments the customers
+                           make themselves.
+    :return: The verified PayU payment methods whose card expires before the
+             given datetime.
+    """
+
+    # payment_processors imports this module
+    from silver_payu.payment_processors import PayUBase, PayUTriggeredBase
+
+    processor_class = PayUTriggeredBase if triggered_only else PayUBase
+    payment_processors = [
+        payment_processor.name
+        for payment_processor in get_all_instances()
+        if isinstance(payment_processor, processor_class)
+    ]
+
+    return PayUPaymentMethod.objects.filter(
+        payment_processor__in=payment_processors,
+        valid_until__lt=before,
+        verified=True,
+        canceled=False,
+    )
+
+
+def fail_expired_transactions(now=None):
+    """
+    Fails the Initial transactions of expired cards, for the triggered
+    processors. Pending ones are left alone, as PayU might have charged them
+    already (not all charges are tracked by PayUSubmission), and are failed
+    when they're about to be charged instead.
+
+    :return: The number of failed transactions.
+    """
+
+    expired = get_expiring_payment_methods(get_expiry_cutoff(now), triggered_only=True)
+    # the ones with a PayU reference or a LiveUpdate ctrl hash were sent to PayU
+    sent = Q(external_reference__gt="") | Q(data__has_key="ctrl")
+    transactions = Transaction.objects.filter(
+        payment_method__in=expired, state=Transaction.States.Initial
+    ).exclude(sent)
+
+    failed = 0
+    with django_transaction.atomic():
+        # each transaction's data gets its own marker
+        rows = transactions.select_for_update(of=("self",)).values_list(
+            "pk", "uuid", "data", "payment_method__valid_until"
+        )
+        for pk, uuid, data, valid_until in rows:
+            data = data or {}
+            mark_expired_card(data, valid_until)
+
+            failed += Transaction.objects.filter(pk=pk).update(
+                state=Transaction.States.Failed,
+                fail_code=EXPIRED_CARD_FAIL_CODE,
+                data=data,
+                updated_at=timezone.now(),
+            )
+            logger.info(
+                "PayU transaction %s failed: %s", uuid, EXPIRED_CARD_FAIL_REASON
+            )
+
+    return failed
+
+
+def notify_expiring_payment_methods(now=None):
+    """
+    Sends `payment_method_expiring` for the cards expiring within
+    SILVER_PAYU_EXPIRY_NOTICE_DAYS, once for each expiry date.
+
+    :return: The number of notified payment methods.
+    """
+
+    now = now or timezone.now()
+    notice_days = getattr(settings, "SILVER_PAYU_EXPIRY_NOTICE_DAYS", 30)
+
+    notified = 0
+    for payment_method in get_expiring_payment_methods(
+        now + timedelta(days=notice_days)
+    ).filter(valid_until__gte=get_expiry_cutoff(now)):
+        valid_until = payment_method.valid_until.isoformat()
+        if payment_method.data.get("expiry_notified") == valid_until:
+            continue
+
+        payment_method_expiring.send(
+            sender=PayUPaymentMethod,
+            payment_method=payment_method,
+            valid_until=payment_method.valid_until,
+        )
+
+        payment_method.data["expiry_notified"] = valid_until
+        PayUPaymentMethod.objects.filter(pk=payment_method.pk).update(
+            data=payment_method.data
+        )
+        notified += 1
+
+    return notified
@@ -11,6 +11,8 @@ from silver.payment_processors.forms import GenericTransactionForm
 from silver.utils.payments import get_payment_complete_url
 from silver.utils.international import countries
 
+from silver_payu.orders import get_order_lines
+
 
 class PayUTransactionFormBase(GenericTransactionForm, PayULiveUpdateForm):
     def __init__(
@@ -42,6 +44,10 @@ class PayUTransactionFormBase(GenericTransactionForm, PayULiveUpdateForm):
         }
 
     def _get_order(self, transaction) -> List[Dict[str, str]]:
+        order_lines = get_order_lines(transaction)
+        if order_lines:
+            return order_lines
+
         document = transaction.document
         product_name = (
             f"Payment for {document.kind} {document.series}-{document.number}"
@@ -0,0 +1,323 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+_session = None
+_session_last_used = 0.0
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    adapter = HTTPAdapter(
+        # number of hosts to keep connection pools for
+        pool_connections=getattr(settings, "SILVER_PAYU_HTTP_POOL_HOSTS", 4),
+        # number of connections kept alive for each host
+        pool_maxsize=getattr(settings, "SILVER_PAYU_HTTP_POOL_SIZE", 10),
+        # wait for a free connection, instead of going over the per host limit
+        pool_block=getattr(settings, "SILVER_PAYU_HTTP_POOL_BLOCK", True),
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_session():
+    """
+    Returns the process-wide session used for all the requests made to PayU.
+
+    Connections that have been idle for more than SILVER_PAYU_HTTP_IDLE_TIMEOUT
+    seconds are dropped, since PayU is likely to have closed them already. The
+    session is replaced rather than closed, since other threads might still be
+    making requests with it; its connections are closed once it's garbage
+    collected.
+    """
+
+    global _session, _session_last_used
+
+    idle_timeout = getattr(settings, "SILVER_PAYU_HTTP_IDLE_TIMEOUT", 30)
+
+    with _session_lock:
+        now = time.monotonic()
+
+        if not _session or now - _session_last_used > idle_timeout:
+            _session = _build_session()
+
+        _session_last_used = now
+
+        return _session
+
+
+def close_session():
+    global _session
+
+    with _session_lock:
+        if _session:
+            _session.close()
+            _session = None
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request, while PayU looks to be unreachable.
+
+    :param retry_after: The seconds until the circuit lets a request through.
+    """
+
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Opens after `failure_threshold` failures (connection errors, timeouts or
+    5xx responses) within `failure_window` seconds, failing requests fast.
+
+    After `reset_timeout` seconds it becomes half-open, letting a single trial
+    request through: the circuit closes if it succeeds and opens again if not.
+    """
+
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold=5,
+        failure_window=30,
+        reset_timeout=30,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = self.Closed
+        self._failures = deque()
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        :raises CircuitOpenError: If the request shouldn't be made.
+        """
+
+        with self._lock:
+            if self.state == self.Closed:
+                return
+
+            if self.state == self.Open:
+                elapsed = self.clock() - self._opened_at
+                if elapsed < self.reset_timeout:
+                    raise CircuitOpenError(
+                        "The PayU circuit breaker is open.",
+                        retry_after=self.reset_timeout - elapsed,
+                    )
+
+                self.state = self.HalfOpen
+
+            if self._trial_in_flight:
+                # the circuit opens again for `reset_timeout` if the trial fails
+                raise CircuitOpenError(
+                    "The PayU circuit breaker is half-open.",
+                    retry_after=self.reset_timeout,
+                )
+
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+            if self.state == self.HalfOpen:
+                self.state = self.Closed
+                self._failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            self._trial_in_flight = False
+            now = self.clock()
+
+            if self.state == self.HalfOpen:
+                self._open(now)
+                return
+
+            self._failures.append(now)
+            while self._failures[0] < now - self.failure_window:
+                self._failures.popleft()
+
+            if len(self._failures) >= self.failure_threshold:
+                self._open(now)
+
+    def record_ignored(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _open(self, now):
+        self.state = self.Open
+        self._opened_at = now
+        self._failures.clear()
+
+    def call(self, function, *args, **kwargs):
+        self.before_request()
+
+        try:
+            response = function(*args, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.record_failure()
+            raise
+        except Exception:
+            # not PayU's fault, e.g. a malformed request
+            self.record_ignored()
+            raise
+
+        self.record_response(response)
+
+        return response
+
+    async def acall(self, function, *args, **kwargs):
+        """
+        Same as `call`, for httpx coroutine functions.
+        """
+
+        self.before_request()
+
+        try:
+            response = await function(*args, **kwargs)
+        except httpx.TransportError:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_ignored()
+            raise
+
+        self.record_response(response)
+
+        return response
+
+    def record_response(self, response):
+        if response.status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """
+    :return: The process-wide circuit breaker of the URL's host.
+    """
+
+    host = urlparse(url).netloc
+
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(
+                failure_threshold=getattr(
+                    settings, "SILVER_PAYU_CIRCUIT_FAILURE_THRESHOLD", 5
+                ),
+                failure_window=getattr(settings, "SILVER_PAYU_CIRCUIT_FAILURE_WINDOW", 30),
+                reset_timeout=getattr(settings, "SILVER_PAYU_CIRCUIT_RESET_TIMEOUT", 30),
+            )
+
+        return _circuit_breakers[host]
+
+
+def reset_circuit_breakers():
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
+
+
+def post(url, data):
+    """
+    :raises CircuitOpenError: While PayU is unreachable, see CircuitBreaker.
+    """
+
+    timeout = getattr(settings, "SILVER_PAYU_HTTP_TIMEOUT", 60)
+
+    if not getattr(settings, "SILVER_PAYU_CIRCUIT_BREAKER", True):
+        return get_session().post(url, data=data, timeout=timeout)
+
+    return get_circuit_breaker(url).call(
+        get_session().post, url, data=data, timeout=timeout
+    )
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """
+    Returns the httpx client of the running event loop, configured the same
+    way as the pooled session.
+    """
+
+    loop = asyncio.get_running_loop()
+
+    client = _async_clients.get(loop)
+    if not client:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_keepalive_connections=getattr(
+                    settings, "SILVER_PAYU_HTTP_POOL_SIZE", 10
+                ),
+                keepalive_expiry=getattr(settings, "SILVER_PAYU_HTTP_IDLE_TIMEOUT", 30),
+            ),
+            timeout=getattr(settings, "SILVER_PAYU_HTTP_TIMEOUT", 60),
+        )
+        _async_clients[loop] = client
+
+    return client
+
+
+async def apost(url, data):
+    """
+    The non-blocking counterpart of `post`, using httpx when installed
+    (`pip install silver-payu[async]`) and a worker thread otherwise.
+    """
+
+    if not httpx:
+        return await sync_to_async(post, thread_sensitive=False)(url, data)
+
+    if not getattr(settings, "SILVER_PAYU_CIRCUIT_BREAKER", True):
+        return await get_async_client().post(url, data=data)
+
+    return await get_circuit_breaker(url).acall(
+        get_async_client().post, url, data=data
+    )
@@ -0,0 +1,251 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Timing spans around the hot paths (charges, PayU requests, response parsing,
+IPNs and views), recorded into in-process latency histograms labeled by
+outcome and error code.
+
+Spans are also passed to the SILVER_PAYU_INSTRUMENTATION_HOOKS callables
+(dotted paths), as `hook(name, duration, labels)`, e.g. for forwarding them to
+a tracing system. `render_prometheus` exports the histograms in Prometheus'
+text format. SILVER_PAYU_INSTRUMENTATION = False turns everything off.
+"""
+
+import functools
+import logging
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# in seconds, from a cache hit to a PayU request timing out
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is for the values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        :return: ([(upper bound, cumulative count)], sum, count)
+        """
+
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+
+        return cumulative, total, count
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+# (enabled, hooks), loaded on first use, since settings lookups are slow
+# compared to recording a span
+_config = None
+
+
+def _load_config():
+    global _config
+
+    paths = getattr(settings, "SILVER_PAYU_INSTRUMENTATION_HOOKS", ())
+    _config = (
+        getattr(settings, "SILVER_PAYU_INSTRUMENTATION", True),
+        [import_string(path) for path in paths],
+    )
+
+    return _config
+
+
+@receiver(setting_changed)
+def _reset_config(setting, **kwargs):
+    global _config
+
+    if setting.startswith("SILVER_PAYU_INSTRUMENTATION"):
+        _config = None
+
+
+def is_enabled():
+    return (_config or _load_config())[0]
+
+
+def _get_hooks():
+    return (_config or _load_config())[1]
+
+
+def record(name, duration, labels):
+    key = (name, tuple(sorted(labels.items())))
+
+    histogram = _histograms.get(key)
+    if not histogram:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+
+    histogram.observe(duration)
+
+    for hook in _get_hooks():
+        try:
+            hook(name, duration, labels)
+        except Exception:
+            logger.exception("Instrumentation hook %s failed.", hook)
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def get_histogram(name, **labels):
+    return _histograms.get((name, tuple(sorted(labels.items()))))
+
+
+class Span(object):
+    """
+    Times the code it wraps. Labels can be added while the span is open, an
+    `outcome` and an `error` (the exception's class) being added if an
+    exception is raised.
+    """
+
+    __slots__ = ("name", "labels", "_started_at")
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self._started_at = None
+
+    def set(self, **labels):
+        self.labels.update(labels)
+
+    def __enter__(self):
+        self._started_at = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = perf_counter() - self._started_at
+
+        if exc_type is not None:
+            self.labels.setdefault("outcome", "error")
+            self.labels.setdefault("error", exc_type.__name__)
+
+        if is_enabled():
+            record(self.name, duration, self.labels)
+
+        return False
+
+
+def timed(name, outcome=None, **labels):
+    """
+    Decorates a function with a span.
+
+    :param outcome: Called with the function's result, returns its outcome label.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(name, **labels) as function_span:
+                result = function(*args, **kwargs)
+                if outcome:
+                    function_span.set(outcome=outcome(result))
+
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+
+    return "{%s}" % ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_prometheus(prefix="silver_payu_"):
+    """
+    :return: The histograms, in Prometheus' text exposition format.
+    """
+
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+
+    lines = []
+    current_name = None
+    for (name, labels), histogram in histograms:
+        metric = f"{prefix}{name}_seconds"
+        if name != current_name:
+            lines.append(f"# TYPE {metric} histogram")
+            current_name = name
+
+        buckets, total, count = histogram.snapshot()
+        for bound, bucket_count in buckets:
+            bucket_labels = _format_labels(labels + (("le", _format_bound(bound)),))
+            lines.append(f"{metric}_bucket{bucket_labels} {bucket_count}")
+
+        formatted_labels = _format_labels(labels)
+        lines.append(f"{metric}_sum{formatted_labels} {total}")
+        lines.append(f"{metric}_count{formatted_labels} {count}")
+
+    return "\n".join(lines) + "\n"
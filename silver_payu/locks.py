@@ -0,0 +1,135 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per payment method mutexes, so that transactions sharing a card are charged one
+at a time (concurrent charges on the same card get declined, or put duplicate
+holds on it), while different cards are still charged concurrently.
+
+Locks are rows in a table rather than database locks, since they're held for
+as long as a PayU request takes. They expire after SILVER_PAYU_CHARGE_LOCK_TIMEOUT
+seconds, in case their holder dies.
+
+Locks should be acquired in autocommit mode, outside of any `atomic()` block:
+within one (e.g. with ATOMIC_REQUESTS), the lock's row wouldn't be visible to
+other workers until the outer transaction commits. There, the locks held by
+others are still respected, but no lock is taken.
+"""
+
+import logging
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction as django_transaction
+from django.utils import timezone
+
+from silver_payu.models import PayUPaymentMethodLock
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return getattr(settings, "SILVER_PAYU_CHARGE_LOCK", True)
+
+
+def acquire_lock(payment_method, timeout=None):
+    """
+    Doesn't wait for the lock to be released.
+
+    :return: A token for releasing the lock, or None if it's held by someone else.
+             The token is empty within a transaction, where no lock is taken,
+             see the module's docstring.
+    """
+
+    now = timezone.now()
+
+    if django_transaction.get_connection().in_atomic_block:
+        if PayUPaymentMethodLock.objects.filter(
+            payment_method_id=payment_method.pk, expires_at__gt=now
+        ).exists():
+            return None
+
+        logger.warning(
+            "Not locking payment method %s within a transaction.", payment_method.pk
+        )
+        return ""
+
+    if not timeout:
+        timeout = getattr(settings, "SILVER_PAYU_CHARGE_LOCK_TIMEOUT", 300)
+
+    token = uuid.uuid4().hex
+    expires_at = now + timedelta(seconds=timeout)
+
+    try:
+        with django_transaction.atomic():
+            PayUPaymentMethodLock.objects.create(
+                payment_method_id=payment_method.pk, token=token, expires_at=expires_at
+            )
+    except IntegrityError:
+        taken_over = PayUPaymentMethodLock.objects.filter(
+            payment_method_id=payment_method.pk, expires_at__lte=now
+        ).update(token=token, expires_at=expires_at)
+        if not taken_over:
+            return None
+
+    return token
+
+
+def release_lock(payment_method, token):
+    if not token:
+        return
+
+    PayUPaymentMethodLock.objects.filter(
+        payment_method_id=payment_method.pk, token=token
+    ).delete()
+
+
+@contextmanager
+def payment_method_lock(payment_method):
+    """
+    :return: A context manager yielding whether the lock was acquired. It's
+             always acquired while SILVER_PAYU_CHARGE_LOCK is disabled.
+    """
+
+    if not is_enabled():
+        yield True
+        return
+
+    token = acquire_lock(payment_method)
+    try:
+        yield token is not None
+    finally:
+        if token:
+            release_lock(payment_method, token)
+
+
+@asynccontextmanager
+async def apayment_method_lock(payment_method):
+    """
+    The async counterpart of `payment_method_lock`.
+    """
+
+    if not is_enabled():
+        yield True
+        return
+
+    token = await sync_to_async(acquire_lock)(payment_method)
+    try:
+        yield token is not None
+    finally:
+        if token:
+            await sync_to_async(release_lock)(payment_method, token)
@@ -0,0 +1,41 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+
+from django.core.management.base import BaseCommand
+
+from silver_payu.expiry import (
+    fail_expired_transactions,
+    notify_expiring_payment_methods,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fails the PayU transactions due on expired cards, and notifies about "
+        "the cards about to expire."
+    )
+
+    def handle(self, *args, **options):
+        failed = fail_expired_transactions()
+        notified = notify_expiring_payment_methods()
+
+        logger.info(
+            "Failed %s PayU transactions on expired cards, notified %s expiring "
+            "payment methods.",
+            failed,
+            notified,
+        )
@@ -0,0 +1,64 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from django.core.management.base import BaseCommand
+
+from silver_payu.notifications import process_notifications
+
+
+class Command(BaseCommand):
+    help = "Applies the PayU IPNs queued while SILVER_PAYU_ASYNC_IPN is enabled."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            help="The number of notifications applied concurrently.",
+            action="store",
+            dest="workers",
+            type=int,
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="The number of notifications claimed at once.",
+            action="store",
+            dest="batch_size",
+            type=int,
+        )
+        parser.add_argument(
+            "--loop",
+            help="Keep polling for new notifications.",
+            action="store_true",
+            dest="loop",
+        )
+        parser.add_argument(
+            "--interval",
+            help="Seconds to wait between polls, when the queue is empty.",
+            action="store",
+            dest="interval",
+            type=float,
+            default=1.0,
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            results = process_notifications(
+                max_workers=options["workers"], batch_size=options["batch_size"]
+            )
+
+            if not options["loop"]:
+                return
+
+            if not results:
+                time.sleep(options["interval"])
@@ -0,0 +1,63 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from silver_payu.models import PayUChargeLog
+
+
+class Command(BaseCommand):
+    help = "Deletes the PayU charge logs older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            help="Defaults to SILVER_PAYU_CHARGE_LOG_RETENTION_DAYS (90).",
+            action="store",
+            dest="days",
+            type=int,
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="The number of logs deleted at once.",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days is None:
+            days = getattr(settings, "SILVER_PAYU_CHARGE_LOG_RETENTION_DAYS", 90)
+
+        expired_logs = PayUChargeLog.objects.filter(
+            created_at__lt=timezone.now() - timedelta(days=days)
+        )
+
+        # deleting in batches keeps the locks short
+        deleted = 0
+        while True:
+            pks = list(
+                expired_logs.values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not pks:
+                break
+
+            deleted += PayUChargeLog.objects.filter(pk__in=pks).delete()[0]
+
+        self.stdout.write(f"Deleted {deleted} PayU charge logs.")
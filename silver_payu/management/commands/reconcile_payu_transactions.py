@@ -0,0 +1,73 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from silver_payu.reconciliation import get_stuck_transactions, reconcile_transactions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Looks up the PayU orders of the transactions stuck in Pending, and "
+        "settles or fails them accordingly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            help="The number of orders looked up concurrently.",
+            action="store",
+            dest="workers",
+            type=int,
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="The number of transactions reconciled at once.",
+            action="store",
+            dest="batch_size",
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        reconciled = set()
+
+        while True:
+            transactions = [
+                pk
+                for pk in get_stuck_transactions(batch_size=options["batch_size"])
+                if pk not in reconciled
+            ]
+            if not transactions:
+                return
+
+            results = reconcile_transactions(
+                transactions, max_workers=options["workers"]
+            )
+            reconciled.update(transactions)
+
+            for transaction, outcome in results:
+                logger.info(
+                    "Reconciled PayU transaction %s: %s.", transaction.uuid, outcome
+                )
+
+            counts = Counter(outcome for _, outcome in results)
+            self.stdout.write(
+                ", ".join(
+                    f"{count} {outcome}" for outcome, count in sorted(counts.items())
+                )
+            )
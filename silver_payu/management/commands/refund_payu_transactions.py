@@ -0,0 +1,91 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from silver.models import Transaction
+
+from silver_payu.payment_processors import PayUBase
+
+
+class Command(BaseCommand):
+    help = "Refunds Settled PayU transactions, reporting the outcome of each."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "uuids", nargs="*", help="The UUIDs of the transactions to refund."
+        )
+        parser.add_argument(
+            "--file",
+            help="A file with the UUIDs of the transactions to refund, one per line.",
+            action="store",
+            dest="file",
+        )
+        parser.add_argument(
+            "--workers",
+            help="The number of transactions refunded concurrently.",
+            action="store",
+            dest="workers",
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        uuids = list(options["uuids"])
+        if options["file"]:
+            with open(options["file"]) as uuids_file:
+                uuids.extend(line.strip() for line in uuids_file if line.strip())
+
+        if not uuids:
+            raise CommandError("No transactions given.")
+
+        transactions = Transaction.objects.filter(uuid__in=uuids).select_related(
+            "payment_method"
+        )
+
+        found = set()
+        payment_processors = {}
+        by_processor = defaultdict(list)
+        for transaction in transactions:
+            found.add(str(transaction.uuid))
+            payment_processor = transaction.payment_method.get_payment_processor()
+            if not isinstance(payment_processor, PayUBase):
+                self.stdout.write(f"{transaction.uuid}: not a PayU transaction")
+                continue
+
+            payment_processors[payment_processor.name] = payment_processor
+            by_processor[payment_processor.name].append(transaction)
+
+        for uuid in uuids:
+            if uuid not in found:
+                self.stdout.write(f"{uuid}: not found")
+
+        refunded = 0
+        for name, transactions in by_processor.items():
+            results = payment_processors[name].refund_transactions(
+                transactions, max_workers=options["workers"]
+            )
+
+            for transaction, result in results:
+                if result:
+                    refunded += 1
+                    self.stdout.write(f"{transaction.uuid}: refunded")
+                    continue
+
+                irn = transaction.data.get("irn") or {}
+                self.stdout.write(
+                    f"{transaction.uuid}: not refunded ({transaction.state}), "
+                    f"{irn.get('message') or 'no refund requested'}"
+                )
+
+        self.stdout.write(f"Refunded {refunded} of {len(uuids)} transactions.")
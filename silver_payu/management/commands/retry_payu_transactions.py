@@ -0,0 +1,64 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from silver_payu.payment_processors import PayUTriggeredBase
+from silver_payu.retries import get_due_retries
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Charges again the PayU transactions whose retry is due."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            help="The number of transactions charged concurrently.",
+            action="store",
+            dest="workers",
+            type=int,
+        )
+
+    def handle(self, *args, **options):
+        transactions = PayUTriggeredBase.get_charge_batch(get_due_retries())
+
+        payment_processors = {}
+        by_processor = defaultdict(list)
+        for transaction in transactions:
+            payment_method = transaction.payment_method
+            if not payment_method.verified or payment_method.canceled:
+                continue
+
+            payment_processor = payment_method.get_payment_processor()
+            if not isinstance(payment_processor, PayUTriggeredBase):
+                continue
+
+            payment_processors[payment_method.payment_processor] = payment_processor
+            by_processor[payment_method.payment_processor].append(transaction)
+
+        for name, transactions in by_processor.items():
+            results = payment_processors[name].execute_transactions(
+                transactions, max_workers=options["workers"]
+            )
+
+            for transaction, result in results:
+                logger.info(
+                    "Retried PayU transaction %s: %s.",
+                    transaction.uuid,
+                    "charged" if result else transaction.state,
+                )
@@ -0,0 +1,89 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from silver_payu.scheduling import ShardScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Charges the Initial PayU transactions from the shards leased by this "
+        "worker, alongside other workers running the same command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name",
+            help="The worker's name, defaults to its host name and pid.",
+            action="store",
+            dest="name",
+        )
+        parser.add_argument(
+            "--workers",
+            help="The number of transactions charged concurrently.",
+            action="store",
+            dest="workers",
+            type=int,
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="The number of transactions charged between heartbeats.",
+            action="store",
+            dest="batch_size",
+            type=int,
+        )
+        parser.add_argument(
+            "--loop",
+            help="Keep charging new transactions.",
+            action="store_true",
+            dest="loop",
+        )
+        parser.add_argument(
+            "--interval",
+            help="Seconds to wait between heartbeats, when there's nothing to charge.",
+            action="store",
+            dest="interval",
+            type=float,
+            default=10.0,
+        )
+
+    def handle(self, *args, **options):
+        scheduler = ShardScheduler(name=options["name"])
+
+        try:
+            while True:
+                results = scheduler.run_once(
+                    max_workers=options["workers"], batch_size=options["batch_size"]
+                )
+
+                for transaction, result in results:
+                    if result is not None:
+                        logger.info(
+                            "Charged PayU transaction %s: %s.",
+                            transaction.uuid,
+                            "success" if result else transaction.state,
+                        )
+
+                if not options["loop"]:
+                    return
+
+                if not results:
+                    time.sleep(options["interval"])
+        finally:
+            scheduler.release()
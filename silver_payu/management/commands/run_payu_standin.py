@@ -0,0 +1,85 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.core.management.base import BaseCommand
+
+from silver_payu.errors import ALU_ERROR_CODES, TOKEN_ERROR_CODES
+from silver_payu.standin import ErrorMix, PayUStandIn
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the PayU ALU, Token, LiveUpdate and IPN endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", action="store", dest="host", default="127.0.0.1")
+        parser.add_argument(
+            "--port", action="store", dest="port", type=int, default=8099
+        )
+        parser.add_argument(
+            "--alu-latency",
+            help="E.g. fixed:0.05, uniform:0.02,0.2, exponential:0.1, lognormal:-2.5,0.5",
+            action="store",
+            dest="alu_latency",
+        )
+        parser.add_argument("--token-latency", action="store", dest="token_latency")
+        parser.add_argument(
+            "--ipn-latency",
+            help="The delay of the IPNs sent for authorized orders.",
+            action="store",
+            dest="ipn_latency",
+        )
+        parser.add_argument(
+            "--alu-errors",
+            help="E.g. AUTHORIZATION_FAILED=0.05,INVALID_CC_TOKEN=0.01",
+            action="store",
+            dest="alu_errors",
+        )
+        parser.add_argument(
+            "--token-errors",
+            help="E.g. 603=0.02,2000=0.01",
+            action="store",
+            dest="token_errors",
+        )
+        parser.add_argument(
+            "--ipn-url",
+            help="Where to send IPNs to, e.g. http://localhost:8000/ipn/.",
+            action="store",
+            dest="ipn_url",
+        )
+        parser.add_argument("--seed", action="store", dest="seed", type=int)
+
+    def handle(self, *args, **options):
+        standin = PayUStandIn(
+            host=options["host"],
+            port=options["port"],
+            alu_latency=options["alu_latency"],
+            token_latency=options["token_latency"],
+            ipn_latency=options["ipn_latency"],
+            ipn_url=options["ipn_url"],
+            seed=options["seed"],
+        )
+        standin.alu_errors = ErrorMix.parse(options["alu_errors"], ALU_ERROR_CODES)
+        standin.token_errors = ErrorMix.parse(
+            options["token_errors"], TOKEN_ERROR_CODES
+        )
+
+        self.stdout.write(f"PayU stand-in listening on {standin.url}")
+
+        try:
+            standin.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            standin.stop()
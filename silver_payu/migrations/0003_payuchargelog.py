@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("silver", "0054_auto_20210628_1125"),
+        ("silver_payu", "0002_payunotification"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayUChargeLog",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("status", models.CharField(blank=True, max_length=32)),
+                ("return_code", models.CharField(blank=True, max_length=64)),
+                ("return_message", models.CharField(blank=True, max_length=256)),
+                ("compressed", models.BooleanField(default=False)),
+                ("request", models.BinaryField()),
+                ("response", models.BinaryField(blank=True)),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                (
+                    "transaction",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payu_charge_logs",
+                        to="silver.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+    ]
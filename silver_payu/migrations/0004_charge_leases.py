@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("silver_payu", "0003_payuchargelog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayUChargeLease",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveIntegerField(unique=True)),
+                (
+                    "owner",
+                    models.CharField(blank=True, db_index=True, max_length=255),
+                ),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["shard"],
+            },
+        ),
+        migrations.CreateModel(
+            name="PayUChargeWorker",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("heartbeat_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("silver", "0054_auto_20210628_1125"),
+        ("silver_payu", "0004_charge_leases"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayUPaymentMethodLock",
+            fields=[
+                (
+                    "payment_method",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="payu_lock",
+                        serialize=False,
+                        to="silver.paymentmethod",
+                    ),
+                ),
+                ("token", models.CharField(max_length=32)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from silver_payu.expiry import EXPIRY_INDEX
+
+
+def add_expiry_index(apps, schema_editor):
+    PaymentMethod = apps.get_model("silver", "PaymentMethod")
+    schema_editor.add_index(PaymentMethod, EXPIRY_INDEX)
+
+
+def remove_expiry_index(apps, schema_editor):
+    PaymentMethod = apps.get_model("silver", "PaymentMethod")
+    schema_editor.remove_index(PaymentMethod, EXPIRY_INDEX)
+
+
+class Migration(migrations.Migration):
+    # silver's PaymentMethod table isn't ours to alter through its state, the
+    # index is added to the database only
+    dependencies = [
+        ("silver", "0054_auto_20210628_1125"),
+        ("silver_payu", "0006_payusubmission"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_expiry_index, remove_expiry_index),
+    ]
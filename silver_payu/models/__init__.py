@@ -13,3 +13,8 @@
 # limitations under the License.
 
 from .payment_methods import PayUPaymentMethod
+from .notifications import PayUNotification
+from .charge_logs import PayUChargeLog
+from .leases import PayUChargeLease, PayUChargeWorker
+from .locks import PayUPaymentMethodLock
+from .submissions import PayUSubmission
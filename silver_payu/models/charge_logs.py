@@ -0,0 +1,72 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class PayUChargeLog(models.Model):
+    """
+    The (redacted) request and the response of a charge, kept out of
+    `transaction.data` when SILVER_PAYU_CHARGE_LOG is "table". Records are
+    only ever appended, and pruned by the `prune_payu_charge_logs` command.
+
+    Payloads are stored as JSON, zlib compressed when `compressed` is set.
+    """
+
+    transaction = models.ForeignKey(
+        "silver.Transaction",
+        related_name="payu_charge_logs",
+        on_delete=models.CASCADE,
+    )
+
+    status = models.CharField(max_length=32, blank=True)
+    return_code = models.CharField(max_length=64, blank=True)
+    return_message = models.CharField(max_length=256, blank=True)
+
+    compressed = models.BooleanField(default=False)
+    request = models.BinaryField()
+    response = models.BinaryField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    @staticmethod
+    def _pack(value, compress):
+        value = json.dumps(value, cls=DjangoJSONEncoder).encode("utf-8")
+
+        return zlib.compress(value) if compress else value
+
+    def _unpack(self, value):
+        value = bytes(value)
+        if not value:
+            return None
+
+        return json.loads(zlib.decompress(value) if self.compressed else value)
+
+    def set_request(self, request):
+        self.request = self._pack(request, self.compressed)
+
+    def get_request(self):
+        return self._unpack(self.request)
+
+    def set_response(self, response):
+        self.response = self._pack(response, self.compressed)
+
+    def get_response(self):
+        return self._unpack(self.response)
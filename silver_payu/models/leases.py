@@ -0,0 +1,40 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.db import models
+
+
+class PayUChargeWorker(models.Model):
+    """
+    A node charging PayU transactions, alive for as long as it keeps beating.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    heartbeat_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ["name"]
+
+
+class PayUChargeLease(models.Model):
+    """
+    A worker's exclusive, expiring right to charge the transactions of a
+    shard, i.e. those whose pk modulo SILVER_PAYU_CHARGE_SHARDS is `shard`.
+    """
+
+    shard = models.PositiveIntegerField(unique=True)
+    owner = models.CharField(max_length=255, blank=True, db_index=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["shard"]
@@ -0,0 +1,30 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.db import models
+
+
+class PayUPaymentMethodLock(models.Model):
+    """
+    Held while a payment method is being charged, so its transactions are
+    charged one at a time. Expired locks (e.g. their worker died) are taken over.
+    """
+
+    payment_method = models.OneToOneField(
+        "silver.PaymentMethod",
+        primary_key=True,
+        related_name="payu_lock",
+        on_delete=models.CASCADE,
+    )
+    token = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
@@ -0,0 +1,68 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.db import models
+
+
+class PayUNotification(models.Model):
+    """
+    A PayU IPN which has been acknowledged, but whose effects on transactions
+    and payment methods are yet to be applied by a background worker.
+    """
+
+    class Kinds:
+        Payment = "payment"
+        Token = "token"
+
+        @classmethod
+        def as_choices(cls):
+            return ((cls.Payment, "Payment"), (cls.Token, "Token"))
+
+    class States:
+        Queued = "queued"
+        Processing = "processing"
+        Done = "done"
+        Failed = "failed"
+
+        @classmethod
+        def as_choices(cls):
+            return (
+                (cls.Queued, "Queued"),
+                (cls.Processing, "Processing"),
+                (cls.Done, "Done"),
+                (cls.Failed, "Failed"),
+            )
+
+    kind = models.CharField(choices=Kinds.as_choices(), max_length=8)
+    state = models.CharField(
+        choices=States.as_choices(),
+        default=States.Queued,
+        max_length=10,
+        db_index=True,
+    )
+
+    ipn = models.ForeignKey("payu.PayUIPN", on_delete=models.CASCADE)
+    token = models.ForeignKey(
+        "payu.PayUToken", null=True, blank=True, on_delete=models.CASCADE
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # failed notifications are queued again, but not claimed before then
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["id"]
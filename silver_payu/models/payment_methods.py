@@ -17,35 +17,140 @@ from django_fsm import transition
 
 from silver.models import PaymentMethod
 
+# the delivery details charges are sent with, copied from the billing ones
+DELIVERY_FIELDS = {
+    "DELIVERY_ADDRESS": "BILL_ADDRESS",
+    "DELIVERY_CITY": "BILL_CITY",
+    "DELIVERY_EMAIL": "BILL_EMAIL",
+    "DELIVERY_FNAME": "BILL_FNAME",
+    "DELIVERY_LNAME": "BILL_LNAME",
+    "DELIVERY_PHONE": "BILL_PHONE",
+}
+
+# the payment method ALU charges are made with
+ALU_PAY_METHOD = "CCVISAMC"
+
 
 class PayUPaymentMethod(PaymentMethod):
     class Meta:
         proxy = True
 
+    def refresh_from_db(self, *args, **kwargs):
+        self._clear_decrypted_data()
+
+        super(PayUPaymentMethod, self).refresh_from_db(*args, **kwargs)
+
+    def _clear_decrypted_data(self):
+        self.__dict__.pop("_decrypted_data", None)
+
+    def _get_decrypted_data(self, field, is_json=False):
+        """
+        Decrypts (and parses) a data field, at most once for each encrypted value.
+        """
+
+        raw_value = self.data.get(field, "")
+
+        cache = self.__dict__.setdefault("_decrypted_data", {})
+        if field not in cache or cache[field][0] != raw_value:
+            value = self.decrypt_data(raw_value)
+            if is_json:
+                value = json.loads(value or "{}")
+
+            cache[field] = (raw_value, value)
+
+        value = cache[field][1]
+
+        # callers are free to alter the dicts they get
+        return dict(value) if is_json else value
+
+    def _set_encrypted_data(self, field, value, is_json=False):
+        raw_value = self.encrypt_data(json.dumps(value) if is_json else value)
+        self.data[field] = raw_value
+
+        cache = self.__dict__.setdefault("_decrypted_data", {})
+        cache[field] = (raw_value, dict(value) if is_json else value)
+
     @property
     def token(self):
-        return self.decrypt_data(self.data.get("token"))
+        return self._get_decrypted_data("token")
 
     @token.setter
     def token(self, value):
-        self.data["token"] = self.encrypt_data(value)
+        self._set_encrypted_data("token", value)
 
     @property
     def archived_customer(self):
-        raw_customer = self.data.get("archived_customer", "")
-        return json.loads(self.decrypt_data(raw_customer) or "{}")
+        return self._get_decrypted_data("archived_customer", is_json=True)
 
     @archived_customer.setter
     def archived_customer(self, value):
-        raw_customer = json.dumps(value)
-        self.data["archived_customer"] = self.encrypt_data(raw_customer)
+        self._set_encrypted_data("archived_customer", value, is_json=True)
 
     @property
     def threeds_data(self):
-        raw_data = self.data.get("3ds_data", "")
-        return json.loads(self.decrypt_data(raw_data) or "{}")
+        return self._get_decrypted_data("3ds_data", is_json=True)
 
     @threeds_data.setter
     def threeds_data(self, value):
-        raw_data = json.dumps(value)
-        self.data["3ds_data"] = self.encrypt_data(raw_data)
+        self._set_encrypted_data("3ds_data", value, is_json=True)
+
+    def _get_template(self, name, fields, build):
+        """
+        Builds a dict out of some data fields, at most once for each set of
+        encrypted values.
+        """
+
+        raw_values = tuple(self.data.get(field, "") for field in fields)
+
+        cache = self.__dict__.setdefault("_decrypted_data", {})
+        if name not in cache or cache[name][0] != raw_values:
+            cache[name] = (raw_values, build())
+
+        # callers are free to alter the dicts they get
+        return dict(cache[name][1])
+
+    @property
+    def charge_details(self):
+        """
+        The part of the charge payloads shared by all the payment method's
+        charges: the billing details, and the delivery details copied from
+        them. It's built once for each `archived_customer` value.
+
+        :raises KeyError: If billing details are missing.
+        """
+
+        def build():
+            details = self.archived_customer
+            details.update(
+                (field, details[billing_field])
+                for field, billing_field in DELIVERY_FIELDS.items()
+            )
+
+            return details
+
+        return self._get_template("charge_details", ("archived_customer",), build)
+
+    @property
+    def alu_charge_details(self):
+        """
+        The `charge_details` of ALU charges, along with their payment method
+        and 3DS data. It's built once for each `archived_customer` and 3DS
+        data value.
+
+        :raises KeyError: If billing details are missing.
+        """
+
+        def build():
+            details = self.charge_details
+            details["PAY_METHOD"] = ALU_PAY_METHOD
+
+            threeds_data = self.threeds_data
+            if threeds_data:
+                details["STRONG_CUSTOMER_AUTHENTICATION"] = "YES"
+                details.update(threeds_data)
+
+            return details
+
+        return self._get_template(
+            "alu_charge_details", ("archived_customer", "3ds_data"), build
+        )
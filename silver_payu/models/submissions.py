@@ -0,0 +1,53 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.db import models
+
+
+class PayUSubmission(models.Model):
+    """
+    The last ALU submission of a transaction, keyed on its ORDER_REF, written
+    before and after calling PayU. A submission whose outcome didn't make it
+    into the transaction (e.g. its worker crashed) is resolved from here, or
+    through PayU's order status lookup, instead of charging again.
+    """
+
+    class States:
+        # sent to PayU, with an unknown outcome
+        Submitting = "submitting"
+        # PayU's response has been stored
+        Submitted = "submitted"
+
+        @classmethod
+        def as_choices(cls):
+            return ((cls.Submitting, "Submitting"), (cls.Submitted, "Submitted"))
+
+    order_ref = models.CharField(max_length=64, unique=True)
+    transaction = models.ForeignKey(
+        "silver.Transaction",
+        related_name="payu_submissions",
+        on_delete=models.CASCADE,
+    )
+    # identifies the submission in the transaction's data, once applied
+    key = models.CharField(max_length=32)
+    state = models.CharField(choices=States.as_choices(), max_length=10)
+    status = models.CharField(max_length=32, blank=True)
+    response = models.TextField(blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def is_applied(self, transaction):
+        return transaction.data.get("payu_submission") == self.key
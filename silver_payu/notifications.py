@@ -0,0 +1,143 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as django_transaction
+from django.db.models import Q
+from django.utils import timezone
+from django_fsm import TransitionNotAllowed
+
+from silver_payu.models import PayUNotification
+from silver_payu.payment_processors import handle_payment_ipn, handle_token_ipn
+from silver_payu.utils import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+def claim_notifications(batch_size=None):
+    """
+    Marks up to `batch_size` queued notifications as being processed, skipping
+    the ones claimed by other workers in the meantime.
+
+    Notifications stuck in processing for more than
+    SILVER_PAYU_IPN_PROCESSING_TIMEOUT seconds (e.g. their worker died) are
+    claimed again. Failed notifications aren't claimed before their next
+    attempt is due.
+    """
+
+    if not batch_size:
+        batch_size = getattr(settings, "SILVER_PAYU_IPN_BATCH_SIZE", 100)
+
+    processing_timeout = getattr(settings, "SILVER_PAYU_IPN_PROCESSING_TIMEOUT", 300)
+    now = timezone.now()
+
+    queued = Q(state=PayUNotification.States.Queued) & (
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    )
+    abandoned = Q(
+        state=PayUNotification.States.Processing,
+        updated_at__lt=now - timedelta(seconds=processing_timeout),
+    )
+
+    with django_transaction.atomic():
+        notifications = list(
+            PayUNotification.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(queued | abandoned)
+            .select_related("ipn", "token")[:batch_size]
+        )
+
+        PayUNotification.objects.filter(
+            pk__in=[notification.pk for notification in notifications]
+        ).update(state=PayUNotification.States.Processing, updated_at=now)
+
+    return notifications
+
+
+def get_notification_delay(attempts, rng=random):
+    """
+    :param attempts: The number of attempts so far.
+    :return: The seconds to wait before applying a failed notification again,
+             somewhere between half and all of the exponential backoff.
+    """
+
+    base_delay = getattr(settings, "SILVER_PAYU_IPN_RETRY_DELAY", 30)
+    max_delay = getattr(settings, "SILVER_PAYU_IPN_RETRY_MAX_DELAY", 60 * 60)
+
+    delay = min(base_delay * 2 ** (attempts - 1), max_delay)
+
+    return rng.uniform(delay / 2, delay)
+
+
+def apply_notification(notification):
+    """
+    Failed notifications are queued again with exponential backoff, up to
+    SILVER_PAYU_IPN_MAX_ATTEMPTS attempts.
+
+    :return: True on success, False on failure.
+    """
+
+    notification.attempts += 1
+
+    try:
+        if notification.kind == PayUNotification.Kinds.Payment:
+            handle_payment_ipn(notification.ipn)
+        else:
+            handle_token_ipn(notification.token)
+    except Exception as error:
+        logger.exception(
+            "Couldn't apply PayU notification with pk %s.", notification.pk
+        )
+
+        max_attempts = getattr(settings, "SILVER_PAYU_IPN_MAX_ATTEMPTS", 5)
+        exhausted = notification.attempts >= max_attempts
+        if isinstance(error, TransitionNotAllowed) or exhausted:
+            notification.state = PayUNotification.States.Failed
+            notification.next_attempt_at = None
+        else:
+            delay = get_notification_delay(notification.attempts)
+            notification.state = PayUNotification.States.Queued
+            notification.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+        notification.error = str(error)
+        notification.save(
+            update_fields=[
+                "state",
+                "attempts",
+                "error",
+                "next_attempt_at",
+                "updated_at",
+            ]
+        )
+
+        return False
+
+    notification.state = PayUNotification.States.Done
+    notification.save(update_fields=["state", "attempts", "updated_at"])
+
+    return True
+
+
+def process_notifications(max_workers=None, batch_size=None):
+    """
+    Applies a batch of queued notifications, using a bounded pool of workers.
+
+    :return: A list of (notification, result) tuples.
+    """
+
+    return run_concurrently(
+        apply_notification, claim_notifications(batch_size), max_workers
+    )
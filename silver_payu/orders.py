@@ -0,0 +1,130 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Itemized ORDERs, with a product line for each entry of the transaction's
+document (SILVER_PAYU_ORDER_LINES). Transactions which can't be itemized
+exactly, e.g. partial payments, converted amounts or negative entries, keep
+their single line for the whole amount.
+"""
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from silver.models import DocumentEntry
+
+# PayU's maximum PNAME length
+MAX_PRODUCT_NAME_LENGTH = 155
+
+CENT = Decimal("0.01")
+
+
+def is_enabled():
+    return getattr(settings, "SILVER_PAYU_ORDER_LINES", False)
+
+
+def prefetch_entries(documents):
+    """
+    Loads the entries (and their product codes) of many documents at once,
+    a query for all the invoices and one for all the proformas. Documents
+    whose entries are already loaded are skipped.
+    """
+
+    for kind in ["invoice", "proforma"]:
+        prefetch_related_objects(
+            [document for document in documents if document.kind == kind],
+            Prefetch(
+                f"{kind}_entries",
+                queryset=DocumentEntry.objects.select_related("product_code"),
+            ),
+        )
+
+
+def prefetch_order_lines(transactions):
+    """
+    Loads the entries needed for itemizing a batch of transactions, if
+    itemized orders are enabled, see `prefetch_entries`.
+    """
+
+    if is_enabled():
+        prefetch_entries(
+            [
+                transaction.document
+                for transaction in transactions
+                if transaction.document
+            ]
+        )
+
+
+def _get_order_line(entry, document, vat):
+    total = entry.total_before_tax
+    if vat:
+        total += (total * vat / 100).quantize(CENT)
+
+    quantity = entry.quantity
+    price = total / quantity if quantity else total
+    if quantity != quantity.to_integral_value() or price != price.quantize(CENT):
+        # the line total can't be split evenly
+        price, quantity = total, 1
+
+    return {
+        "PNAME": entry.description[:MAX_PRODUCT_NAME_LENGTH],
+        "PCODE": (
+            entry.product_code.value
+            if entry.product_code
+            else f"{document.series_number}-{entry.pk}"
+        ),
+        "PRICE": str(price.quantize(CENT)),
+        "VAT": str(vat),
+        "PRICE_TYPE": "GROSS",
+        "QTY": str(int(quantity)),
+    }
+
+
+def get_order_lines(transaction):
+    """
+    :return: A list of ORDER lines, one for each (non free) entry of the
+             transaction's document, or None if itemized orders are disabled
+             or the transaction can't be itemized, in which case a single
+             line should be used instead.
+    """
+
+    if not is_enabled():
+        return None
+
+    document = transaction.document
+    if not document or document.currency != transaction.currency:
+        return None
+
+    vat = document.sales_tax_percent or 0
+    if vat != int(vat):
+        return None
+    vat = int(vat)
+
+    prefetch_entries([document])
+
+    order_lines = []
+    for entry in document.entries:
+        order_line = _get_order_line(entry, document, vat)
+        if Decimal(order_line["PRICE"]) < 0:
+            return None
+
+        if Decimal(order_line["PRICE"]):
+            order_lines.append(order_line)
+
+    order_total = sum(Decimal(line["PRICE"]) * int(line["QTY"]) for line in order_lines)
+    if not order_lines or order_total != transaction.amount:
+        return None
+
+    return order_lines
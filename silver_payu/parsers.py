@@ -0,0 +1,161 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from xml.parsers import expat
+
+
+class ALUResponse(object):
+    """
+    The parts of an ALU v3 response the processor needs.
+    """
+
+    __slots__ = ("content", "status", "return_code", "return_message", "refno", "_text")
+
+    def __init__(
+        self, content, status=None, return_code=None, return_message=None, refno=None
+    ):
+        self.content = content
+        self.status = status
+        self.return_code = return_code
+        self.return_message = return_message
+        self.refno = refno
+        self._text = None
+
+    @property
+    def text(self):
+        """
+        The decoded response, for logging.
+        """
+
+        if self._text is None:
+            content = self.content
+            self._text = (
+                content.decode("utf-8") if isinstance(content, bytes) else str(content)
+            )
+
+        return self._text
+
+
+class _ALUResponseParser(object):
+    api = "ALU"
+    # tag: ALUResponse attribute, only EPAYMENT's direct children are read
+    fields = {
+        "STATUS": "status",
+        "RETURN_CODE": "return_code",
+        "RETURN_MESSAGE": "return_message",
+        "REFNO": "refno",
+    }
+
+    def __init__(self):
+        self.values = {}
+        self._depth = 0
+        self._field = None
+        self._chunks = []
+
+        # handlers are only set while they are needed, since every call into
+        # Python costs more than parsing the element itself
+        self._parser = expat.ParserCreate()
+        self._parser.StartElementHandler = self.start
+        self._parser.EndElementHandler = self.end
+
+    def start(self, tag, attributes):
+        self._depth += 1
+
+        if self._depth == 2 and tag in self.fields:
+            self._field = self.fields[tag]
+            self._parser.CharacterDataHandler = self._chunks.append
+
+    def end(self, tag):
+        if self._field and self._depth == 2:
+            self.values[self._field] = "".join(self._chunks)
+            self._field = None
+            self._chunks.clear()
+            self._parser.CharacterDataHandler = None
+
+            if len(self.values) == len(self.fields):
+                # the rest of the response is only checked for being well formed
+                self._parser.StartElementHandler = None
+                self._parser.EndElementHandler = None
+
+        self._depth -= 1
+
+    def parse(self, content):
+        try:
+            self._parser.Parse(content, True)
+        except expat.ExpatError as error:
+            raise ValueError(f"Malformed {self.api} response: {error}")
+
+        return self.values
+
+
+def parse_alu_response(content):
+    """
+    Reads the STATUS, RETURN_CODE, RETURN_MESSAGE and REFNO of an ALU v3
+    response in a single pass, without building an element tree.
+
+    :raises ValueError: If the response is malformed, or misses STATUS or
+                        RETURN_CODE.
+    """
+
+    values = _ALUResponseParser().parse(content)
+
+    for field in ["status", "return_code"]:
+        if field not in values:
+            raise ValueError(f"Missing {field.upper()} in ALU response.")
+
+    return ALUResponse(content, **values)
+
+
+class _OrderStatusParser(_ALUResponseParser):
+    api = "IOS"
+    fields = {"ORDER_STATUS": "status", "REFNO": "refno"}
+
+
+def parse_order_status(content):
+    """
+    Reads an IOS (Instant Order Status) response.
+
+    :return: An (ORDER_STATUS, REFNO) tuple, REFNO being None for unknown orders.
+    :raises ValueError: If the response is malformed, or misses ORDER_STATUS.
+    """
+
+    values = _OrderStatusParser().parse(content)
+    if "status" not in values:
+        raise ValueError("Missing ORDER_STATUS in IOS response.")
+
+    return values["status"], values.get("refno")
+
+
+def parse_irn_response(content):
+    """
+    Reads an IRN (Instant Refund Notification) response, whose EPAYMENT holds
+    ORDER_REF|RESPONSE_CODE|RESPONSE_MSG|IRN_DATE|ORDER_HASH.
+
+    :return: A (RESPONSE_CODE, RESPONSE_MSG) tuple.
+    :raises ValueError: If the response is malformed.
+    """
+
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", "replace")
+
+    start = content.find("<EPAYMENT>")
+    end = content.find("</EPAYMENT>", start)
+    if start < 0 or end < 0:
+        raise ValueError(f"Malformed IRN response: {content[:100]}")
+
+    start += len("<EPAYMENT>")
+    values = content[start:end].split("|")
+    if len(values) < 3:
+        raise ValueError(f"Malformed IRN response: {content[:100]}")
+
+    return values[1], values[2]
@@ -11,14 +11,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import json
-from xml.etree import ElementTree
+import logging
+import uuid
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.db import transaction as django_transaction
+from django.db.models import QuerySet
 from django.dispatch import receiver
-from django_fsm import TransitionNotAllowed
-from payu.payments import ALUPayment, TokenPayment
+from django_fsm import TransitionNotAllowed, can_proceed
 from payu.signals import payment_authorized, alu_token_created, payment_completed
 from silver.models import Transaction
 from silver.payment_processors import PaymentProcessorBase
@@ -27,16 +30,54 @@ from silver.payment_processors.mixins import (
     ManualProcessorMixin,
 )
 
-from silver_payu.errors import TOKEN_ERROR_CODES, ALU_ERROR_CODES
+from silver_payu.deduplication import get_ipn_key, is_duplicate, mark_as_seen
+from silver_payu.errors import (
+    TOKEN_ERROR_CODES,
+    ALU_ERROR_CODES,
+    IRN_ERROR_CODES,
+    ErrorKinds,
+    get_error_kind,
+)
+from silver_payu.expiry import (
+    EXPIRED_CARD_FAIL_CODE,
+    EXPIRED_CARD_FAIL_REASON,
+    is_expired,
+    mark_expired_card,
+)
 from silver_payu.forms import (
     PayUTransactionFormManual,
     PayUTransactionFormTriggered,
     PayUBillingForm,
     PayUTransactionFormTriggeredV2,
 )
-from silver_payu.models import PayUPaymentMethod
+from silver_payu.http import CircuitOpenError
+from silver_payu.instrumentation import Span, timed
+from silver_payu.locks import apayment_method_lock, payment_method_lock
+from silver_payu.models import (
+    PayUChargeLog,
+    PayUNotification,
+    PayUPaymentMethod,
+    PayUSubmission,
+)
+from silver_payu.orders import get_order_lines, prefetch_order_lines
+from silver_payu.parsers import parse_alu_response
+from silver_payu.payments import (
+    ALUPayment,
+    OrderStatusQuery,
+    RefundRequest,
+    TokenPayment,
+)
+from silver_payu.retries import clear_retry, schedule_retry
+from silver_payu.utils import run_concurrently
+from silver_payu.validation import validate_alu_payment, validate_token_payment
 from silver_payu.views import PayUTransactionView
 
+logger = logging.getLogger(__name__)
+
+
+def _get_outcome(result):
+    return "success" if result else "failed"
+
 
 class PayUBase(PaymentProcessorBase):
     payment_method_class = PayUPaymentMethod
@@ -74,42 +115,159 @@ class PayUBase(PaymentProcessorBase):
         return form
 
     def refund_transaction(self, transaction, payment_method=None):
-        pass
+        """
+        Refunds a Settled transaction in full, through PayU's IRN API. PayU
+        refunds the card the order was paid with, so `payment_method` is
+        ignored.
+
+        :return: True on success, False on failure.
+        """
+
+        return self._send_irn(transaction, Transaction.States.Settled)
 
     def void_transaction(self, transaction, payment_method=None):
-        pass
+        """
+        Cancels a Pending transaction, along with its order's authorization,
+        if PayU got it.
 
-    def handle_transaction_response(self, transaction, request):
-        with django_transaction.atomic():
-            Transaction.objects.select_for_update().filter(pk=transaction.pk).get()
+        :return: True on success, False on failure.
+        """
+
+        return self._send_irn(transaction, Transaction.States.Pending)
+
+    def refund_transactions(self, transactions, max_workers=None):
+        """
+        Refunds many transactions at once, keeping at most `max_workers`
+        (SILVER_PAYU_MAX_WORKERS) PayU requests in flight.
+
+        :return: A list of (transaction, result) tuples, in the given order.
+                 The outcome of each refund is kept in `transaction.data["irn"]`.
+        """
+
+        return run_concurrently(self.refund_transaction, transactions, max_workers)
+
+    def _send_irn(self, transaction, source):
+        """
+        Sends an IRN for a transaction in `source` state, and refunds (Settled)
+        or cancels (Pending) it accordingly. The payment method is locked
+        meanwhile, so the transaction isn't charged or refunded concurrently.
+        """
+
+        if transaction.state != source:
+            return False
+
+        with payment_method_lock(transaction.payment_method) as locked:
+            if not locked:
+                return False
+
+            # it might have been refunded or charged before taking the lock
             transaction.refresh_from_db()
+            if transaction.state != source:
+                return False
 
             try:
-                if request.GET.get("ctrl", None):
-                    transaction.data["ctrl"] = request.GET["ctrl"]
-                    transaction.process()
+                refno = self._get_refno(transaction)
+                if refno:
+                    code, message = RefundRequest(
+                        refno, transaction.amount, transaction.currency
+                    ).send()
+                    message = message or IRN_ERROR_CODES.get(code, "")
+                    result = code in RefundRequest.SuccessCodes
                 else:
-                    error = request.GET.get("err", None) or "Unknown error"
-                    transaction.fail(fail_reason=error)
-            except TransitionNotAllowed:
-                pass
+                    # nothing was paid, so only Pending transactions can go
+                    code, message = "", "PayU never got the order."
+                    result = source == Transaction.States.Pending
+            except Exception as error:
+                logger.warning("Couldn't refund PayU order %s: %s", transaction, error)
+                code, message, result = "", str(error), False
+
+            transaction.data["irn"] = {"code": code, "message": message}
+            if result and source == Transaction.States.Settled:
+                transaction.refund(refund_reason=message)
+            elif result:
+                transaction.cancel(cancel_reason=message)
 
             transaction.save()
 
+        return result
+
+    def _get_refno(self, transaction):
+        """
+        :return: PayU's reference of the transaction's order, looking it up
+                 if needed, or None if PayU never got the order.
+        """
+
+        if transaction.external_reference:
+            return transaction.external_reference
+
+        status, refno = OrderStatusQuery(str(transaction.uuid)).query()
+        if status == OrderStatusQuery.NotFound:
+            return None
+
+        transaction.external_reference = refno
+        return refno
+
+    # the fields written when handling a customer's return from PayU
+    response_fields = ("state", "data", "fail_code", "updated_at")
+
+    def handle_transaction_response(self, transaction, request):
+        """
+        Handles the customer's return from PayU's payment page, processing the
+        transaction if PayU sent a `ctrl` hash, or failing it otherwise.
+
+        Transactions which already moved on, e.g. after an IPN, are left alone.
+        """
+
+        with Span("transaction_response") as response_span:
+            outcome = self._handle_transaction_response(transaction, request)
+            response_span.set(outcome=outcome)
+
+    def _handle_transaction_response(self, transaction, request):
+        """
+        Neither transition touches the billing documents, so only the altered
+        fields are saved and the transaction isn't validated again, keeping
+        the row locked for as little as possible.
+
+        :return: "processed", "failed" or "ignored", the span's outcome.
+        """
+
+        ctrl = request.GET.get("ctrl", None)
+        transition = transaction.process if ctrl else transaction.fail
+
+        # states only move forward, so a stale state is enough to bail out
+        if not can_proceed(transition):
+            return "ignored"
+
+        with django_transaction.atomic():
+            transaction.state, transaction.data = (
+                Transaction.objects.select_for_update()
+                .filter(pk=transaction.pk)
+                .values_list("state", "data")
+                .get()
+            )
+            if not can_proceed(transition):
+                transaction.refresh_from_db()
+                return "ignored"
+
+            if ctrl:
+                transaction.data["ctrl"] = ctrl
+                transaction.process()
+            else:
+                error = request.GET.get("err", None) or "Unknown error"
+                transaction.fail(fail_reason=error)
+
+            transaction.is_cleaned = True
+            transaction.save(update_fields=self.response_fields)
+
+        return "processed" if ctrl else "failed"
+
 
 class PayUManual(PayUBase, ManualProcessorMixin):
     template_slug = "payu_manual"
     form_class = PayUTransactionFormManual
 
 
-class PayUTriggered(PayUBase, TriggeredProcessorMixin):
-    """
-    Uses TokenV1 API for recurrent payments.
-    """
-
-    template_slug = "payu_triggered"
-    form_class = PayUTransactionFormTriggered
-
+class PayUTriggeredBase(PayUBase, TriggeredProcessorMixin):
     def execute_transaction(self, transaction):
         """
         :param transaction: A PayU transaction in Initial or Pending state.
@@ -119,24 +277,237 @@ class PayUTriggered(PayUBase, TriggeredProcessorMixin):
         if transaction.state != Transaction.States.Pending:
             return False
 
-        return self._charge_transaction(transaction)
+        with Span("charge", processor=self.name) as charge_span:
+            if is_expired(transaction.payment_method):
+                result = self._fail_expired_transaction(transaction)
+                charge_span.set(**self._get_charge_labels(transaction, result))
+                return result
+
+            with payment_method_lock(transaction.payment_method) as locked:
+                if locked:
+                    result = self._charge_transaction(transaction)
+                else:
+                    result = self._defer_transaction(transaction)
+
+            charge_span.set(**self._get_charge_labels(transaction, result))
+
+        return result
+
+    def _get_charge_labels(self, transaction, result):
+        if result:
+            return {"outcome": "success"}
+
+        retry = transaction.data.get("retry")
+        if transaction.state == Transaction.States.Pending and retry:
+            return {"outcome": "retry", "code": retry["error_code"]}
+
+        if transaction.state == Transaction.States.Pending:
+            return {
+                "outcome": "unknown",
+                "code": transaction.data.get("outcome_unknown", ""),
+            }
+
+        return {"outcome": "failed", "code": transaction.fail_code or ""}
+
+    # the fields altered while charging, none of which is validated by
+    # Transaction.clean
+    charge_fields = ("state", "data", "fail_code", "external_reference", "updated_at")
+
+    def execute_transactions(self, transactions, max_workers=None):
+        """
+        Charges many transactions at once, keeping at most `max_workers` PayU
+        requests in flight.
+
+        :param transactions: An iterable of PayU transactions in Pending state.
+                             Querysets are loaded through `get_charge_batch`.
+        :param max_workers: Defaults to the SILVER_PAYU_MAX_WORKERS setting.
+        :return: A list of (transaction, result) tuples, in the given order,
+                 where result is True on success, False on failure.
+        """
+
+        if isinstance(transactions, QuerySet):
+            transactions = self.get_charge_batch(transactions)
+
+        return run_concurrently(self.execute_transaction, transactions, max_workers)
+
+    def process_transactions(self, transactions, max_workers=None):
+        """
+        The bulk counterpart of `process_transaction`, see `execute_transactions`.
+        """
+
+        if isinstance(transactions, QuerySet):
+            transactions = self.get_charge_batch(transactions)
+
+        return run_concurrently(self.process_transaction, transactions, max_workers)
+
+    @classmethod
+    def get_charge_batch(cls, transactions):
+        """
+        Loads the transactions along with everything needed to charge them
+        (payment method, documents and their provider) in a single query.
+
+        Transactions sharing a payment method also share its instance, so its
+        data is decrypted only once for the whole batch.
+
+        With itemized orders enabled, the documents' entries are loaded as
+        well, in two more queries, see `prefetch_order_lines`.
+
+        :param transactions: A Transaction queryset or a list of pks.
+        :return: A list of transactions.
+        """
+
+        if not isinstance(transactions, QuerySet):
+            transactions = Transaction.objects.filter(pk__in=list(transactions))
+
+        transactions = list(
+            transactions.select_related(
+                "payment_method",
+                "payment_method__customer",
+                "invoice",
+                "invoice__provider",
+                "proforma",
+                "proforma__provider",
+            )
+        )
+
+        payment_methods = {}
+        for transaction in transactions:
+            payment_method = payment_methods.setdefault(
+                transaction.payment_method_id, transaction.payment_method
+            )
+            transaction.payment_method = payment_method
+
+        prefetch_order_lines(transactions)
+
+        return transactions
+
+    def _save_transaction(self, transaction):
+        """
+        Saves only the fields altered while charging. As long as no other field
+        has been altered, the transaction isn't validated again, which would
+        query its documents, payment method and customer once more.
+        """
+
+        unsaved_fields = set(transaction.get_unsaved_fields())
+        if not unsaved_fields.issubset(self.charge_fields):
+            transaction.save()
+            return
+
+        transaction.is_cleaned = True
+        transaction.save(update_fields=self.charge_fields)
+
+    def _fail_transaction(self, transaction, payu_code, fail_code, fail_reason):
+        """
+        Fails the transaction, unless PayU's error is worth retrying, in which
+        case the transaction is kept Pending and charged again later, or PayU
+        doesn't know the outcome yet (e.g. 607), in which case it's kept
+        Pending until reconciled.
+        """
+
+        if get_error_kind(payu_code) == ErrorKinds.Unknown:
+            self._keep_outcome_unknown(transaction, payu_code)
+            return
+
+        if not schedule_retry(transaction, payu_code, fail_reason):
+            transaction.fail(fail_code=fail_code, fail_reason=fail_reason)
+
+    def _keep_outcome_unknown(self, transaction, code):
+        """
+        Keeps the transaction Pending, neither failed nor charged again, since
+        PayU might have charged it or might still do so, until its order is
+        looked up, see reconciliation. The transaction must be saved afterwards.
+        """
+
+        # reconciliation skips the transactions with a retry scheduled
+        clear_retry(transaction)
+        transaction.data["outcome_unknown"] = str(code)
+
+    def _postpone_transaction(self, transaction, error):
+        """
+        Keeps the transaction Pending, to be charged again after the circuit
+        lets requests through, see CircuitBreaker. The charge wasn't attempted,
+        so the postponement doesn't use up any of its retries.
+
+        :param error: The CircuitOpenError raised instead of the request.
+        """
+
+        schedule_retry(
+            transaction,
+            "circuit_open",
+            str(error),
+            kind=ErrorKinds.Transient,
+            delay=error.retry_after,
+        )
+        self._save_transaction(transaction)
+
+    def _defer_transaction(self, transaction):
+        """
+        Keeps the transaction Pending, to be charged once the charge in flight
+        on its payment method is done, see `payment_method_lock`.
+
+        :return: False
+        """
+
+        schedule_retry(
+            transaction,
+            "payment_method_busy",
+            "Another charge on the payment method is in progress.",
+            kind=ErrorKinds.Contention,
+        )
+        self._save_transaction(transaction)
+
+        return False
+
+    def _fail_expired_transaction(self, transaction):
+        """
+        Fails a charge on an expired card without calling PayU, see expiry.
+
+        :return: False
+        """
+
+        mark_expired_card(transaction.data, transaction.payment_method.valid_until)
+        transaction.fail(
+            fail_code=EXPIRED_CARD_FAIL_CODE, fail_reason=EXPIRED_CARD_FAIL_REASON
+        )
+        self._save_transaction(transaction)
+
+        return False
+
+    def _fail_invalid_payment(self, transaction, error):
+        """
+        Fails a charge PayU would reject, without sending it, see validation.
+
+        :param error: A (PayU error code, silver fail code, reason) tuple.
+        :return: False
+        """
+
+        payu_code, fail_code, fail_reason = error
+        transaction.data["validation_error"] = payu_code
+        transaction.fail(fail_code=fail_code, fail_reason=fail_reason)
+        self._save_transaction(transaction)
+
+        return False
+
+    def _charge_transaction(self, transaction):
+        raise NotImplementedError
+
+
+class PayUTriggered(PayUTriggeredBase):
+    """
+    Uses TokenV1 API for recurrent payments.
+    """
+
+    template_slug = "payu_triggered"
+    form_class = PayUTransactionFormTriggered
 
     def _charge_transaction(self, transaction):
         token = transaction.payment_method.token
 
-        billing_details = transaction.payment_method.archived_customer
         try:
-            delivery_details = {
-                "DELIVERY_ADDRESS": billing_details["BILL_ADDRESS"],
-                "DELIVERY_CITY": billing_details["BILL_CITY"],
-                "DELIVERY_EMAIL": billing_details["BILL_EMAIL"],
-                "DELIVERY_FNAME": billing_details["BILL_FNAME"],
-                "DELIVERY_LNAME": billing_details["BILL_LNAME"],
-                "DELIVERY_PHONE": billing_details["BILL_PHONE"],
-            }
+            customer_details = transaction.payment_method.charge_details
         except KeyError as error:
             transaction.fail(fail_reason=f"Invalid customer details. [{error}]")
-            transaction.save()
+            self._save_transaction(transaction)
             return False
 
         payment_details = {
@@ -144,33 +515,49 @@ class PayUTriggered(PayUBase, TriggeredProcessorMixin):
             "CURRENCY": str(transaction.currency),
             "EXTERNAL_REF": str(transaction.uuid),
         }
-        payment_details.update(billing_details)
-        payment_details.update(delivery_details)
+        payment_details.update(customer_details)
+
+        error = validate_token_payment(payment_details)
+        if error:
+            return self._fail_invalid_payment(transaction, error)
 
         payment = TokenPayment(payment_details, token)
 
         try:
             result = payment.pay()
+        except CircuitOpenError as error:
+            self._postpone_transaction(transaction, error)
+            return False
         except Exception as error:
             transaction.fail(fail_reason=str(error))
-            transaction.save()
+            self._save_transaction(transaction)
             return False
 
         return self._parse_result(transaction, result)
 
+    @timed("parse_result", outcome=_get_outcome, api="token")
     def _parse_result(self, transaction, result):
         try:
             result = json.loads(result)
 
             if "code" in result and not int(result["code"]):
+                retried = clear_retry(transaction)
+                refno = result.get("tran_ref_no")
+                if refno and not transaction.external_reference:
+                    transaction.external_reference = str(refno)
+
+                if retried or refno:
+                    self._save_transaction(transaction)
+
                 return True
 
             error_code, error_reason = self._parse_response_error(result)
-            transaction.fail(fail_code=error_code, fail_reason=error_reason)
+            payu_code = result.get("code") if isinstance(result, dict) else None
+            self._fail_transaction(transaction, payu_code, error_code, error_reason)
         except ValueError as error:
             transaction.fail(fail_reason=str(error))
 
-        transaction.save()
+        self._save_transaction(transaction)
 
         return False
 
@@ -185,7 +572,7 @@ class PayUTriggered(PayUBase, TriggeredProcessorMixin):
         return "default", f'Unknown error code {payu_response["code"]}'
 
 
-class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
+class PayUTriggeredV2(PayUTriggeredBase):
     """
     Uses ALUPaymentV3 API for recurrent payments.
     """
@@ -193,42 +580,196 @@ class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
     template_slug = "payu_triggered"
     form_class = PayUTransactionFormTriggeredV2
 
-    def execute_transaction(self, transaction):
+    def _charge_transaction(self, transaction):
+        submission = self._get_submission(transaction)
+        if submission:
+            result = self._resume_submission(transaction, submission)
+            if result is not None:
+                return result
+
+        payment = self._build_payment(transaction)
+        if not payment:
+            return False
+
+        submission = self._begin_submission(transaction, submission)
+        try:
+            result = payment.pay()
+        except Exception as error:
+            return self._handle_payment_error(transaction, payment, error, submission)
+
+        return self._complete_submission(transaction, submission, result, payment)
+
+    def _get_submission(self, transaction):
         """
-        :param transaction: A PayU transaction in Initial or Pending state.
-        :return: True on success, False on failure.
+        :return: The transaction's last PayUSubmission, if any and if
+                 SILVER_PAYU_IDEMPOTENT_SUBMISSIONS is enabled.
         """
 
-        if transaction.state != Transaction.States.Pending:
+        if not getattr(settings, "SILVER_PAYU_IDEMPOTENT_SUBMISSIONS", False):
+            return None
+
+        return PayUSubmission.objects.filter(order_ref=str(transaction.uuid)).first()
+
+    def _begin_submission(self, transaction, submission=None):
+        """
+        Records that the transaction is about to be submitted to PayU.
+        """
+
+        if not getattr(settings, "SILVER_PAYU_IDEMPOTENT_SUBMISSIONS", False):
+            return None
+
+        fields = {
+            "key": uuid.uuid4().hex,
+            "state": PayUSubmission.States.Submitting,
+            "status": "",
+            "response": "",
+        }
+
+        if not submission:
+            return PayUSubmission.objects.create(
+                order_ref=str(transaction.uuid), transaction=transaction, **fields
+            )
+
+        for field, value in fields.items():
+            setattr(submission, field, value)
+        submission.save(update_fields=list(fields) + ["updated_at"])
+
+        return submission
+
+    def _complete_submission(self, transaction, submission, result, payment):
+        """
+        Stores PayU's response before applying it to the transaction, so the
+        transaction isn't charged again if applying it doesn't go through.
+        """
+
+        if submission:
+            submission.state = PayUSubmission.States.Submitted
+            submission.response = (
+                result.decode("utf-8") if isinstance(result, bytes) else str(result)
+            )
+            submission.save(update_fields=["state", "response", "updated_at"])
+
+            transaction.data["payu_submission"] = submission.key
+
+        return self._parse_result(transaction, result, payment)
+
+    def _resume_submission(self, transaction, submission):
+        """
+        Picks up after the transaction's last submission, which might have
+        been cut short.
+
+        :return: The charge's result, or None if the transaction can be
+                 submitted (again).
+        """
+
+        if submission.state == PayUSubmission.States.Submitting:
+            return self._resolve_submission(transaction, submission)
+
+        if not submission.is_applied(transaction):
+            transaction.data["payu_submission"] = submission.key
+            return self._parse_result(transaction, submission.response)
+
+        if submission.status:
+            status = submission.status
+        else:
+            try:
+                status = parse_alu_response(submission.response).status
+            except ValueError:
+                status = None
+
+        # charges which went through are never submitted again, while failed
+        # ones can be retried
+        return True if status == "SUCCESS" else None
+
+    def _resolve_submission(self, transaction, submission):
+        """
+        Looks up the order of a submission with an unknown outcome, e.g. whose
+        worker died or lost the connection while waiting for PayU's response.
+
+        :return: See `_resume_submission`.
+        """
+
+        try:
+            status, refno = OrderStatusQuery(submission.order_ref).query()
+        except Exception as error:
+            logger.warning(
+                "Couldn't look up PayU order %s: %s", submission.order_ref, error
+            )
+            self._keep_outcome_unknown(transaction, "order_status_unknown")
+            self._save_transaction(transaction)
             return False
 
-        return self._charge_transaction(transaction)
+        if status == OrderStatusQuery.NotFound:
+            return None
+
+        if status in OrderStatusQuery.PendingStatuses:
+            self._keep_outcome_unknown(transaction, "order_status_pending")
+            self._save_transaction(transaction)
+            return False
+
+        transaction.data.update({"payu_submission": submission.key, "status": status})
+        if status in OrderStatusQuery.PaidStatuses:
+            clear_retry(transaction)
+            if refno and not transaction.external_reference:
+                transaction.external_reference = refno
+            submission.status = "SUCCESS"
+        else:
+            transaction.fail(
+                fail_code=OrderStatusQuery.FailCodes.get(status, "default"),
+                fail_reason=f"PayU order is {status}.",
+            )
+            submission.status = "FAILED"
+
+        self._save_transaction(transaction)
+
+        submission.state = PayUSubmission.States.Submitted
+        submission.save(update_fields=["state", "status", "updated_at"])
+
+        return submission.status == "SUCCESS"
+
+    def _build_payment(self, transaction):
+        """
+        :return: The ALUPayment charging the transaction, or None if the
+                 transaction can't be charged (in which case it's failed).
+        """
 
-    def _charge_transaction(self, transaction):
         payment_method = transaction.payment_method
         token = payment_method.token
 
-        customer_details = payment_method.archived_customer
         try:
-            delivery_details = {
-                "DELIVERY_ADDRESS": customer_details["BILL_ADDRESS"],
-                "DELIVERY_CITY": customer_details["BILL_CITY"],
-                "DELIVERY_EMAIL": customer_details["BILL_EMAIL"],
-                "DELIVERY_FNAME": customer_details["BILL_FNAME"],
-                "DELIVERY_LNAME": customer_details["BILL_LNAME"],
-                "DELIVERY_PHONE": customer_details["BILL_PHONE"],
-            }
+            customer_details = payment_method.alu_charge_details
         except KeyError as error:
             transaction.fail(fail_reason=f"Invalid customer details. [{error}]")
-            transaction.save()
-            return False
+            self._save_transaction(transaction)
+            return None
 
         payment_details = {
             "PRICES_CURRENCY": str(transaction.currency),
             "ORDER_REF": str(transaction.uuid),
-            "PAY_METHOD": "CCVISAMC",
         }
 
+        order_details = get_order_lines(transaction)
+        if not order_details:
+            order_details = self._get_order_details(transaction)
+
+        payment_details.update(customer_details)
+        payment_details["ORDER"] = order_details
+
+        error = validate_alu_payment(payment_details)
+        if error:
+            self._fail_invalid_payment(transaction, error)
+            return None
+
+        # the 3DS data comes with the payment method's alu_charge_details
+        return ALUPayment(
+            payment_details, token, stored_credentials_use_type="merchant"
+        )
+
+    def _get_order_details(self, transaction):
+        """
+        :return: A single ORDER line, for the whole amount.
+        """
+
         if transaction.document:
             pname = "{provider} {doc_type} {doc_number}".format(
                 doc_type=transaction.document.kind,
@@ -244,7 +785,7 @@ class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
             vat = "0"
             price_type = "NET"  # (VAT will be added by PayU)
 
-        order_details = [
+        return [
             {
                 "PNAME": pname,
                 "PCODE": str(transaction.uuid),
@@ -255,34 +796,61 @@ class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
             }
         ]
 
-        payment_details.update(customer_details)
-        payment_details.update(delivery_details)
-        payment_details["ORDER"] = order_details
+    def _handle_payment_error(self, transaction, payment, error, submission=None):
+        """
+        :return: The charge's result.
+        """
 
-        payment = ALUPayment(
-            payment_details,
-            token,
-            stored_credentials_use_type="merchant",
-            threeds_data=payment_method.threeds_data,
-        )
+        if isinstance(error, CircuitOpenError):
+            # the request wasn't sent
+            if submission:
+                submission.delete()
 
-        try:
-            result = payment.pay()
-        except Exception as error:
-            transaction.fail(fail_reason=str(error))
-            self._log_request_response(transaction, payment)
+            self._postpone_transaction(transaction, error)
+            return False
 
-            transaction.save()
+        if submission:
+            # the request might have reached PayU anyway
+            result = self._resolve_submission(transaction, submission)
+            if result is not None:
+                return result
 
-            return False
+        transaction.fail(fail_reason=str(error))
+        self._log_request_response(transaction, payment)
 
-        return self._parse_result(transaction, result, payment)
+        self._save_transaction(transaction)
+
+        return False
+
+    def _log_request_response(self, transaction, payment, response=None):
+        """
+        :param response: The parsed ALUResponse, if any, to avoid decoding the
+                         raw response again.
+        """
 
-    def _log_request_response(self, transaction, payment):
         if not payment:
             return
 
-        request = getattr(payment, "_request", {})
+        request = self._redact_request(getattr(payment, "_request", {}))
+
+        if getattr(settings, "SILVER_PAYU_CHARGE_LOG", "transaction") == "table":
+            self._store_charge_log(transaction, request, payment, response)
+            return
+
+        transaction.data["_request"] = str(request)
+
+        if transaction.state == Transaction.States.Failed:
+            if response is None:
+                response = getattr(payment, "_response", "")
+                if isinstance(response, bytes):
+                    response = response.decode("utf-8")
+
+                transaction.data["_response"] = str(response)
+            else:
+                transaction.data["_response"] = response.text
+
+    def _redact_request(self, request):
+        request = dict(request)
         redacted_fields = ["CC_TOKEN", "CC_CVV"]
 
         if getattr(settings, "SILVER_PAYU_REDACT_PII", False):
@@ -300,46 +868,63 @@ class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
             if request.get(field):
                 request[field] = "[REDACTED]"
 
-        transaction.data["_request"] = str(request)
+        return request
 
-        if transaction.state == Transaction.States.Failed:
-            response = getattr(payment, "_response", "")
-            if isinstance(response, bytes):
-                response = response.decode("utf-8")
+    def _store_charge_log(self, transaction, request, payment, response=None):
+        charge_log = PayUChargeLog(
+            transaction=transaction,
+            compressed=getattr(settings, "SILVER_PAYU_CHARGE_LOG_COMPRESS", True),
+        )
+
+        if response is None:
+            content = getattr(payment, "_response", "")
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+        else:
+            content = response.text
 
-            transaction.data["_response"] = str(response)
+            charge_log.status = response.status
+            charge_log.return_code = response.return_code[:64]
+            charge_log.return_message = (response.return_message or "")[:256]
 
+        charge_log.set_request(request)
+        charge_log.set_response(content)
+        charge_log.save()
+
+    @timed("parse_result", outcome=_get_outcome, api="alu")
     def _parse_result(self, transaction, result, payment=None):
+        response = None
         try:
-            element = ElementTree.fromstring(result)
-            status = element.find("STATUS").text
-            return_code = element.find("RETURN_CODE").text
+            response = parse_alu_response(result)
+            return_code = response.return_code
 
-            if status == "SUCCESS":
-                self._log_request_response(transaction, payment)
-                transaction.save()
+            if response.status == "SUCCESS":
+                clear_retry(transaction)
+                if response.refno and not transaction.external_reference:
+                    transaction.external_reference = response.refno
+                self._log_request_response(transaction, payment, response)
+                self._save_transaction(transaction)
 
                 return True
 
             error_code, error_reason = self._parse_response_error(return_code)
             transaction.data.update(
                 {
-                    "status": status,
+                    "status": response.status,
                     "message": error_reason,
                     "return_code": return_code,
                 }
             )
 
-            return_message = element.find("RETURN_MESSAGE")
-            if return_message is not None:
-                transaction.data["return_message"] = return_message.text
+            if response.return_message is not None:
+                transaction.data["return_message"] = response.return_message
 
-            transaction.fail(fail_code=error_code, fail_reason=error_reason)
+            self._fail_transaction(transaction, return_code, error_code, error_reason)
         except ValueError as error:
             transaction.fail(fail_reason=str(error))
 
-        self._log_request_response(transaction, payment)
-        transaction.save()
+        self._log_request_response(transaction, payment, response)
+        self._save_transaction(transaction)
 
         return False
 
@@ -351,42 +936,192 @@ class PayUTriggeredV2(PayUBase, TriggeredProcessorMixin):
         return "default", f"Unknown error code {return_code}"
 
 
+class AsyncPayUTriggeredV2(PayUTriggeredV2):
+    """
+    PayUTriggeredV2, plus coroutines for charging transactions from asyncio
+    workers. PayU requests don't block the event loop, while the ORM work is
+    done in Django's sync thread.
+    """
+
+    async def aexecute_transaction(self, transaction):
+        """
+        The async counterpart of `execute_transaction`.
+        """
+
+        if transaction.state != Transaction.States.Pending:
+            return False
+
+        # not loaded yet unless the transaction comes from get_charge_batch, and
+        # lazy loading it would query the database from the event loop
+        payment_method = await sync_to_async(getattr)(transaction, "payment_method")
+
+        with Span("charge", processor=self.name) as charge_span:
+            if is_expired(payment_method):
+                result = await sync_to_async(self._fail_expired_transaction)(
+                    transaction
+                )
+                charge_span.set(**self._get_charge_labels(transaction, result))
+                return result
+
+            async with apayment_method_lock(payment_method) as locked:
+                if locked:
+                    result = await self._acharge_transaction(transaction)
+                else:
+                    result = await sync_to_async(self._defer_transaction)(transaction)
+
+            charge_span.set(**self._get_charge_labels(transaction, result))
+
+        return result
+
+    async def _acharge_transaction(self, transaction):
+        submission = await sync_to_async(self._get_submission)(transaction)
+        if submission:
+            result = await sync_to_async(self._resume_submission)(
+                transaction, submission
+            )
+            if result is not None:
+                return result
+
+        payment = await sync_to_async(self._build_payment)(transaction)
+        if not payment:
+            return False
+
+        submission = await sync_to_async(self._begin_submission)(
+            transaction, submission
+        )
+        try:
+            result = await payment.apay()
+        except Exception as error:
+            return await sync_to_async(self._handle_payment_error)(
+                transaction, payment, error, submission
+            )
+
+        return await sync_to_async(self._complete_submission)(
+            transaction, submission, result, payment
+        )
+
+    async def aexecute_transactions(self, transactions, max_concurrency=None):
+        """
+        The async counterpart of `execute_transactions`, keeping at most
+        `max_concurrency` (SILVER_PAYU_ASYNC_MAX_CONCURRENCY) PayU requests in
+        flight.
+        """
+
+        if isinstance(transactions, QuerySet):
+            transactions = await sync_to_async(self.get_charge_batch)(transactions)
+        transactions = list(transactions)
+
+        if max_concurrency is None:
+            max_concurrency = getattr(
+                settings, "SILVER_PAYU_ASYNC_MAX_CONCURRENCY", 100
+            )
+        semaphore = asyncio.Semaphore(max(int(max_concurrency), 1))
+
+        async def execute(transaction):
+            async with semaphore:
+                try:
+                    return await self.aexecute_transaction(transaction)
+                except Exception:
+                    logger.exception(
+                        "Encountered exception while handling %s.", transaction
+                    )
+                    return False
+
+        results = await asyncio.gather(*map(execute, transactions))
+
+        return list(zip(transactions, results))
+
+
+def _async_ipn_enabled():
+    return getattr(settings, "SILVER_PAYU_ASYNC_IPN", False)
+
+
 @receiver([payment_authorized, payment_completed])
+@timed("ipn", outcome=lambda outcome: outcome, kind=PayUNotification.Kinds.Payment)
 def payu_ipn_received(sender, **kwargs):
-    transaction = Transaction.objects.get(uuid=sender.REFNOEXT)
+    # PayU redelivers IPNs, so the already handled ones are skipped early
+    ipn_key = get_ipn_key(sender, sender.ORDERSTATUS)
+    if is_duplicate(ipn_key):
+        return "duplicate"
+
+    if _async_ipn_enabled():
+        PayUNotification.objects.create(
+            kind=PayUNotification.Kinds.Payment, ipn_id=sender.pk
+        )
+        outcome = "queued"
+    else:
+        handle_payment_ipn(sender)
+        outcome = "applied"
+
+    # the IPN is handled within the request's transaction, which may roll back
+    django_transaction.on_commit(lambda: mark_as_seen(ipn_key))
+
+    return outcome
+
+
+def handle_payment_ipn(ipn):
+    error = None
+
+    with django_transaction.atomic():
+        transaction = Transaction.objects.select_for_update().get(uuid=ipn.REFNOEXT)
 
-    try:
-        if transaction.state != Transaction.States.Settled:
-            transaction.settle()
-            transaction.save()
-    except TransitionNotAllowed as error:
         try:
-            transaction.fail(fail_reason=str(error))
-            transaction.save()
-        except TransitionNotAllowed:
-            transaction.fail_reason = str(error)
-            transaction.save()
+            if transaction.state != Transaction.States.Settled:
+                transaction.settle()
+                if ipn.REFNO and not transaction.external_reference:
+                    transaction.external_reference = ipn.REFNO
+                transaction.save()
+        except TransitionNotAllowed as transition_error:
+            error = transition_error
+
+            try:
+                transaction.fail(fail_reason=str(error))
+                transaction.save()
+            except TransitionNotAllowed:
+                transaction.fail_reason = str(error)
+                transaction.save()
 
-        raise
+    if error:
+        raise error
 
 
 @receiver(alu_token_created)
+@timed("ipn", outcome=lambda outcome: outcome, kind=PayUNotification.Kinds.Token)
 def payu_token_received(sender, **kwargs):
-    transaction = Transaction.objects.get(uuid=sender.ipn.REFNOEXT)
+    ipn_key = get_ipn_key(sender.ipn, PayUNotification.Kinds.Token)
+    if is_duplicate(ipn_key):
+        return "duplicate"
+
+    if _async_ipn_enabled():
+        PayUNotification.objects.create(
+            kind=PayUNotification.Kinds.Token, ipn_id=sender.ipn_id, token_id=sender.pk
+        )
+        outcome = "queued"
+    else:
+        handle_token_ipn(sender)
+        outcome = "applied"
+
+    django_transaction.on_commit(lambda: mark_as_seen(ipn_key))
+
+    return outcome
+
+
+def handle_token_ipn(token):
+    transaction = Transaction.objects.get(uuid=token.ipn.REFNOEXT)
     payment_method = PayUPaymentMethod.objects.get(pk=transaction.payment_method_id)
 
     payment_processor = payment_method.get_payment_processor()
     if payment_processor.__class__ is PayUTriggered:
-        payment_method.token = sender.IPN_CC_TOKEN
-    elif payment_processor.__class__ is PayUTriggeredV2:
-        if not sender.TOKEN_HASH:
+        payment_method.token = token.IPN_CC_TOKEN
+    elif isinstance(payment_processor, PayUTriggeredV2):
+        if not token.TOKEN_HASH:
             return
-        payment_method.token = sender.TOKEN_HASH
+        payment_method.token = token.TOKEN_HASH
     else:
         # no other PayU payment processor implementation expects tokens
         return
 
     payment_method.verified = True
-    payment_method.display_info = sender.IPN_CC_MASK
-    payment_method.valid_until = sender.IPN_CC_EXP_DATE
+    payment_method.display_info = token.IPN_CC_MASK
+    payment_method.valid_until = token.IPN_CC_EXP_DATE
     payment_method.save()
@@ -0,0 +1,274 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from payu import payments
+from payu.conf import PAYU_ALU_URL, PAYU_MERCHANT, PAYU_MERCHANT_KEY, PAYU_TOKENS_URL
+
+from silver_payu import http
+from silver_payu.errors import ErrorKinds, get_error_kind
+from silver_payu.instrumentation import Span
+from silver_payu.parsers import (
+    parse_alu_response,
+    parse_irn_response,
+    parse_order_status,
+)
+from silver_payu.throttling import get_limiter, get_order_amount
+
+PAYU_IOS_URL = getattr(settings, "PAYU_IOS_URL", "https://secure.payu.ro/order/ios.php")
+PAYU_IRN_URL = getattr(settings, "PAYU_IRN_URL", "https://secure.payu.ro/order/irn.php")
+
+
+def _is_throttled(response):
+    return response.status_code in (429, 503)
+
+
+def _is_token_throttled(response):
+    if _is_throttled(response):
+        return True
+
+    try:
+        code = json.loads(response.content).get("code")
+    except (ValueError, AttributeError):
+        return False
+
+    return get_error_kind(code) == ErrorKinds.Throttling
+
+
+def _is_alu_throttled(response):
+    if _is_throttled(response):
+        return True
+
+    try:
+        return_code = parse_alu_response(response.content).return_code
+    except ValueError:
+        return False
+
+    return get_error_kind(return_code) == ErrorKinds.Throttling
+
+
+def _post(url, build_payload, merchant, currency, amount, is_throttled, api):
+    """
+    Posts the payload to PayU, within the merchant's rate limits. The payload
+    is built right before posting, since PayU rejects stale timestamps.
+    """
+
+    def post():
+        payload = build_payload()
+
+        with Span("payu_request", api=api) as request_span:
+            response = http.post(url, payload)
+            request_span.set(outcome=str(response.status_code))
+
+        return response
+
+    limiter = get_limiter(merchant, currency)
+    if not limiter:
+        return post()
+
+    return limiter.call(post, amount=amount, is_throttled=is_throttled)
+
+
+class TokenPayment(payments.TokenPayment):
+    """
+    Same as payu's TokenPayment, but reuses the pooled PayU connections and
+    respects SILVER_PAYU_RATE_LIMITS.
+    """
+
+    def pay(self):
+        return _post(
+            PAYU_TOKENS_URL,
+            self._build_payload,
+            self.merchant,
+            self.order.get("CURRENCY"),
+            self.order.get("AMOUNT") or 0,
+            _is_token_throttled,
+            "token",
+        ).content
+
+
+class ALUPayment(payments.ALUPayment):
+    """
+    Same as payu's ALUPayment, but reuses the pooled PayU connections and
+    respects SILVER_PAYU_RATE_LIMITS.
+    """
+
+    def pay(self):
+        def build_payload():
+            self._request = self._build_payload()
+            return self._request
+
+        self._response = _post(
+            PAYU_ALU_URL,
+            build_payload,
+            self.merchant,
+            self.order.get("PRICES_CURRENCY"),
+            get_order_amount(self.order.get("ORDER") or []),
+            _is_alu_throttled,
+            "alu",
+        ).content
+
+        return self._response
+
+    def _build_payload(self):
+        # payu's pops ORDER from the order it's built from, so it's built from
+        # a copy, which also gets a fresh ORDER_DATE, as PayU rejects stale ones
+        order = self.order
+        self.order = dict(
+            order,
+            ORDER_DATE=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        try:
+            return super()._build_payload()
+        finally:
+            self.order = order
+
+    async def apay(self):
+        """
+        The non-blocking counterpart of `pay`. Rate limited payments are made
+        from a worker thread, since waiting for the limits blocks.
+        """
+
+        if get_limiter(self.merchant, self.order.get("PRICES_CURRENCY")):
+            return await sync_to_async(self.pay, thread_sensitive=False)()
+
+        self._request = self._build_payload()
+
+        with Span("payu_request", api="alu") as request_span:
+            response = await http.apost(PAYU_ALU_URL, self._request)
+            request_span.set(outcome=str(response.status_code))
+
+        self._response = response.content
+
+        return self._response
+
+
+class OrderStatusQuery(object):
+    """
+    Looks up an order by its ORDER_REF, through PayU's Instant Order Status
+    (IOS) API.
+    """
+
+    # ORDER_STATUS values, any other status (e.g. CARD_NOTAUTHORIZED, FRAUD,
+    # REVERSED) meaning the payment failed
+    NotFound = "NOT_FOUND"
+    PaidStatuses = ("PAYMENT_AUTHORIZED", "PAYMENT_RECEIVED", "COMPLETE", "TEST")
+    PendingStatuses = ("WAITING_PAYMENT", "IN_PROGRESS")
+    # the silver fail codes of failed orders, "default" for the rest
+    FailCodes = {
+        "CARD_NOTAUTHORIZED": "transaction_declined_by_bank",
+        "FRAUD": "transaction_hard_declined",
+    }
+
+    def __init__(
+        self, order_ref, merchant_key=PAYU_MERCHANT_KEY, merchant=PAYU_MERCHANT
+    ):
+        self.order_ref = order_ref
+        self.merchant_key = merchant_key
+        self.merchant = merchant
+
+    def _build_payload(self):
+        payload = {"MERCHANT": self.merchant, "REFNOEXT": self.order_ref}
+        payload["HASH"] = payments.BasePayment.get_signature(payload, self.merchant_key)
+
+        return payload
+
+    def query(self):
+        """
+        :return: An (ORDER_STATUS, REFNO) tuple, e.g. ("NOT_FOUND", None) for
+                 orders PayU never got.
+        :raises ValueError: If the response can't be parsed.
+        """
+
+        response = _post(
+            PAYU_IOS_URL,
+            self._build_payload,
+            self.merchant,
+            None,
+            0,
+            _is_throttled,
+            "ios",
+        )
+
+        return parse_order_status(response.content)
+
+
+class RefundRequest(object):
+    """
+    Refunds an order, or cancels its authorization if it wasn't captured yet,
+    through PayU's Instant Refund Notification (IRN) API.
+    """
+
+    # RESPONSE_CODEs meaning the order is refunded, including by an earlier
+    # request, see IRN_ERROR_CODES for the rest
+    SuccessCodes = ("1", "7")
+
+    def __init__(
+        self,
+        refno,
+        order_amount,
+        currency,
+        amount=None,
+        merchant_key=PAYU_MERCHANT_KEY,
+        merchant=PAYU_MERCHANT,
+    ):
+        self.refno = refno
+        self.order_amount = order_amount
+        self.currency = currency
+        self.amount = order_amount if amount is None else amount
+        self.merchant_key = merchant_key
+        self.merchant = merchant
+
+    def _build_payload(self):
+        payload = {
+            "MERCHANT": self.merchant,
+            "ORDER_REF": self.refno,
+            "ORDER_AMOUNT": str(self.order_amount),
+            "ORDER_CURRENCY": self.currency,
+            "IRN_DATE": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "AMOUNT": str(self.amount),
+        }
+
+        # unlike other requests, IRN's hash is computed in the fields' order
+        hashed = "".join(
+            f"{len(value.encode('utf-8'))}{value}" for value in payload.values()
+        )
+        payload["ORDER_HASH"] = hmac.new(
+            self.merchant_key, hashed.encode("utf-8"), hashlib.md5
+        ).hexdigest()
+
+        return payload
+
+    def send(self):
+        """
+        :return: A (RESPONSE_CODE, RESPONSE_MSG) tuple.
+        :raises ValueError: If the response can't be parsed.
+        """
+
+        response = _post(
+            PAYU_IRN_URL,
+            self._build_payload,
+            self.merchant,
+            None,
+            0,
+            _is_throttled,
+            "irn",
+        )
+
+        return parse_irn_response(response.content)
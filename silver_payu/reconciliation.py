@@ -0,0 +1,167 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Follows up on PayU transactions stuck in Pending, e.g. charged while the bank
+was still processing (607), cut short by timeouts, or whose IPN got lost, by
+looking up their orders (IOS) and settling or failing them accordingly.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as django_transaction
+from django.utils import timezone
+from silver.models import Transaction
+from silver.payment_processors import get_all_instances
+
+from silver_payu.payment_processors import PayUBase
+from silver_payu.payments import OrderStatusQuery
+from silver_payu.utils import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+class Outcomes(object):
+    Settled = "settled"
+    Failed = "failed"
+    # still in progress at PayU, or the order couldn't be looked up
+    Pending = "pending"
+
+
+def get_stuck_transactions(now=None, batch_size=None):
+    """
+    :return: The pks of the PayU transactions which have been Pending, without
+             a retry scheduled, for more than SILVER_PAYU_RECONCILE_AFTER seconds.
+    """
+
+    now = now or timezone.now()
+    stuck_after = getattr(settings, "SILVER_PAYU_RECONCILE_AFTER", 15 * 60)
+    if not batch_size:
+        batch_size = getattr(settings, "SILVER_PAYU_RECONCILE_BATCH_SIZE", 500)
+
+    payment_processors = [
+        payment_processor.name
+        for payment_processor in get_all_instances()
+        if isinstance(payment_processor, PayUBase)
+    ]
+
+    return list(
+        Transaction.objects.filter(
+            state=Transaction.States.Pending,
+            updated_at__lte=now - timedelta(seconds=stuck_after),
+            payment_method__payment_processor__in=payment_processors,
+        )
+        .exclude(data__has_key="retry")
+        .order_by("updated_at")
+        .values_list("pk", flat=True)[:batch_size]
+    )
+
+
+def _get_order_status(transaction):
+    try:
+        return OrderStatusQuery(str(transaction.uuid)).query()
+    except Exception as error:
+        logger.warning("Couldn't look up PayU order %s: %s", transaction.uuid, error)
+        return None, None
+
+
+def reconcile_transactions(transactions, max_workers=None):
+    """
+    Looks up the orders of Pending transactions, using at most `max_workers`
+    concurrent requests, and then settles the paid ones and fails the failed
+    ones (or the ones PayU never got) in bulk.
+
+    :param transactions: A list of transaction pks.
+    :return: A list of (transaction, outcome) tuples, see Outcomes.
+    """
+
+    # silver's models don't support deferred fields, hence the full rows
+    transactions = list(Transaction.objects.filter(pk__in=transactions).order_by("pk"))
+    statuses = run_concurrently(_get_order_status, transactions, max_workers)
+
+    paid = {}
+    failed = {}
+    for transaction, (status, refno) in statuses:
+        if status in OrderStatusQuery.PaidStatuses:
+            paid[transaction.pk] = (status, refno)
+        elif status and status not in OrderStatusQuery.PendingStatuses:
+            failed[transaction.pk] = OrderStatusQuery.FailCodes.get(status, "default")
+
+    outcomes = {}
+    if paid:
+        outcomes.update(_settle_transactions(paid))
+    if failed:
+        outcomes.update(_fail_transactions(failed))
+
+    return [
+        (transaction, outcomes.get(transaction.pk, Outcomes.Pending))
+        for transaction in transactions
+    ]
+
+
+def _settle_transactions(paid):
+    """
+    :param paid: A dict of transaction pk: (ORDER_STATUS, REFNO).
+    :return: A dict of transaction pk: outcome.
+    """
+
+    outcomes = {}
+
+    # settling pays the billing documents, so it goes through the models
+    with django_transaction.atomic():
+        transactions = Transaction.objects.select_for_update().filter(
+            pk__in=list(paid), state=Transaction.States.Pending
+        )
+
+        for transaction in transactions:
+            status, refno = paid[transaction.pk]
+
+            transaction.settle()
+            transaction.data.pop("outcome_unknown", None)
+            transaction.data["order_status"] = status
+            if refno and not transaction.external_reference:
+                transaction.external_reference = refno
+            transaction.save()
+
+            outcomes[transaction.pk] = Outcomes.Settled
+
+    return outcomes
+
+
+def _fail_transactions(failed):
+    """
+    :param failed: A dict of transaction pk: fail code.
+    :return: A dict of transaction pk: outcome.
+    """
+
+    now = timezone.now()
+
+    # failing doesn't touch the billing documents, so there's one update for
+    # each fail code, of the transactions which are still Pending
+    with django_transaction.atomic():
+        pending = Transaction.objects.select_for_update().filter(
+            pk__in=list(failed), state=Transaction.States.Pending
+        )
+        by_fail_code = defaultdict(list)
+        for pk in pending.values_list("pk", flat=True):
+            by_fail_code[failed[pk]].append(pk)
+
+        for fail_code, pks in by_fail_code.items():
+            Transaction.objects.filter(pk__in=pks).update(
+                state=Transaction.States.Failed, fail_code=fail_code, updated_at=now
+            )
+
+    return {pk: Outcomes.Failed for pks in by_fail_code.values() for pk in pks}
@@ -0,0 +1,138 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Transactions failing with transient or throttling PayU errors are kept in
+Pending state and charged again later, with jittered exponential backoff,
+instead of being failed right away. The retry state is kept in
+`transaction.data["retry"]`.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from silver.models import Transaction
+
+from silver_payu.errors import ErrorKinds, get_error_kind
+
+logger = logging.getLogger(__name__)
+
+
+def get_retry_delay(attempt, kind, rng=random):
+    """
+    :param attempt: The number of retries so far.
+    :return: The seconds to wait before retrying, somewhere between half and
+             all of the exponential backoff, so that transactions which failed
+             together aren't retried together.
+    """
+
+    if kind == ErrorKinds.Throttling:
+        base_delay = getattr(settings, "SILVER_PAYU_RETRY_THROTTLING_DELAY", 600)
+    elif kind == ErrorKinds.Contention:
+        base_delay = getattr(settings, "SILVER_PAYU_RETRY_CONTENTION_DELAY", 30)
+    else:
+        base_delay = getattr(settings, "SILVER_PAYU_RETRY_BASE_DELAY", 120)
+    max_delay = getattr(settings, "SILVER_PAYU_RETRY_MAX_DELAY", 6 * 60 * 60)
+
+    delay = min(base_delay * 2**attempt, max_delay)
+
+    return rng.uniform(delay / 2, delay)
+
+
+def schedule_retry(transaction, error_code, error_reason, kind=None, delay=None):
+    """
+    Schedules another charge for a transaction which failed with `error_code`,
+    if the error is worth retrying and there are retries left
+    (SILVER_PAYU_RETRY_MAX_ATTEMPTS). The transaction must be saved afterwards.
+
+    :param kind: One of the ErrorKinds, guessed from `error_code` if missing.
+    :param delay: The least seconds to wait when the charge wasn't attempted at
+                  all, e.g. while PayU is unreachable; such retries are always
+                  scheduled and don't count as attempts.
+    :return: True if a retry was scheduled, False if the transaction should fail.
+    """
+
+    kind = kind or get_error_kind(error_code)
+    if kind in (ErrorKinds.Permanent, ErrorKinds.Unknown):
+        return False
+
+    retry = transaction.data.get("retry") or {}
+    attempts = retry.get("attempts", 0)
+
+    if delay is not None:
+        # spread out, so the postponed charges don't all come back together
+        delay = random.uniform(delay, delay + get_retry_delay(0, kind))
+    elif kind == ErrorKinds.Contention:
+        # waiting for another charge to finish doesn't count as an attempt
+        delay = get_retry_delay(0, kind)
+    elif attempts >= getattr(settings, "SILVER_PAYU_RETRY_MAX_ATTEMPTS", 5):
+        return False
+    else:
+        delay = get_retry_delay(attempts, kind)
+        attempts += 1
+
+    next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    transaction.data["retry"] = {
+        "attempts": attempts,
+        "next_attempt_at": next_attempt_at.isoformat(),
+        "error_code": str(error_code),
+        "reason": error_reason,
+    }
+
+    logger.info(
+        "PayU transaction %s failed with %s, retrying at %s.",
+        transaction.uuid,
+        error_code,
+        next_attempt_at,
+    )
+
+    return True
+
+
+def clear_retry(transaction):
+    """
+    :return: True if the transaction had a retry scheduled.
+    """
+
+    return transaction.data.pop("retry", None) is not None
+
+
+def is_retry_due(transaction, now=None):
+    return _is_due(transaction.data, now)
+
+
+def _is_due(data, now=None):
+    retry = (data or {}).get("retry")
+    if not retry:
+        return False
+
+    return parse_datetime(retry["next_attempt_at"]) <= (now or timezone.now())
+
+
+def get_due_retries(now=None):
+    """
+    :return: The pks of the Pending transactions whose retry is due.
+    """
+
+    now = now or timezone.now()
+    transactions = Transaction.objects.filter(
+        state=Transaction.States.Pending, data__has_key="retry"
+    )
+
+    return [
+        pk for pk, data in transactions.values_list("pk", "data") if _is_due(data, now)
+    ]
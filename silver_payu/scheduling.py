@@ -0,0 +1,225 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Partitions the charging of PayU transactions across worker nodes.
+
+Transactions are split into SILVER_PAYU_CHARGE_SHARDS shards (by pk), and each
+worker charges only the shards it holds a lease on. Leases expire after
+SILVER_PAYU_CHARGE_LEASE_DURATION seconds unless renewed by the worker's
+heartbeat, and are spread evenly between the live workers, so shards held by a
+dead worker are taken over once their leases expire, and new workers get their
+share as the others give up their surplus.
+"""
+
+import logging
+import math
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as django_transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from django_fsm import can_proceed
+from silver.models import Transaction
+from silver.payment_processors import get_all_instances
+
+from silver_payu.models import PayUChargeLease, PayUChargeWorker
+from silver_payu.payment_processors import PayUTriggeredBase
+from silver_payu.utils import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+
+def get_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_transaction(transaction):
+    """
+    Moves an Initial transaction to Pending, unless another worker did it
+    first, so a transaction is charged at most once even if leases overlap.
+
+    :return: True if the transaction was claimed.
+    """
+
+    if not can_proceed(transaction.process):
+        return False
+
+    transaction.process()
+    transaction.updated_at = timezone.now()
+
+    claimed = Transaction.objects.filter(
+        pk=transaction.pk, state=Transaction.States.Initial
+    ).update(state=transaction.state, updated_at=transaction.updated_at)
+    if not claimed:
+        transaction.refresh_from_db()
+        return False
+
+    transaction._init_states()
+
+    return True
+
+
+class ShardScheduler(object):
+    def __init__(
+        self, name=None, shards=None, lease_duration=None, margin=None, clock=None
+    ):
+        """
+        :param name: Identifies the worker, defaults to its host name and pid.
+        :param margin: The minimum seconds left on a lease for starting a
+                       charge, defaults to SILVER_PAYU_CHARGE_LEASE_MARGIN.
+        """
+
+        self.name = name or get_worker_name()
+        self.shards = shards or getattr(settings, "SILVER_PAYU_CHARGE_SHARDS", 64)
+        if not lease_duration:
+            lease_duration = getattr(settings, "SILVER_PAYU_CHARGE_LEASE_DURATION", 300)
+        self.lease_duration = timedelta(seconds=lease_duration)
+        self.margin = timedelta(
+            seconds=margin or getattr(settings, "SILVER_PAYU_CHARGE_LEASE_MARGIN", 90)
+        )
+        self.clock = clock or timezone.now
+
+        self.owned_shards = []
+        self.expires_at = None
+
+    def heartbeat(self):
+        """
+        Renews the worker's leases, giving up the ones above its fair share and
+        claiming free or expired ones up to it.
+
+        :return: The shards leased by the worker.
+        """
+
+        now = self.clock()
+        expires_at = now + self.lease_duration
+
+        PayUChargeWorker.objects.update_or_create(
+            name=self.name, defaults={"heartbeat_at": now}
+        )
+        workers = PayUChargeWorker.objects.filter(
+            heartbeat_at__gt=now - self.lease_duration
+        ).count()
+        fair_share = math.ceil(self.shards / max(workers, 1))
+
+        if PayUChargeLease.objects.count() < self.shards:
+            PayUChargeLease.objects.bulk_create(
+                [PayUChargeLease(shard=shard) for shard in range(self.shards)],
+                ignore_conflicts=True,
+            )
+
+        claimable = (
+            Q(owner=self.name) | Q(expires_at__isnull=True) | Q(expires_at__lte=now)
+        )
+
+        with django_transaction.atomic():
+            leases = list(
+                PayUChargeLease.objects.select_for_update(skip_locked=True).filter(
+                    claimable, shard__lt=self.shards
+                )
+            )
+
+            owned = [lease.shard for lease in leases if lease.owner == self.name]
+            free = [lease.shard for lease in leases if lease.owner != self.name]
+
+            kept = owned[:fair_share] + free[: max(fair_share - len(owned), 0)]
+            released = owned[fair_share:]
+
+            PayUChargeLease.objects.filter(shard__in=kept).update(
+                owner=self.name, expires_at=expires_at
+            )
+            if released:
+                PayUChargeLease.objects.filter(shard__in=released).update(
+                    owner="", expires_at=None
+                )
+
+        self.owned_shards = sorted(kept)
+        self.expires_at = expires_at
+
+        return self.owned_shards
+
+    def release(self):
+        """
+        Gives up all the worker's leases, for other workers to take over.
+        """
+
+        PayUChargeLease.objects.filter(owner=self.name).update(
+            owner="", expires_at=None
+        )
+        PayUChargeWorker.objects.filter(name=self.name).delete()
+
+        self.owned_shards = []
+        self.expires_at = None
+
+    def holds_leases(self):
+        return bool(self.owned_shards and self.expires_at - self.margin > self.clock())
+
+    def get_transactions(self, batch_size=None):
+        """
+        :return: A queryset of the Initial transactions to be charged by PayU
+                 triggered processors, from the worker's shards.
+        """
+
+        if not batch_size:
+            batch_size = getattr(settings, "SILVER_PAYU_CHARGE_BATCH_SIZE", 100)
+
+        payment_processors = [
+            payment_processor.name
+            for payment_processor in get_all_instances()
+            if isinstance(payment_processor, PayUTriggeredBase)
+        ]
+
+        return (
+            Transaction.objects.filter(
+                state=Transaction.States.Initial,
+                payment_method__payment_processor__in=payment_processors,
+                payment_method__verified=True,
+                payment_method__canceled=False,
+            )
+            .annotate(shard=Mod("pk", self.shards))
+            .filter(shard__in=self.owned_shards)
+            .order_by("pk")[:batch_size]
+        )
+
+    def charge(self, transaction):
+        """
+        :return: True on success, False on failure and None if the transaction
+                 was left alone, e.g. because the worker's leases ran out.
+        """
+
+        if not self.holds_leases() or not claim_transaction(transaction):
+            return None
+
+        payment_processor = transaction.payment_method.get_payment_processor()
+
+        return payment_processor.execute_transaction(transaction)
+
+    def run_once(self, max_workers=None, batch_size=None):
+        """
+        Renews the worker's leases and charges a batch of its transactions.
+
+        :return: A list of (transaction, result) tuples, see `charge`.
+        """
+
+        if not self.heartbeat():
+            return []
+
+        transactions = PayUTriggeredBase.get_charge_batch(
+            self.get_transactions(batch_size)
+        )
+
+        return run_concurrently(self.charge, transactions, max_workers)
@@ -0,0 +1,20 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from django.dispatch import Signal
+
+# Sent once for each expiry date of a verified PayU payment method, within
+# SILVER_PAYU_EXPIRY_NOTICE_DAYS of it, so customers can be asked for a new
+# card before charges start failing. Receivers get `payment_method` (a
+# PayUPaymentMethod) and `valid_until`.
+payment_method_expiring = Signal()
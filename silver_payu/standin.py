@@ -0,0 +1,392 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A local stand-in for the PayU ALU v3, Token v1, LiveUpdate, IRN and IPN
+endpoints, meant for load and latency testing without hitting PayU.
+
+Point PAYU_ALU_URL, PAYU_TOKENS_URL, PAYU_LU_URL and PAYU_IRN_URL to the
+stand-in's /order/alu/v3, /order/tokens/, /order/lu.php and /order/irn.php URLs.
+IPNs are signed with the merchant key, so they will be accepted by payu's IPN
+view.
+"""
+
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from payu.conf import PAYU_IPN_FIELDS, PAYU_MERCHANT_KEY
+
+from silver_payu.errors import ALU_ERROR_CODES, TOKEN_ERROR_CODES
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyDistribution(object):
+    """
+    Built from specs like `fixed:0.05`, `uniform:0.02,0.2`,
+    `exponential:0.1` (mean) or `lognormal:-2.5,0.5` (mu, sigma), in seconds.
+    """
+
+    def __init__(self, kind="fixed", *params):
+        samplers = {
+            "fixed": lambda rng, value=0: value,
+            "uniform": lambda rng, low, high: rng.uniform(low, high),
+            "exponential": lambda rng, mean: rng.expovariate(1 / mean),
+            "lognormal": lambda rng, mu, sigma: rng.lognormvariate(mu, sigma),
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution {kind}.")
+
+        self.kind = kind
+        self.params = params
+        self._sampler = samplers[kind]
+
+    @classmethod
+    def parse(cls, spec):
+        kind, _, params = (spec or "fixed").partition(":")
+        return cls(kind, *[float(param) for param in params.split(",") if param])
+
+    def sample(self, rng):
+        return max(self._sampler(rng, *self.params), 0)
+
+
+class ErrorMix(object):
+    """
+    Picks an error code (or None, for success) out of `known_codes`, according
+    to the given {code: probability} weights.
+    """
+
+    def __init__(self, weights, known_codes):
+        weights = weights or {}
+
+        unknown_codes = set(weights) - set(known_codes)
+        if unknown_codes:
+            raise ValueError(f"Unknown error codes {sorted(unknown_codes)}.")
+
+        success = 1 - sum(weights.values())
+        if success < 0:
+            raise ValueError("The error probabilities add up to more than 1.")
+
+        self.codes = [None] + list(weights)
+        self.weights = [success] + list(weights.values())
+
+    @classmethod
+    def parse(cls, spec, known_codes):
+        """
+        :param spec: Something like `AUTHORIZATION_FAILED=0.05,INVALID_CC_TOKEN=0.01`
+        """
+
+        weights = {}
+        for item in filter(None, (spec or "").split(",")):
+            code, _, weight = item.partition("=")
+            weights[code.strip()] = float(weight)
+
+        return cls(weights, known_codes)
+
+    def pick(self, rng):
+        return rng.choices(self.codes, self.weights)[0]
+
+
+def sign(values, merchant_key=PAYU_MERCHANT_KEY):
+    payload = "".join(
+        f"{len(str(value).encode('utf-8'))}{value}" for value in values
+    ).encode("utf-8")
+
+    return hmac.new(merchant_key, payload, hashlib.md5).hexdigest()
+
+
+def build_ipn(order_ref, refno, status="PAYMENT_AUTHORIZED", token=None, **extra):
+    """
+    :return: The (ordered) IPN fields, signed the way payu's IPN view expects.
+    """
+
+    fields = {
+        "REFNO": refno,
+        "REFNOEXT": order_ref,
+        "ORDERNO": refno[-6:],
+        "ORDERSTATUS": status,
+        "PAYMETHOD": "Visa/MasterCard/Eurocard",
+        "PAYMETHOD_CODE": "CCVISAMC",
+        "CURRENCY": extra.pop("CURRENCY", "RON"),
+    }
+    if token:
+        fields.update(
+            {
+                "IPN_CC_TOKEN": refno,
+                "IPN_CC_MASK": "4111-xxxx-xxxx-1111",
+                "IPN_CC_EXP_DATE": "2099-12-31",
+                "TOKEN_HASH": token,
+            }
+        )
+    fields.update(extra)
+
+    ipn = [(field, fields[field]) for field in PAYU_IPN_FIELDS if field in fields]
+    ipn.append(("HASH", sign(value for _, value in ipn)))
+
+    return ipn
+
+
+class PayUStandIn(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        alu_latency=None,
+        token_latency=None,
+        alu_errors=None,
+        token_errors=None,
+        ipn_url=None,
+        ipn_latency=None,
+        seed=None,
+    ):
+        """
+        :param alu_latency, token_latency, ipn_latency: LatencyDistribution
+            objects (or their specs), ipn_latency being the delay of IPNs.
+        :param alu_errors, token_errors: {code: probability} dicts.
+        :param ipn_url: Where to send IPNs to, e.g. https://billing/payu/ipn/.
+            No IPNs are sent when missing.
+        """
+
+        self.alu_latency = self._get_latency(alu_latency)
+        self.token_latency = self._get_latency(token_latency)
+        self.ipn_latency = self._get_latency(ipn_latency)
+
+        self.alu_errors = ErrorMix(alu_errors, ALU_ERROR_CODES)
+        self.token_errors = ErrorMix(token_errors, TOKEN_ERROR_CODES)
+
+        self.ipn_url = ipn_url
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._refnos = itertools.count(100000000)
+        self._ipn_executor = ThreadPoolExecutor(max_workers=8)
+
+        self.server = ThreadingHTTPServer((host, port), self._build_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @staticmethod
+    def _get_latency(latency):
+        if isinstance(latency, LatencyDistribution):
+            return latency
+
+        return LatencyDistribution.parse(latency)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._ipn_executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _sample(self, latency):
+        with self._rng_lock:
+            return latency.sample(self._rng)
+
+    def _pick(self, errors):
+        with self._rng_lock:
+            return errors.pick(self._rng)
+
+    def _next_refno(self):
+        return str(next(self._refnos))
+
+    def count(self, key):
+        # incremented from the request handling and IPN sending threads
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _send_ipn(self, ipn):
+        time.sleep(self._sample(self.ipn_latency))
+
+        try:
+            response = requests.post(self.ipn_url, data=ipn, timeout=30)
+            self.count(f"ipn_{response.status_code}")
+        except requests.RequestException:
+            logger.exception("Couldn't send IPN to %s.", self.ipn_url)
+            self.count("ipn_error")
+
+    def schedule_ipn(self, order_ref, refno, **kwargs):
+        if self.ipn_url:
+            self._ipn_executor.submit(
+                self._send_ipn, build_ipn(order_ref, refno, **kwargs)
+            )
+
+    def alu(self, data):
+        time.sleep(self._sample(self.alu_latency))
+
+        refno = self._next_refno()
+        order_ref = data.get("ORDER_REF", "")
+        error_code = self._pick(self.alu_errors)
+
+        if error_code:
+            status, return_code = "FAILED", error_code
+            return_message = ALU_ERROR_CODES[error_code]["reason"]
+        else:
+            status, return_code, return_message = "SUCCESS", "AUTHORIZED", "Authorized."
+            self.schedule_ipn(
+                order_ref, refno, CURRENCY=data.get("PRICES_CURRENCY", "RON")
+            )
+
+        values = [
+            ("REFNO", refno),
+            ("ALIAS", ""),
+            ("STATUS", status),
+            ("RETURN_CODE", return_code),
+            ("RETURN_MESSAGE", return_message),
+            ("DATE", datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")),
+            ("ORDER_REF", order_ref),
+            ("AUTH_CODE", "" if error_code else refno[-6:]),
+        ]
+        values.append(("HASH", sign(value for _, value in values)))
+
+        body = "".join(f"<{tag}>{value}</{tag}>" for tag, value in values)
+        return 200, "text/xml", f'<?xml version="1.0"?>\n<EPAYMENT>{body}</EPAYMENT>'
+
+    def token(self, data):
+        time.sleep(self._sample(self.token_latency))
+
+        error_code = self._pick(self.token_errors)
+        if error_code:
+            response = {
+                "code": int(error_code),
+                "message": TOKEN_ERROR_CODES[error_code]["reason"],
+            }
+        else:
+            refno = self._next_refno()
+            response = {"code": 0, "message": "OK", "tran_ref_no": refno}
+            self.schedule_ipn(
+                data.get("EXTERNAL_REF", ""), refno, CURRENCY=data.get("CURRENCY")
+            )
+
+        return 200, "application/json", json.dumps(response)
+
+    def live_update(self, data):
+        """
+        Authorizes the order right away, sends the (tokenized) IPN and redirects
+        the shopper to BACK_REF.
+        """
+
+        refno = self._next_refno()
+        order_ref = data.get("ORDER_REF", "")
+
+        token = None
+        if data.get("LU_ENABLE_TOKEN") == "1":
+            token = hashlib.md5(order_ref.encode("utf-8")).hexdigest()
+
+        self.schedule_ipn(order_ref, refno, token=token)
+
+        back_ref = data.get("BACK_REF", "/")
+        separator = "&" if "?" in back_ref else "?"
+        location = f"{back_ref}{separator}{urlencode({'ctrl': refno})}"
+
+        return 302, "text/plain", location
+
+    def irn(self, data):
+        """
+        Confirms every refund.
+        """
+
+        values = [
+            data.get("ORDER_REF", ""),
+            "1",
+            "Confirmed.",
+            datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        ]
+        values.append(sign(values))
+
+        return 200, "text/html", f"<EPAYMENT>{'|'.join(values)}</EPAYMENT>"
+
+    def _build_handler(self):
+        standin = self
+
+        routes = {
+            "/order/alu/v3": self.alu,
+            "/order/tokens/": self.token,
+            "/order/lu.php": self.live_update,
+            "/order/irn.php": self.irn,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if urlparse(self.path).path != "/stats":
+                    return self._respond(404, "text/plain", "Not found")
+
+                self._respond(200, "application/json", json.dumps(standin.get_stats()))
+
+            def do_POST(self):
+                route = routes.get(urlparse(self.path).path)
+                if not route:
+                    return self._respond(404, "text/plain", "Not found")
+
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8")
+                data = {
+                    key: values[-1]
+                    for key, values in parse_qs(body, keep_blank_values=True).items()
+                }
+
+                status, content_type, content = route(data)
+                standin.count(f"{route.__name__}_{status}")
+
+                self._respond(status, content_type, content)
+
+            def _respond(self, status, content_type, content):
+                content = content.encode("utf-8")
+
+                self.send_response(status)
+                if status == 302:
+                    self.send_header("Location", content.decode("utf-8"))
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        return Handler
@@ -0,0 +1,241 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Client-side limits for the requests made to PayU, so that batch charging
+neither trips the merchant's limits nor under-uses them.
+
+Limits are configured per merchant and currency, e.g.:
+
+    SILVER_PAYU_RATE_LIMITS = {
+        # used when nothing more specific matches
+        "default": {"requests_per_second": 20, "max_concurrency": 32},
+        "MERCHANT": {"requests_per_second": 10},
+        ("MERCHANT", "RON"): {"amount_per_window": 100000, "window": 3600},
+    }
+
+Nothing is limited when SILVER_PAYU_RATE_LIMITS is empty (the default).
+"""
+
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+
+class TokenBucket(object):
+    """
+    Holds up to `capacity` tokens, refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount=1):
+        """
+        :return: 0 if the tokens were taken, otherwise the seconds to wait
+                 before trying again.
+        """
+
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self._tokens + (now - self._updated_at) * self.rate, self.capacity
+            )
+            self._updated_at = now
+
+            # more than the capacity can only be taken out of a full bucket,
+            # which then goes into debt
+            needed = min(amount, self.capacity)
+            if self._tokens >= needed:
+                self._tokens -= amount
+                return 0
+
+            return (needed - self._tokens) / self.rate
+
+    def acquire(self, amount=1):
+        while True:
+            wait = self.try_acquire(amount)
+            if not wait:
+                return
+
+            self.sleep(wait)
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the number of requests in flight, using AIMD: the limit grows by
+    about one per `limit` successful requests and is cut by `decrease_factor`
+    when requests are throttled, fail or take longer than `target_latency`.
+    """
+
+    def __init__(
+        self,
+        initial=4,
+        min_limit=1,
+        max_limit=64,
+        target_latency=2.0,
+        decrease_factor=0.5,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False):
+        """
+        :param latency: The request's duration, None if it failed.
+        """
+
+        with self._condition:
+            self.in_flight -= 1
+
+            if throttled or latency is None or latency > self.target_latency:
+                self.limit = max(self.limit * self.decrease_factor, self.min_limit)
+            else:
+                self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+
+            self._condition.notify_all()
+
+
+class Limiter(object):
+    def __init__(
+        self,
+        requests_per_second=None,
+        amount_per_window=None,
+        window=60,
+        concurrency=4,
+        min_concurrency=1,
+        max_concurrency=None,
+        target_latency=2.0,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.clock = clock
+
+        self.requests = None
+        if requests_per_second:
+            self.requests = TokenBucket(requests_per_second, clock=clock, sleep=sleep)
+
+        self.amounts = None
+        if amount_per_window:
+            self.amounts = TokenBucket(
+                amount_per_window / window,
+                capacity=amount_per_window,
+                clock=clock,
+                sleep=sleep,
+            )
+
+        self.concurrency = None
+        if max_concurrency:
+            self.concurrency = AdaptiveConcurrency(
+                initial=concurrency,
+                min_limit=min_concurrency,
+                max_limit=max_concurrency,
+                target_latency=target_latency,
+            )
+
+    def call(self, function, amount=0, is_throttled=None):
+        """
+        Calls `function` once the limits allow it.
+
+        :param amount: What the request charges, counted against
+                       amount_per_window.
+        :param is_throttled: Tells, given `function`'s result, whether PayU
+                             throttled the request.
+        """
+
+        if self.concurrency:
+            self.concurrency.acquire()
+
+        latency = None
+        throttled = False
+        try:
+            if self.requests:
+                self.requests.acquire()
+            if self.amounts and amount:
+                self.amounts.acquire(float(amount))
+
+            started_at = self.clock()
+            result = function()
+            latency = self.clock() - started_at
+            throttled = bool(is_throttled and is_throttled(result))
+
+            return result
+        finally:
+            if self.concurrency:
+                self.concurrency.release(latency, throttled)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _get_limits(merchant, currency):
+    limits = getattr(settings, "SILVER_PAYU_RATE_LIMITS", {})
+
+    for key in [(merchant, currency), merchant, "default"]:
+        if key in limits:
+            return key, limits[key]
+
+    return None, None
+
+
+def get_limiter(merchant, currency):
+    """
+    :return: The process-wide Limiter of the merchant and currency, or None if
+             they aren't limited.
+    """
+
+    key, limits = _get_limits(merchant, currency)
+    if key is None:
+        return None
+
+    # a limiter is shared by everything its key matches, e.g. all the currencies
+    # of a merchant limited as a whole
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = Limiter(**limits)
+
+        return _limiters[key]
+
+
+def reset_limiters():
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def get_order_amount(order_lines):
+    return sum(
+        Decimal(str(line.get("PRICE") or 0)) * Decimal(str(line.get("QTY") or 1))
+        for line in order_lines
+    )
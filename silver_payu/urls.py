@@ -18,8 +18,7 @@ from django.urls import re_path
 
 from silver.views import pay_transaction_view, complete_payment_view
 
-from silver_payu.views import threeds_data_view
-
+from silver_payu.views import metrics_view, threeds_data_view
 
 urlpatterns = [
     re_path(r"^", include("payu.urls")),
@@ -34,4 +33,5 @@ urlpatterns = [
         threeds_data_view,
         name="silver-payu-payment-complete",
     ),
+    re_path(r"silver-payu/metrics$", metrics_view, name="silver-payu-metrics"),
 ]
@@ -0,0 +1,111 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_size = 0
+_executor_lock = threading.Lock()
+
+
+def get_max_workers(max_workers=None):
+    if max_workers is None:
+        max_workers = getattr(settings, "SILVER_PAYU_MAX_WORKERS", 8)
+
+    return max(int(max_workers), 1)
+
+
+def _get_executor(max_workers):
+    """
+    Returns the process-wide executor, replacing it with a bigger one if it
+    has less than `max_workers` threads. A replaced executor isn't shut down,
+    since other calls might still be submitting to it; its threads exit once
+    it's no longer referenced.
+    """
+
+    global _executor, _executor_size
+
+    with _executor_lock:
+        if not _executor or _executor_size < max_workers:
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="silver-payu"
+            )
+            _executor_size = max_workers
+
+        return _executor
+
+
+def _call_in_worker(function, item):
+    # Each worker thread has its own database connection, which is closed
+    # after every call, since nothing else would close it.
+    close_old_connections()
+    try:
+        return function(item)
+    except Exception:
+        logger.exception("Encountered exception while handling %s.", item)
+        return False
+    finally:
+        connections.close_all()
+
+
+def run_concurrently(function, items, max_workers=None):
+    """
+    Calls `function` for every item, using at most `max_workers` threads.
+
+    Items are consumed lazily, so at most `max_workers` of them are in flight
+    at any time. Exceptions are logged and reported as a False result. The
+    worker threads are shared by all the calls.
+
+    :return: A list of (item, result) tuples, in the order of `items`.
+    """
+
+    max_workers = get_max_workers(max_workers)
+
+    if max_workers == 1:
+        results = []
+        for item in items:
+            try:
+                results.append((item, function(item)))
+            except Exception:
+                logger.exception("Encountered exception while handling %s.", item)
+                results.append((item, False))
+
+        return results
+
+    results = {}
+    order = []
+    in_flight = {}
+
+    executor = _get_executor(max_workers)
+
+    for index, item in enumerate(items):
+        if len(in_flight) >= max_workers:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[in_flight.pop(future)] = future.result()
+
+        order.append(item)
+        in_flight[executor.submit(_call_in_worker, function, item)] = index
+
+    for future in in_flight:
+        results[in_flight[future]] = future.result()
+
+    return [(item, results[index]) for index, item in enumerate(order)]
@@ -0,0 +1,112 @@
+# Copyright (c) 2017 Presslabs SRL
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Checks payments against PayU's field rules before sending them, so payments
+PayU would reject anyway are failed right away, with the same fail codes and
+reasons, instead of after a round trip. The Token API and ALU v3 have rules
+(and error codes) of their own: 1900, 2100 and 2401-2415 for the Token API,
+INVALID_CURRENCY and INVALID_CUSTOMER_INFO for ALU.
+"""
+
+import re
+
+from silver_payu.errors import ALU_ERROR_CODES, TOKEN_ERROR_CODES
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_AMOUNT_RE = re.compile(r"^(?=.*[1-9])\d+(\.\d+)?$")
+_CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+_COUNTRY_CODE_RE = re.compile(r"^[A-Z]{2}$")
+
+
+def _is_present(value):
+    return bool(value and str(value).strip())
+
+
+def _is_email(value):
+    return _EMAIL_RE.match(str(value)) is not None
+
+
+def _is_optional_email(value):
+    return not value or _is_email(value)
+
+
+def _is_optional_country_code(value):
+    return not value or _COUNTRY_CODE_RE.match(str(value)) is not None
+
+
+def _is_amount(value):
+    return _AMOUNT_RE.match(str(value)) is not None
+
+
+def _is_currency(value):
+    return _CURRENCY_RE.match(str(value)) is not None
+
+
+# (field, check, PayU error code) tuples, in the order PayU checks them
+_TOKEN_RULES = [
+    ("AMOUNT", _is_amount, "1900"),
+    ("CURRENCY", _is_currency, "2100"),
+    ("BILL_LNAME", _is_present, "2401"),
+    ("BILL_FNAME", _is_present, "2402"),
+    ("BILL_EMAIL", _is_present, "2403"),
+    ("BILL_EMAIL", _is_email, "2404"),
+    ("BILL_PHONE", _is_present, "2405"),
+    ("BILL_ADDRESS", _is_present, "2406"),
+    ("BILL_CITY", _is_present, "2407"),
+    ("DELIVERY_LNAME", _is_present, "2408"),
+    ("DELIVERY_FNAME", _is_present, "2409"),
+    ("DELIVERY_PHONE", _is_present, "2410"),
+    ("DELIVERY_ADDRESS", _is_present, "2411"),
+    ("DELIVERY_CITY", _is_present, "2412"),
+    ("DELIVERY_EMAIL", _is_optional_email, "2413"),
+    ("BILL_COUNTRYCODE", _is_optional_country_code, "2414"),
+    ("DELIVERY_COUNTRYCODE", _is_optional_country_code, "2415"),
+]
+
+# ALU requires neither the phone nor the delivery details, and has no error
+# code for the ORDER lines, which are left to PayU
+_ALU_RULES = [
+    ("PRICES_CURRENCY", _is_currency, "INVALID_CURRENCY"),
+    ("BILL_LNAME", _is_present, "INVALID_CUSTOMER_INFO"),
+    ("BILL_FNAME", _is_present, "INVALID_CUSTOMER_INFO"),
+    ("BILL_EMAIL", _is_email, "INVALID_CUSTOMER_INFO"),
+    ("BILL_COUNTRYCODE", _is_optional_country_code, "INVALID_CUSTOMER_INFO"),
+]
+
+
+def _validate(details, rules, error_codes):
+    for field, check, code in rules:
+        if not check(details.get(field)):
+            error = error_codes[code]
+            return code, error["silver_code"], error["reason"]
+
+    return None
+
+
+def validate_token_payment(details):
+    """
+    :param details: The details of a TokenPayment.
+    :return: A (PayU error code, silver fail code, reason) tuple for the first
+             rule the details break, or None if they're valid.
+    """
+
+    return _validate(details, _TOKEN_RULES, TOKEN_ERROR_CODES)
+
+
+def validate_alu_payment(details):
+    """
+    The ALUPayment counterpart of `validate_token_payment`.
+    """
+
+    return _validate(details, _ALU_RULES, ALU_ERROR_CODES)
@@ -12,10 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hmac
+
 from ipware import get_client_ip
 from rest_framework.reverse import reverse
 
-from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseServerError
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotAllowed,
+    HttpResponseServerError,
+)
 from django.views.decorators.csrf import csrf_exempt
 from silver.models import Transaction
 
@@ -23,6 +32,8 @@ from silver.payment_processors.views import GenericTransactionView
 from silver.utils.decorators import get_transaction_from_token
 from silver.utils.payments import _get_jwt_token
 
+from silver_payu.instrumentation import render_prometheus, timed
+
 
 class PayUTransactionView(GenericTransactionView):
     def get_context_data(self):
@@ -41,6 +52,7 @@ def threeds_data_url(transaction, request):
 
 
 @csrf_exempt
+@timed("threeds_data_view", outcome=lambda response: str(response.status_code))
 @get_transaction_from_token
 def threeds_data_view(request, transaction, expired=None):
     if transaction.state not in [
@@ -76,3 +88,35 @@ def threeds_data_view(request, transaction, expired=None):
     payment_method.save()
 
     return HttpResponse()
+
+
+def _can_view_metrics(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+
+    token = getattr(settings, "SILVER_PAYU_METRICS_TOKEN", None)
+    if not token:
+        return False
+
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+
+    return hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """
+    Exports the hot path latency histograms, in Prometheus' text format, when
+    SILVER_PAYU_METRICS_VIEW is enabled, to staff users and to the scrapers
+    sending SILVER_PAYU_METRICS_TOKEN as a bearer token.
+    """
+
+    if not getattr(settings, "SILVER_PAYU_METRICS_VIEW", False):
+        raise Http404
+
+    if not _can_view_metrics(request):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
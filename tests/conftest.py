@@ -39,6 +39,10 @@ settings.configure(
             "class": "silver_payu.payment_processors.PayUTriggeredV2",
             "setup_data": {},
         },
+        "payu_triggered_v2_async": {
+            "class": "silver_payu.payment_processors.AsyncPayUTriggeredV2",
+            "setup_data": {},
+        },
         "payu_triggered": {
             "class": "silver_payu.payment_processors.PayUTriggered",
             "setup_data": {},
@@ -1,15 +1,19 @@
+from decimal import Decimal
+
 import pytest
 import responses
 
 from silver import payment_processors
 from silver.fixtures.factories import (
     CustomerFactory,
+    DocumentEntryFactory,
     ProformaFactory,
     InvoiceFactory,
     TransactionFactory,
 )
 from silver.models import Invoice
 
+from silver_payu import http
 from tests.factories import PayUPaymentMethodFactory
 
 
@@ -18,6 +22,11 @@ def reset_responses():
     responses.reset()
 
 
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    http.reset_circuit_breakers()
+
+
 @pytest.fixture()
 def customer():
     return CustomerFactory.create(
@@ -109,3 +118,43 @@ def transaction_triggered_v2(customer, payment_method_triggered_v2, proforma, in
         amount=invoice.total,
         payment_method=payment_method_triggered_v2,
     )
+
+
+@pytest.fixture()
+def entry():
+    return DocumentEntryFactory.create(quantity=1, unit_price=Decimal("10.00"))
+
+
+@pytest.fixture()
+def billed_proforma(customer, entry):
+    return ProformaFactory.create(
+        state=Invoice.STATES.ISSUED,
+        customer=customer,
+        transaction_currency="RON",
+        proforma_entries=[entry],
+    )
+
+
+@pytest.fixture()
+def billed_invoice(customer, billed_proforma, entry):
+    return InvoiceFactory.create(
+        related_document=billed_proforma,
+        state=Invoice.STATES.ISSUED,
+        customer=customer,
+        transaction_currency="RON",
+        invoice_entries=[entry],
+    )
+
+
+@pytest.fixture()
+def billed_transaction_triggered(
+    payment_method_triggered, billed_proforma, billed_invoice
+):
+    # PayU doesn't charge empty documents, see validation
+    return TransactionFactory.create(
+        invoice=billed_invoice,
+        proforma=billed_proforma,
+        currency="RON",
+        amount=billed_invoice.total,
+        payment_method=payment_method_triggered,
+    )
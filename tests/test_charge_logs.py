@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import pytest
+import responses
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from faker import Faker
+
+from silver_payu.models import PayUChargeLog
+
+from .fixtures import *
+
+faker = Faker()
+
+FAILED_RESPONSE = """<?xml version="1.0"?>
+<EPAYMENT>
+    <REFNO>6468866</REFNO>
+    <STATUS>FAILED</STATUS>
+    <RETURN_CODE>AUTHORIZATION_FAILED</RETURN_CODE>
+    <RETURN_MESSAGE>Authorization declined</RETURN_MESSAGE>
+</EPAYMENT>
+"""
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("compress", [True, False])
+def test_charge_logs_are_kept_out_of_transactions(
+    payment_processor_triggered_v2, transaction_triggered_v2, compress
+):
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body=FAILED_RESPONSE)
+
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.token = "secret token"
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.save()
+
+    with override_settings(
+        SILVER_PAYU_CHARGE_LOG="table", SILVER_PAYU_CHARGE_LOG_COMPRESS=compress
+    ):
+        assert not payment_processor_triggered_v2.process_transaction(
+            transaction_triggered_v2
+        )
+
+    transaction_triggered_v2.refresh_from_db()
+    assert "_request" not in transaction_triggered_v2.data
+    assert "_response" not in transaction_triggered_v2.data
+
+    (charge_log,) = transaction_triggered_v2.payu_charge_logs.all()
+    assert charge_log.compressed == compress
+    assert charge_log.status == "FAILED"
+    assert charge_log.return_code == "AUTHORIZATION_FAILED"
+    assert charge_log.return_message == "Authorization declined"
+
+    request = charge_log.get_request()
+    assert request["CC_TOKEN"] == "[REDACTED]"
+    assert request["ORDER_REF"] == str(transaction_triggered_v2.uuid)
+    assert charge_log.get_response() == FAILED_RESPONSE
+
+
+@pytest.mark.django_db
+def test_prune_charge_logs(transaction):
+    old_log, new_log = [
+        PayUChargeLog.objects.create(transaction=transaction, request=b"{}")
+        for _ in range(2)
+    ]
+    PayUChargeLog.objects.filter(pk=old_log.pk).update(
+        created_at=timezone.now() - timedelta(days=31)
+    )
+
+    call_command("prune_payu_charge_logs", days=30, batch_size=1)
+
+    assert list(PayUChargeLog.objects.all()) == [new_log]
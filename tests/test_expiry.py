@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from mock import MagicMock, patch
+from payu.models import PayUIPN
+from silver.models import Transaction
+
+from silver_payu.expiry import (
+    fail_expired_transactions,
+    get_expiring_payment_methods,
+    notify_expiring_payment_methods,
+)
+from silver_payu.payment_processors import PayUTriggered
+from silver_payu.signals import payment_method_expiring
+
+from .fixtures import *
+
+
+@pytest.fixture()
+def expired_payment_method(payment_method_triggered):
+    payment_method_triggered.verified = True
+    payment_method_triggered.valid_until = timezone.now() - timedelta(days=2)
+    payment_method_triggered.save()
+
+    return payment_method_triggered
+
+
+@pytest.mark.django_db
+def test_charges_on_expired_cards_are_failed_without_calling_payu(
+    payment_processor_triggered, expired_payment_method, transaction_triggered
+):
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.save()
+
+    with patch.object(PayUTriggered, "_charge_transaction") as charge:
+        assert not payment_processor_triggered.execute_transaction(transaction)
+
+    charge.assert_not_called()
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+    assert transaction.fail_code == "expired_card"
+    valid_until = expired_payment_method.valid_until
+    assert transaction.data["expired_card"] == valid_until.isoformat()
+
+
+@pytest.mark.django_db
+def test_cards_are_usable_through_their_expiry_date(
+    payment_processor_triggered, expired_payment_method, transaction_triggered
+):
+    expired_payment_method.valid_until = timezone.now().replace(hour=0, minute=0)
+    expired_payment_method.save()
+
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.save()
+
+    with patch.object(
+        PayUTriggered, "_charge_transaction", return_value=True
+    ) as charge:
+        assert payment_processor_triggered.execute_transaction(transaction)
+
+    charge.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_fail_expired_transactions(expired_payment_method, transaction_triggered):
+    assert list(get_expiring_payment_methods(timezone.now())) == [
+        expired_payment_method
+    ]
+
+    assert fail_expired_transactions() == 1
+
+    transaction_triggered.refresh_from_db()
+    assert transaction_triggered.state == Transaction.States.Failed
+    assert transaction_triggered.fail_code == "expired_card"
+    assert transaction_triggered.data == {
+        "expired_card": expired_payment_method.valid_until.isoformat()
+    }
+
+    assert fail_expired_transactions() == 0
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_sent_charges_on_expired_cards_are_not_failed(
+    mocked_document, expired_payment_method, transaction_triggered
+):
+    # charged through the Token API, waiting for its IPN
+    transaction_triggered.process()
+    transaction_triggered.save()
+
+    assert fail_expired_transactions() == 0
+
+    PayUIPN.objects.create(
+        REFNO="123",
+        REFNOEXT=str(transaction_triggered.uuid),
+        ORDERSTATUS="PAYMENT_AUTHORIZED",
+    )
+
+    transaction_triggered.refresh_from_db()
+    assert transaction_triggered.state == Transaction.States.Settled
+
+
+@pytest.mark.django_db
+def test_live_update_payments_on_expired_cards_are_not_failed(transaction):
+    payment_method = transaction.payment_method
+    payment_method.verified = True
+    payment_method.valid_until = timezone.now() - timedelta(days=2)
+    payment_method.save()
+
+    assert fail_expired_transactions() == 0
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Initial
+
+
+@pytest.mark.django_db
+def test_expiring_cards_are_notified_once(expired_payment_method):
+    receiver = MagicMock()
+    payment_method_expiring.connect(receiver)
+
+    try:
+        # already expired
+        assert notify_expiring_payment_methods() == 0
+
+        expired_payment_method.valid_until = timezone.now() + timedelta(days=10)
+        expired_payment_method.save()
+
+        assert notify_expiring_payment_methods() == 1
+        assert notify_expiring_payment_methods() == 0
+    finally:
+        payment_method_expiring.disconnect(receiver)
+
+    receiver.assert_called_once()
+    assert receiver.call_args[1]["payment_method"] == expired_payment_method
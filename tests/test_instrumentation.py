@@ -0,0 +1,157 @@
+import pytest
+import responses
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory, override_settings
+from faker import Faker
+
+from silver_payu import instrumentation
+from silver_payu.instrumentation import Histogram, Span, render_prometheus, timed
+from silver_payu.views import metrics_view
+
+from .fixtures import *
+
+faker = Faker()
+hook_calls = []
+
+
+def hook(name, duration, labels):
+    hook_calls.append((name, labels))
+
+
+@pytest.fixture(autouse=True)
+def histograms():
+    instrumentation.reset()
+    yield
+    instrumentation.reset()
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.1, 1))
+
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(value)
+
+    assert histogram.snapshot() == ([(0.1, 2), (1, 3), (float("inf"), 4)], 2.65, 4)
+
+
+def test_span_labels_errors():
+    with pytest.raises(KeyError):
+        with Span("lookup", source="cache"):
+            raise KeyError
+
+    histogram = instrumentation.get_histogram(
+        "lookup", source="cache", outcome="error", error="KeyError"
+    )
+    assert histogram.count == 1
+
+
+@override_settings(
+    SILVER_PAYU_INSTRUMENTATION_HOOKS=["tests.test_instrumentation.hook"]
+)
+def test_timed_calls_hooks():
+    hook_calls.clear()
+
+    @timed("double", outcome=lambda result: "big" if result > 2 else "small")
+    def double(value):
+        return value * 2
+
+    assert double(2) == 4
+    assert hook_calls == [("double", {"outcome": "big"})]
+
+
+@override_settings(SILVER_PAYU_INSTRUMENTATION=False)
+def test_instrumentation_can_be_disabled():
+    with Span("charge"):
+        pass
+
+    assert instrumentation.get_histogram("charge") is None
+
+
+def test_render_prometheus():
+    instrumentation.record("charge", 0.2, {"outcome": 'say "hi"'})
+
+    rendered = render_prometheus()
+
+    assert rendered.startswith("# TYPE silver_payu_charge_seconds histogram\n")
+    assert (
+        'silver_payu_charge_seconds_bucket{outcome="say \\"hi\\"",le="0.25"} 1'
+        in rendered
+    )
+    assert 'silver_payu_charge_seconds_bucket{outcome="say \\"hi\\"",le="0.1"} 0' in (
+        rendered
+    )
+    assert 'silver_payu_charge_seconds_count{outcome="say \\"hi\\""} 1' in rendered
+
+
+@pytest.mark.django_db
+def test_charges_are_instrumented(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    responses.add(
+        responses.POST,
+        settings.PAYU_ALU_URL,
+        body="""<?xml version="1.0"?>
+        <EPAYMENT>
+            <REFNO>6468866</REFNO>
+            <STATUS>FAILED</STATUS>
+            <RETURN_CODE>AUTHORIZATION_FAILED</RETURN_CODE>
+            <RETURN_MESSAGE>Authorization declined.</RETURN_MESSAGE>
+        </EPAYMENT>""",
+    )
+
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.save()
+
+    payment_processor_triggered_v2.process_transaction(transaction_triggered_v2)
+
+    charge = instrumentation.get_histogram(
+        "charge",
+        processor=payment_processor_triggered_v2.name,
+        outcome="failed",
+        code=transaction_triggered_v2.fail_code,
+    )
+    assert charge.count == 1
+    assert instrumentation.get_histogram("payu_request", api="alu", outcome="200")
+    assert instrumentation.get_histogram("parse_result", api="alu", outcome="failed")
+
+
+def test_metrics_view(client):
+    instrumentation.record("charge", 0.2, {})
+
+    assert client.get("/silver-payu/metrics").status_code == 404
+
+    with override_settings(
+        SILVER_PAYU_METRICS_VIEW=True, SILVER_PAYU_METRICS_TOKEN="secret"
+    ):
+        for authorization in ["", "Bearer wrong"]:
+            response = client.get(
+                "/silver-payu/metrics", HTTP_AUTHORIZATION=authorization
+            )
+            assert response.status_code == 403
+
+        response = client.get(
+            "/silver-payu/metrics", HTTP_AUTHORIZATION="Bearer secret"
+        )
+
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b"silver_payu_charge_seconds_count 1" in response.content
+
+
+@override_settings(SILVER_PAYU_METRICS_VIEW=True)
+def test_metrics_view_is_only_served_to_staff_without_a_token():
+    request = RequestFactory().get("/silver-payu/metrics")
+    request.user = AnonymousUser()
+    assert metrics_view(request).status_code == 403
+
+    request.user = User(is_staff=True)
+    assert metrics_view(request).status_code == 200
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+import pytest
+import responses
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction as django_transaction
+from django.utils import timezone
+from silver import payment_processors
+from silver.models import Transaction
+
+from silver_payu.locks import acquire_lock, release_lock
+from silver_payu.models import PayUPaymentMethodLock
+
+from .fixtures import *
+
+SUCCESS_RESPONSE = """<?xml version="1.0"?>
+<EPAYMENT>
+    <REFNO>12345</REFNO>
+    <STATUS>SUCCESS</STATUS>
+    <RETURN_CODE>AUTHORIZED</RETURN_CODE>
+    <RETURN_MESSAGE>Authorized.</RETURN_MESSAGE>
+</EPAYMENT>
+"""
+
+CUSTOMER = {
+    "BILL_ADDRESS": "Str. Lunga 1",
+    "BILL_CITY": "Timisoara",
+    "BILL_EMAIL": "john@acme.com",
+    "BILL_FNAME": "John",
+    "BILL_LNAME": "Doe",
+    "BILL_PHONE": "+40000000000",
+}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_payment_method_lock(payment_method_triggered_v2):
+    payment_method = payment_method_triggered_v2
+
+    token = acquire_lock(payment_method)
+    assert token
+    assert acquire_lock(payment_method) is None
+
+    release_lock(payment_method, token)
+    token = acquire_lock(payment_method)
+    assert token
+
+    # the holder died
+    PayUPaymentMethodLock.objects.update(expires_at=timezone.now() - timedelta(1))
+    assert acquire_lock(payment_method) not in [None, token]
+
+    # releasing a lock which has been taken over
+    release_lock(payment_method, token)
+    assert PayUPaymentMethodLock.objects.exists()
+
+
+@pytest.mark.django_db
+def test_payment_method_lock_within_a_transaction(payment_method_triggered_v2):
+    payment_method = payment_method_triggered_v2
+
+    with django_transaction.atomic():
+        token = acquire_lock(payment_method)
+        assert token == ""
+        assert not PayUPaymentMethodLock.objects.exists()
+        release_lock(payment_method, token)
+
+        # the locks held by others are still respected
+        PayUPaymentMethodLock.objects.create(
+            payment_method_id=payment_method.pk,
+            token="token",
+            expires_at=timezone.now() + timedelta(seconds=300),
+        )
+        assert acquire_lock(payment_method) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_charging_within_a_transaction(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body=SUCCESS_RESPONSE)
+
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = CUSTOMER
+    payment_method.save()
+
+    transaction = transaction_triggered_v2
+    transaction.process()
+    transaction.save()
+
+    # e.g. with ATOMIC_REQUESTS
+    with django_transaction.atomic():
+        assert payment_processor_triggered_v2.execute_transaction(transaction)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    assert transaction.external_reference == "12345"
+    assert not PayUPaymentMethodLock.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_charging_locked_payment_method_is_deferred(
+    payment_processor_triggered_v2, transaction_triggered_v2, asynchronous
+):
+    transaction = transaction_triggered_v2
+    transaction.process()
+    transaction.save()
+
+    token = "token"
+    PayUPaymentMethodLock.objects.create(
+        payment_method_id=transaction.payment_method.pk,
+        token=token,
+        expires_at=timezone.now() + timedelta(seconds=300),
+    )
+
+    if asynchronous:
+        execute_transaction = async_to_sync(
+            payment_processors.get_instance(
+                "payu_triggered_v2_async"
+            ).aexecute_transaction
+        )
+    else:
+        execute_transaction = payment_processor_triggered_v2.execute_transaction
+
+    assert not execute_transaction(transaction)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    assert transaction.data["retry"]["error_code"] == "payment_method_busy"
+    assert transaction.data["retry"]["attempts"] == 0
+
+    assert PayUPaymentMethodLock.objects.get().token == token
@@ -1,14 +1,26 @@
+import threading
+import time
+
 import pytest
 import responses
+from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.db.models.signals import post_save
+from django.test import RequestFactory, override_settings
 from faker import Faker
-from mock import MagicMock, patch
+from mock import MagicMock, PropertyMock, patch
 
 from django.utils.dateparse import parse_datetime
+from silver import payment_processors
 from silver.models import Transaction
 
+from silver_payu import utils
 from silver_payu.models import PayUPaymentMethod
-from silver_payu.payment_processors import payu_ipn_received, payu_token_received
+from silver_payu.payment_processors import (
+    handle_token_ipn,
+    payu_ipn_received,
+    payu_token_received,
+)
 
 from .fixtures import *
 
@@ -28,6 +40,112 @@ def test_payment_method_data_set():
     assert payment_method.archived_customer == {"name": "test"}
 
 
+@pytest.mark.django_db
+def test_payment_method_data_is_decrypted_once(payment_method_triggered_v2):
+    payment_method_triggered_v2.archived_customer = {"BILL_FNAME": "John"}
+    payment_method_triggered_v2.save()
+
+    payment_method = PayUPaymentMethod.objects.get(pk=payment_method_triggered_v2.pk)
+
+    with patch.object(
+        PayUPaymentMethod, "decrypt_data", wraps=payment_method.decrypt_data
+    ) as mocked_decrypt:
+        for _ in range(3):
+            assert payment_method.archived_customer == {"BILL_FNAME": "John"}
+            assert payment_method.threeds_data == {}
+
+        assert mocked_decrypt.call_count == 2
+
+        # altering the returned value doesn't alter the cached one
+        payment_method.archived_customer["BILL_FNAME"] = "Jane"
+        assert payment_method.archived_customer == {"BILL_FNAME": "John"}
+
+        # setting a value doesn't require decrypting it back
+        payment_method.archived_customer = {"BILL_FNAME": "Jane"}
+        assert payment_method.archived_customer == {"BILL_FNAME": "Jane"}
+        assert mocked_decrypt.call_count == 2
+
+        payment_method.refresh_from_db()
+        assert payment_method.archived_customer == {"BILL_FNAME": "John"}
+        assert mocked_decrypt.call_count == 3
+
+
+def test_payment_method_charge_details():
+    payment_method = PayUPaymentMethod()
+    payment_method.decrypt_data = lambda value: value
+    payment_method.encrypt_data = lambda value: value
+
+    billing_details = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.archived_customer = billing_details
+
+    with patch.object(
+        PayUPaymentMethod,
+        "archived_customer",
+        new_callable=PropertyMock,
+        return_value=dict(billing_details),
+    ) as archived_customer:
+        for _ in range(2):
+            details = payment_method.charge_details
+            assert details["DELIVERY_CITY"] == billing_details["BILL_CITY"]
+            details["DELIVERY_CITY"] = "altered"
+
+        assert archived_customer.call_count == 1
+
+    assert (
+        payment_method.charge_details["DELIVERY_CITY"] == billing_details["BILL_CITY"]
+    )
+
+    payment_method.archived_customer = {**billing_details, "BILL_CITY": "Cluj"}
+    assert payment_method.charge_details["DELIVERY_CITY"] == "Cluj"
+
+    payment_method.archived_customer = {}
+    with pytest.raises(KeyError):
+        payment_method.charge_details
+
+
+def test_payment_method_alu_charge_details():
+    payment_method = PayUPaymentMethod()
+    payment_method.decrypt_data = lambda value: value
+    payment_method.encrypt_data = lambda value: value
+
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+
+    details = payment_method.alu_charge_details
+    assert details["PAY_METHOD"] == "CCVISAMC"
+    assert details["DELIVERY_CITY"] == payment_method.archived_customer["BILL_CITY"]
+    assert "STRONG_CUSTOMER_AUTHENTICATION" not in details
+
+    payment_method.threeds_data = {"BROWSER_IP": "111.1.11.111"}
+
+    with patch.object(
+        PayUPaymentMethod,
+        "threeds_data",
+        new_callable=PropertyMock,
+        return_value={"BROWSER_IP": "111.1.11.111"},
+    ) as threeds_data:
+        for _ in range(2):
+            details = payment_method.alu_charge_details
+            assert details["STRONG_CUSTOMER_AUTHENTICATION"] == "YES"
+            assert details["BROWSER_IP"] == "111.1.11.111"
+            details["BROWSER_IP"] = "altered"
+
+        assert threeds_data.call_count == 1
+
+
 @pytest.mark.django_db
 def test_execute_transaction_wrong_payment_processor(
     payment_processor_triggered, transaction_triggered
@@ -45,6 +163,70 @@ def test_execute_transaction_wrong_transaction_state(payment_processor_triggered
     assert not payment_processor_triggered.execute_transaction(transaction_triggered)
 
 
+@override_settings(SILVER_PAYU_CHARGE_LOCK=False)
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_execute_transactions(payment_processor_triggered_v2, max_workers):
+    in_flight = []
+    max_in_flight = []
+    lock = threading.Lock()
+
+    def charge(transaction):
+        with lock:
+            in_flight.append(transaction)
+            max_in_flight.append(len(in_flight))
+
+        time.sleep(0.01)
+
+        with lock:
+            in_flight.remove(transaction)
+
+        if transaction.amount < 0:
+            raise ValueError("Negative amount")
+
+        return transaction.amount % 2 == 0
+
+    payment_processor_triggered_v2._charge_transaction = charge
+
+    transactions = [
+        MagicMock(
+            state=Transaction.States.Pending,
+            amount=amount,
+            **{"payment_method.valid_until": None},
+        )
+        for amount in [2, 3, -1, 4, 6, 7, 8, 9]
+    ]
+    transactions.append(MagicMock(state=Transaction.States.Settled, amount=10))
+
+    results = payment_processor_triggered_v2.execute_transactions(
+        transactions, max_workers=max_workers
+    )
+
+    assert results == [
+        (transaction, result)
+        for transaction, result in zip(
+            transactions, [True, False, False, True, True, False, True, False, False]
+        )
+    ]
+    assert max(max_in_flight) <= max_workers
+
+
+def test_run_concurrently_reuses_workers():
+    threads = set()
+
+    def handle(item):
+        threads.add(threading.current_thread())
+        return item
+
+    with patch("silver_payu.utils.connections") as connections:
+        for _ in range(3):
+            results = utils.run_concurrently(handle, range(4), max_workers=2)
+            assert results == [(item, item) for item in range(4)]
+
+    # each worker closes its database connections after every call
+    assert connections.close_all.call_count == 12
+    assert len(threads) <= utils._executor_size
+
+
 @pytest.mark.django_db
 def test_execute_transaction_happy_path(
     payment_method_triggered_v2,
@@ -97,6 +279,7 @@ def test_execute_transaction_happy_path(
 
     transaction_triggered_v2.refresh_from_db()
     assert transaction_triggered_v2.state == Transaction.States.Pending
+    assert transaction_triggered_v2.external_reference == "123456789"
 
     assert (
         "'STRONG_CUSTOMER_AUTHENTICATION': 'YES'"
@@ -266,7 +449,7 @@ def test_charge_transaction_triggered(
     mocked_token_payment,
     payment_processor_triggered,
     payment_method_triggered,
-    transaction_triggered,
+    billed_transaction_triggered,
 ):
     mocked_token_payment.return_value.pay.return_value = '{"code": "0"}'
 
@@ -280,7 +463,7 @@ def test_charge_transaction_triggered(
         "BILL_PHONE": faker.phone_number(),
     }
 
-    assert payment_processor_triggered._charge_transaction(transaction_triggered)
+    assert payment_processor_triggered._charge_transaction(billed_transaction_triggered)
 
     asserted_payment_details = payment_method_triggered.archived_customer
     asserted_payment_details.update(
@@ -291,9 +474,9 @@ def test_charge_transaction_triggered(
             "DELIVERY_FNAME": asserted_payment_details["BILL_FNAME"],
             "DELIVERY_LNAME": asserted_payment_details["BILL_LNAME"],
             "DELIVERY_PHONE": asserted_payment_details["BILL_PHONE"],
-            "AMOUNT": str(transaction_triggered.amount),
-            "CURRENCY": str(transaction_triggered.currency),
-            "EXTERNAL_REF": str(transaction_triggered.uuid),
+            "AMOUNT": str(billed_transaction_triggered.amount),
+            "CURRENCY": str(billed_transaction_triggered.currency),
+            "EXTERNAL_REF": str(billed_transaction_triggered.uuid),
         }
     )
 
@@ -323,11 +506,12 @@ def test_parse_token_payment_result(
 @pytest.mark.django_db
 @patch("silver.models.transactions.transaction.Transaction.update_document_state")
 def test_ipn_received(mocked_document, transaction):
-    payu_ipn_received(MagicMock(REFNOEXT=transaction.uuid))
+    payu_ipn_received(MagicMock(REFNO="6468866", REFNOEXT=transaction.uuid))
 
     transaction.refresh_from_db()
 
     assert transaction.state == "settled"
+    assert transaction.external_reference == "6468866"
 
 
 @pytest.mark.django_db
@@ -367,3 +551,218 @@ def test_token_v2_received(transaction_triggered_v2):
     assert transaction_triggered_v2.payment_method.token == sender.TOKEN_HASH
     assert transaction_triggered_v2.payment_method.display_info == sender.IPN_CC_MASK
     assert transaction_triggered_v2.payment_method.verified
+
+
+@pytest.mark.django_db(transaction=True)
+def test_charge_batch_queries(
+    django_assert_num_queries,
+    payment_method_triggered_v2,
+    payment_processor_triggered_v2,
+    transaction_triggered_v2,
+):
+    responses.add(
+        responses.POST,
+        settings.PAYU_ALU_URL,
+        body="""<?xml version="1.0"?>
+        <EPAYMENT>
+            <REFNO>6468866</REFNO>
+            <STATUS>FAILED</STATUS>
+            <RETURN_CODE>AUTHORIZATION_FAILED</RETURN_CODE>
+            <RETURN_MESSAGE>Authorization declined</RETURN_MESSAGE>
+        </EPAYMENT>
+        """,
+        status=200,
+    )
+
+    payment_method_triggered_v2.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method_triggered_v2.save()
+
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    with django_assert_num_queries(1):
+        (transaction,) = payment_processor_triggered_v2.get_charge_batch(
+            [transaction_triggered_v2.pk]
+        )
+
+    # taking the payment method's lock, updating the transaction and releasing
+    # the lock, plus the BEGINs of their atomic blocks
+    with django_assert_num_queries(6):
+        assert not payment_processor_triggered_v2.execute_transaction(transaction)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+    assert transaction.data["return_code"] == "AUTHORIZATION_FAILED"
+    assert "_response" in transaction.data
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("as_list", [False, True])
+def test_async_execute_transactions(transaction_triggered_v2, as_list):
+    responses.add(
+        responses.POST,
+        settings.PAYU_ALU_URL,
+        body="""<?xml version="1.0"?>
+        <EPAYMENT>
+            <REFNO>12345</REFNO>
+            <STATUS>SUCCESS</STATUS>
+            <RETURN_CODE>AUTHORIZED</RETURN_CODE>
+            <RETURN_MESSAGE>Authorized.</RETURN_MESSAGE>
+        </EPAYMENT>
+        """,
+        status=200,
+    )
+
+    payment_processor = payment_processors.get_instance("payu_triggered_v2_async")
+
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.save()
+
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    transactions = Transaction.objects.filter(pk=transaction_triggered_v2.pk)
+    if as_list:
+        # not loaded through get_charge_batch
+        transactions = list(transactions)
+
+    results = async_to_sync(payment_processor.aexecute_transactions)(transactions)
+
+    assert [(transaction.pk, result) for transaction, result in results] == [
+        (transaction_triggered_v2.pk, True)
+    ]
+
+    transaction_triggered_v2.refresh_from_db()
+    assert transaction_triggered_v2.state == Transaction.States.Pending
+    assert "'ORDER_REF'" in transaction_triggered_v2.data["_request"]
+
+
+@pytest.mark.django_db
+def test_parse_malformed_alu_response(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    assert not payment_processor_triggered_v2._parse_result(
+        transaction_triggered_v2, b"<html>Bad gateway"
+    )
+
+    transaction_triggered_v2.refresh_from_db()
+    assert transaction_triggered_v2.state == Transaction.States.Failed
+
+
+@pytest.mark.django_db
+def test_payu_token_received_by_async_processor(customer, invoice, proforma):
+    payment_method = PayUPaymentMethodFactory.create(
+        customer=customer, payment_processor="payu_triggered_v2_async"
+    )
+    transaction = TransactionFactory.create(
+        invoice=invoice,
+        proforma=proforma,
+        currency="RON",
+        amount=invoice.total,
+        payment_method=payment_method,
+    )
+
+    token = MagicMock(
+        TOKEN_HASH="token hash",
+        IPN_CC_MASK="4111-xxxx-xxxx-1111",
+        IPN_CC_EXP_DATE="2099-12-31",
+        ipn=MagicMock(REFNOEXT=str(transaction.uuid)),
+    )
+    handle_token_ipn(token)
+
+    payment_method = PayUPaymentMethod.objects.get(pk=payment_method.pk)
+    assert payment_method.verified
+    assert payment_method.token == "token hash"
+
+
+@pytest.mark.django_db
+def test_handle_transaction_response(
+    django_assert_num_queries, payment_processor, transaction
+):
+    factory = RequestFactory()
+    transaction.refresh_from_db()
+
+    # the locking select and the update, within the savepoints of the lock and
+    # of the save, plus the payment method, customer and documents which
+    # silver's post_save logs
+    with django_assert_num_queries(10):
+        payment_processor.handle_transaction_response(
+            transaction, factory.get("/complete", {"ctrl": "ctrl hash"})
+        )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    assert transaction.data["ctrl"] == "ctrl hash"
+
+    with django_assert_num_queries(10):
+        payment_processor.handle_transaction_response(
+            transaction, factory.get("/complete", {"err": "Card declined"})
+        )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+
+    with django_assert_num_queries(0):
+        payment_processor.handle_transaction_response(
+            transaction, factory.get("/complete", {"ctrl": "ctrl hash"})
+        )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"ctrl": "ctrl hash"}, {"err": "Card declined"}])
+def test_handle_transaction_response_saves_transaction(
+    payment_processor, transaction, params
+):
+    receiver = MagicMock()
+    post_save.connect(receiver, sender=Transaction)
+    try:
+        payment_processor.handle_transaction_response(
+            transaction, RequestFactory().get("/complete", params)
+        )
+    finally:
+        post_save.disconnect(receiver, sender=Transaction)
+
+    receiver.assert_called_once()
+    assert receiver.call_args.kwargs["instance"] is transaction
+    assert set(receiver.call_args.kwargs["update_fields"]) == {
+        "state",
+        "data",
+        "fail_code",
+        "updated_at",
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"ctrl": "ctrl hash"}, {"err": "Card declined"}])
+def test_handle_transaction_response_after_ipn(payment_processor, transaction, params):
+    Transaction.objects.filter(pk=transaction.pk).update(
+        state=Transaction.States.Settled
+    )
+
+    payment_processor.handle_transaction_response(
+        transaction, RequestFactory().get("/complete", params)
+    )
+
+    assert transaction.state == Transaction.States.Settled
+    assert "ctrl" not in transaction.data
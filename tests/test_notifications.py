@@ -0,0 +1,189 @@
+import pytest
+from django.db import transaction as django_transaction
+from django.test import override_settings
+from django.utils import timezone
+from mock import MagicMock, patch
+from payu.models import PayUIPN, PayUToken
+from silver.models import Transaction
+
+from silver_payu.deduplication import SeenSet, seen_ipns
+from silver_payu.models import PayUNotification
+from silver_payu.notifications import get_notification_delay, process_notifications
+from silver_payu.payment_processors import payu_ipn_received
+
+from .fixtures import *
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_ASYNC_IPN=True)
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_payment_ipn_is_queued_and_applied_later(mocked_document, transaction):
+    transaction.process()
+    transaction.save()
+
+    PayUIPN.objects.create(
+        REFNO="123", REFNOEXT=str(transaction.uuid), ORDERSTATUS="PAYMENT_AUTHORIZED"
+    )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+
+    notification = PayUNotification.objects.get()
+    assert notification.kind == PayUNotification.Kinds.Payment
+    assert notification.state == PayUNotification.States.Queued
+
+    [(_, result)] = process_notifications(max_workers=1)
+    assert result
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Settled
+
+    notification.refresh_from_db()
+    assert notification.state == PayUNotification.States.Done
+    assert notification.attempts == 1
+
+    assert process_notifications(max_workers=1) == []
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_ASYNC_IPN=True)
+def test_token_ipn_is_queued_and_applied_later(transaction_triggered_v2):
+    ipn = PayUIPN.objects.create(
+        REFNO="123", REFNOEXT=str(transaction_triggered_v2.uuid), ORDERSTATUS="TEST"
+    )
+    PayUToken.objects.create(
+        ipn=ipn,
+        TOKEN_HASH="token-hash",
+        IPN_CC_MASK="4111",
+        IPN_CC_EXP_DATE="2030-07-31",
+    )
+
+    assert PayUNotification.objects.filter(kind=PayUNotification.Kinds.Token).exists()
+    assert not transaction_triggered_v2.payment_method.verified
+
+    with patch("silver_payu.notifications.handle_payment_ipn"):
+        process_notifications(max_workers=1)
+
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.refresh_from_db()
+    assert payment_method.verified
+    assert payment_method.token == "token-hash"
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_ASYNC_IPN=True, SILVER_PAYU_IPN_MAX_ATTEMPTS=2)
+def test_failing_notification_is_retried(transaction):
+    PayUIPN.objects.create(
+        REFNO="123", REFNOEXT=str(transaction.uuid), ORDERSTATUS="TEST"
+    )
+    notification = PayUNotification.objects.get()
+
+    with patch(
+        "silver_payu.notifications.handle_payment_ipn", side_effect=ValueError("down")
+    ):
+        process_notifications(max_workers=1)
+
+        notification.refresh_from_db()
+        assert notification.state == PayUNotification.States.Queued
+        assert notification.next_attempt_at > timezone.now()
+
+        # not claimed again before its next attempt is due
+        assert process_notifications(max_workers=1) == []
+
+        notification.next_attempt_at = timezone.now()
+        notification.save()
+
+        process_notifications(max_workers=1)
+
+    notification.refresh_from_db()
+    assert notification.state == PayUNotification.States.Failed
+    assert notification.attempts == 2
+    assert notification.error == "down"
+    assert notification.next_attempt_at is None
+
+
+@override_settings(SILVER_PAYU_IPN_RETRY_DELAY=30, SILVER_PAYU_IPN_RETRY_MAX_DELAY=100)
+def test_notification_delay_backs_off():
+    rng = MagicMock(uniform=lambda low, high: high)
+
+    assert [get_notification_delay(attempts, rng) for attempts in range(1, 5)] == [
+        30,
+        60,
+        100,
+        100,
+    ]
+
+
+@pytest.mark.django_db
+@patch("silver_payu.payment_processors.handle_payment_ipn")
+def test_redelivered_ipn_is_skipped(
+    mocked_handle, transaction, django_capture_on_commit_callbacks
+):
+    ipn = MagicMock(REFNO="123", REFNOEXT=str(transaction.uuid), ORDERSTATUS="TEST")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        payu_ipn_received(ipn)
+    payu_ipn_received(ipn)
+    assert mocked_handle.call_count == 1
+
+    # the IPN may have been handled by another process
+    seen_ipns.clear()
+    payu_ipn_received(ipn)
+    assert mocked_handle.call_count == 1
+
+    ipn.ORDERSTATUS = "COMPLETE"
+    payu_ipn_received(ipn)
+    assert mocked_handle.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("silver_payu.payment_processors.handle_payment_ipn")
+def test_rolled_back_ipn_is_not_marked_as_seen(
+    mocked_handle, transaction, django_capture_on_commit_callbacks
+):
+    ipn = MagicMock(REFNO="123", REFNOEXT=str(transaction.uuid), ORDERSTATUS="TEST")
+
+    # the request handling the IPN fails after the signal
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(ValueError):
+            with django_transaction.atomic():
+                payu_ipn_received(ipn)
+                raise ValueError("down")
+    assert not callbacks
+
+    # PayU redelivers it
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        payu_ipn_received(ipn)
+    assert len(callbacks) == 1
+    assert mocked_handle.call_count == 2
+
+    payu_ipn_received(ipn)
+    assert mocked_handle.call_count == 2
+
+
+@pytest.mark.django_db
+def test_failed_ipn_is_not_marked_as_seen(transaction):
+    ipn = MagicMock(REFNO="123", REFNOEXT=str(transaction.uuid), ORDERSTATUS="TEST")
+
+    with patch(
+        "silver_payu.payment_processors.handle_payment_ipn",
+        side_effect=ValueError("down"),
+    ) as mocked_handle:
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                payu_ipn_received(ipn)
+
+    assert mocked_handle.call_count == 2
+
+
+def test_seen_set_forgets_least_recently_seen_keys():
+    seen = SeenSet(max_size=2)
+
+    seen.add(b"a")
+    seen.add(b"b")
+    assert b"a" in seen
+
+    seen.add(b"c")
+    assert len(seen) == 2
+    assert b"a" in seen
+    assert b"b" not in seen
@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+from silver.fixtures.factories import DocumentEntryFactory, ProductCodeFactory
+from silver.models import Invoice
+
+from silver_payu.orders import get_order_lines
+
+from .fixtures import *
+
+
+@pytest.fixture()
+def itemized_transaction(customer, payment_method_triggered_v2):
+    entries = [
+        DocumentEntryFactory.create(
+            description="Hosting",
+            quantity=3,
+            unit_price=Decimal("10.00"),
+            product_code=ProductCodeFactory.create(value="hosting"),
+        ),
+        DocumentEntryFactory.create(
+            description="Bandwidth",
+            quantity=Decimal("2.5"),
+            unit_price=Decimal("2.00"),
+            product_code=None,
+        ),
+        DocumentEntryFactory.create(
+            description="Free trial", quantity=1, unit_price=0, product_code=None
+        ),
+    ]
+    invoice = InvoiceFactory.create(
+        state=Invoice.STATES.ISSUED,
+        customer=customer,
+        currency="RON",
+        transaction_currency="RON",
+        sales_tax_percent=Decimal("19.00"),
+        invoice_entries=entries,
+    )
+
+    return TransactionFactory.create(
+        invoice=invoice,
+        proforma=None,
+        currency="RON",
+        amount=invoice.total,
+        payment_method=payment_method_triggered_v2,
+    )
+
+
+@pytest.mark.django_db
+def test_orders_are_not_itemized_by_default(itemized_transaction):
+    assert get_order_lines(itemized_transaction) is None
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_ORDER_LINES=True)
+def test_order_lines(itemized_transaction):
+    invoice = itemized_transaction.invoice
+    hosting, bandwidth, _ = invoice.entries
+
+    assert get_order_lines(itemized_transaction) == [
+        {
+            "PNAME": "Hosting",
+            "PCODE": "hosting",
+            "PRICE": "11.90",
+            "VAT": "19",
+            "PRICE_TYPE": "GROSS",
+            "QTY": "3",
+        },
+        {
+            "PNAME": "Bandwidth",
+            "PCODE": f"{invoice.series_number}-{bandwidth.pk}",
+            "PRICE": "5.95",
+            "VAT": "19",
+            "PRICE_TYPE": "GROSS",
+            "QTY": "1",
+        },
+    ]
+
+    # partial payments keep a single line
+    itemized_transaction.amount -= 1
+    assert get_order_lines(itemized_transaction) is None
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_ORDER_LINES=True)
+def test_charge_batch_loads_the_entries_at_once(
+    django_assert_num_queries, payment_processor_triggered_v2, itemized_transaction
+):
+    # the transactions and the invoices' entries, there being no proformas
+    with django_assert_num_queries(2):
+        (transaction,) = payment_processor_triggered_v2.get_charge_batch(
+            [itemized_transaction.pk]
+        )
+
+    with django_assert_num_queries(0):
+        assert len(get_order_lines(transaction)) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from silver_payu.parsers import (
+    parse_alu_response,
+    parse_irn_response,
+    parse_order_status,
+)
+
+
+def test_parse_alu_response():
+    content = b"""<?xml version="1.0"?>
+    <EPAYMENT>
+        <REFNO>6468866</REFNO>
+        <STATUS>FAILED</STATUS>
+        <RETURN_CODE>AUTHORIZATION_FAILED</RETURN_CODE>
+        <RETURN_MESSAGE><![CDATA[Declined & <retry>]]> later</RETURN_MESSAGE>
+        <EXTRA><STATUS>IGNORED</STATUS></EXTRA>
+    </EPAYMENT>
+    """
+
+    response = parse_alu_response(content)
+
+    assert response.status == "FAILED"
+    assert response.return_code == "AUTHORIZATION_FAILED"
+    assert response.return_message == "Declined & <retry> later"
+    assert response.refno == "6468866"
+    assert response.text == content.decode("utf-8")
+
+
+def test_parse_alu_response_without_optional_fields():
+    response = parse_alu_response(
+        "<EPAYMENT><STATUS>SUCCESS</STATUS><RETURN_CODE/></EPAYMENT>"
+    )
+
+    assert response.status == "SUCCESS"
+    assert response.return_code == ""
+    assert response.return_message is None
+    assert response.refno is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"",
+        b"<EPAYMENT><STATUS>SUCCESS</STATUS>",
+        b"<EPAYMENT><STATUS>SUCCESS</RETURN_CODE></EPAYMENT>",
+        b"<html>Service unavailable</html>",
+        b"<EPAYMENT><RETURN_CODE>AUTHORIZED</RETURN_CODE></EPAYMENT>",
+    ],
+)
+def test_parse_malformed_alu_response(content):
+    with pytest.raises(ValueError):
+        parse_alu_response(content)
+
+
+def test_parse_order_status():
+    content = b"""<?xml version="1.0"?>
+    <Order>
+        <ORDER_DATE>2024-03-14 10:04:42</ORDER_DATE>
+        <REFNO>6468866</REFNO>
+        <REFNOEXT>a6f9b9e0</REFNOEXT>
+        <ORDER_STATUS>COMPLETE</ORDER_STATUS>
+        <PAYMETHOD>Visa/MasterCard/Eurocard</PAYMETHOD>
+    </Order>
+    """
+
+    assert parse_order_status(content) == ("COMPLETE", "6468866")
+    assert parse_order_status(
+        "<Order><ORDER_STATUS>NOT_FOUND</ORDER_STATUS></Order>"
+    ) == ("NOT_FOUND", None)
+
+    with pytest.raises(ValueError):
+        parse_order_status("<Order><REFNO>6468866</REFNO></Order>")
+
+
+def test_parse_irn_response():
+    content = (
+        b"<EPAYMENT>6468866|1|Confirmed.|2026-10-18 10:04:42|"
+        b"5b9ad7e30f3a6e1b2d5a2c6d7d8b5c01</EPAYMENT>"
+    )
+
+    assert parse_irn_response(content) == ("1", "Confirmed.")
+
+    with pytest.raises(ValueError):
+        parse_irn_response("<html>Internal error</html>")
@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+import pytest
+import requests
+import responses
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from mock import patch
+from payu.conf import PAYU_TOKENS_URL
+
+from silver.models import Transaction
+
+from silver_payu import http
+from silver_payu.payments import ALUPayment, TokenPayment
+
+from .fixtures import *
+
+
+@pytest.fixture(autouse=True)
+def pooled_session():
+    http.close_session()
+    yield
+    http.close_session()
+
+
+def test_payments_reuse_the_pooled_session():
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body="<EPAYMENT/>")
+    responses.add(responses.POST, PAYU_TOKENS_URL, body="{}")
+
+    session = http.get_session()
+
+    with patch.object(session, "post", wraps=session.post) as mocked_post:
+        assert ALUPayment({"ORDER": []}, "token").pay() == b"<EPAYMENT/>"
+        assert TokenPayment({}, "token").pay() == b"{}"
+
+    assert mocked_post.call_count == 2
+    assert http.get_session() is session
+
+
+@override_settings(SILVER_PAYU_HTTP_POOL_SIZE=3, SILVER_PAYU_HTTP_POOL_HOSTS=2)
+def test_session_pool_settings():
+    adapter = http.get_session().get_adapter(settings.PAYU_ALU_URL)
+
+    assert adapter._pool_maxsize == 3
+    assert adapter._pool_connections == 2
+    assert adapter._pool_block
+
+
+def test_idle_session_is_recycled():
+    session = http.get_session()
+
+    # another thread might still be using it
+    with patch.object(session, "close") as mocked_close:
+        with override_settings(SILVER_PAYU_HTTP_IDLE_TIMEOUT=-1):
+            assert http.get_session() is not session
+
+    assert not mocked_close.called
+
+
+def test_circuit_breaker():
+    now = [0]
+    breaker = http.CircuitBreaker(
+        failure_threshold=3, failure_window=10, reset_timeout=30, clock=lambda: now[0]
+    )
+
+    # failures spread over more than the window don't open the circuit
+    for now[0] in [0, 5, 11]:
+        breaker.record_failure()
+    assert breaker.state == breaker.Closed
+
+    now[0] = 12
+    breaker.record_failure()
+    assert breaker.state == breaker.Open
+
+    now[0] = 20
+    with pytest.raises(http.CircuitOpenError) as error:
+        breaker.before_request()
+    assert error.value.retry_after == 22
+
+    # a single trial request is let through once the reset timeout passes
+    now[0] = 42
+    breaker.before_request()
+    assert breaker.state == breaker.HalfOpen
+    with pytest.raises(http.CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_failure()
+    assert breaker.state == breaker.Open
+
+    now[0] = 72
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == breaker.Closed
+    breaker.before_request()
+
+
+@override_settings(SILVER_PAYU_CIRCUIT_FAILURE_THRESHOLD=2)
+def test_post_fails_fast_while_payu_is_unreachable():
+    responses.add(
+        responses.POST, PAYU_TOKENS_URL, body=requests.ConnectTimeout("timed out")
+    )
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectTimeout):
+            TokenPayment({}, "token").pay()
+
+    with pytest.raises(http.CircuitOpenError):
+        TokenPayment({}, "token").pay()
+
+    assert len(responses.calls) == 2
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_RETRY_MAX_ATTEMPTS=2)
+def test_charge_is_postponed_while_the_circuit_is_open(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    transaction = transaction_triggered_v2
+    transaction.process()
+    transaction.save()
+
+    payment_method = transaction.payment_method
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": "address",
+        "BILL_CITY": "city",
+        "BILL_EMAIL": "email@example.com",
+        "BILL_FNAME": "first",
+        "BILL_LNAME": "last",
+        "BILL_PHONE": "0700000000",
+    }
+    payment_method.save()
+
+    breaker = http.get_circuit_breaker(settings.PAYU_ALU_URL)
+    breaker.state = breaker.Open
+    breaker._opened_at = breaker.clock()
+
+    # postponements don't use up the retries, however many there are
+    for _ in range(3):
+        now = timezone.now()
+        assert not payment_processor_triggered_v2.execute_transaction(transaction)
+
+        transaction.refresh_from_db()
+        assert transaction.state == Transaction.States.Pending
+        assert transaction.data["retry"]["error_code"] == "circuit_open"
+        assert transaction.data["retry"]["attempts"] == 0
+        assert parse_datetime(
+            transaction.data["retry"]["next_attempt_at"]
+        ) > now + timedelta(seconds=breaker.reset_timeout - 1)
+
+    assert not responses.calls
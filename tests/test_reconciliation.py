@@ -0,0 +1,127 @@
+import json
+from datetime import timedelta
+
+import pytest
+import responses
+from django.core.management import call_command
+from django.utils import timezone
+from mock import patch
+from silver.models import Transaction
+
+from silver_payu.payments import PAYU_IOS_URL, OrderStatusQuery
+from silver_payu.reconciliation import (
+    Outcomes,
+    get_stuck_transactions,
+    reconcile_transactions,
+)
+
+from .fixtures import *
+
+
+def order_status(status, refno=""):
+    return (
+        f"<Order><ORDER_STATUS>{status}</ORDER_STATUS>"
+        f"<REFNO>{refno}</REFNO></Order>"
+    )
+
+
+def split(transaction, **kwargs):
+    """
+    :return: Another transaction for the same documents, each getting half of
+             the amount.
+    """
+
+    amount = transaction.amount / 2
+    Transaction.objects.filter(pk=transaction.pk).update(amount=amount)
+
+    return TransactionFactory.create(
+        invoice=transaction.invoice,
+        proforma=transaction.proforma,
+        currency="RON",
+        amount=amount,
+        payment_method=transaction.payment_method,
+        **kwargs,
+    )
+
+
+def make_stuck(*transactions):
+    Transaction.objects.filter(pk__in=[t.pk for t in transactions]).update(
+        state=Transaction.States.Pending,
+        updated_at=timezone.now() - timedelta(hours=1),
+    )
+
+
+@pytest.mark.django_db
+def test_unknown_outcomes_stay_pending(
+    payment_processor_triggered, transaction_triggered
+):
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.save()
+
+    assert not payment_processor_triggered._parse_result(
+        transaction, json.dumps({"code": 607, "message": "Pending bank response"})
+    )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    assert transaction.data["outcome_unknown"] == "607"
+    assert "retry" not in transaction.data
+
+
+@pytest.mark.django_db
+def test_stuck_transactions(transaction_triggered):
+    retried = split(transaction_triggered, data={"retry": {"attempts": 1}})
+    assert get_stuck_transactions() == []
+
+    make_stuck(transaction_triggered, retried)
+
+    assert get_stuck_transactions() == [transaction_triggered.pk]
+    assert get_stuck_transactions(now=timezone.now() - timedelta(hours=2)) == []
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_reconcile_transactions(update_document_state, transaction_triggered):
+    transactions = [transaction_triggered, split(transaction_triggered)]
+    transactions.append(split(transactions[-1]))
+    make_stuck(*transactions)
+
+    for status in ["COMPLETE", "CARD_NOTAUTHORIZED", "IN_PROGRESS"]:
+        responses.add(
+            responses.POST, PAYU_IOS_URL, body=order_status(status, refno="6468866")
+        )
+
+    results = reconcile_transactions(
+        [transaction.pk for transaction in transactions], max_workers=1
+    )
+
+    outcomes = {transaction.pk: outcome for transaction, outcome in results}
+    settled, failed, pending = [
+        Transaction.objects.get(pk=transaction.pk) for transaction in transactions
+    ]
+
+    assert outcomes[settled.pk] == Outcomes.Settled
+    assert settled.state == Transaction.States.Settled
+    assert settled.external_reference == "6468866"
+    assert settled.data["order_status"] == "COMPLETE"
+
+    assert outcomes[failed.pk] == Outcomes.Failed
+    assert failed.state == Transaction.States.Failed
+    assert failed.fail_code == "transaction_declined_by_bank"
+
+    assert outcomes[pending.pk] == Outcomes.Pending
+    assert pending.state == Transaction.States.Pending
+
+
+@pytest.mark.django_db
+def test_reconcile_command(transaction_triggered):
+    make_stuck(transaction_triggered)
+    responses.add(
+        responses.POST, PAYU_IOS_URL, body=order_status(OrderStatusQuery.NotFound)
+    )
+
+    call_command("reconcile_payu_transactions", workers=1)
+
+    transaction_triggered.refresh_from_db()
+    assert transaction_triggered.state == Transaction.States.Failed
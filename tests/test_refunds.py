@@ -0,0 +1,102 @@
+import pytest
+import responses
+from django.core.management import call_command
+from mock import patch
+from silver.models import Transaction
+
+from silver_payu.payments import PAYU_IOS_URL, PAYU_IRN_URL
+
+from .fixtures import *
+
+
+def irn_response(code, message):
+    return (
+        f"<EPAYMENT>6468866|{code}|{message}|2026-10-18 10:04:42|"
+        "5b9ad7e30f3a6e1b2d5a2c6d7d8b5c01</EPAYMENT>"
+    )
+
+
+@pytest.fixture()
+def settled_transaction(transaction_triggered_v2):
+    transaction_triggered_v2.settle()
+    transaction_triggered_v2.external_reference = "6468866"
+    transaction_triggered_v2.save()
+
+    return transaction_triggered_v2
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_refund_transaction(
+    update_document_state, payment_processor_triggered_v2, settled_transaction
+):
+    responses.add(responses.POST, PAYU_IRN_URL, body=irn_response(1, "Confirmed."))
+
+    assert payment_processor_triggered_v2.refund_transaction(settled_transaction)
+
+    (call,) = responses.calls
+    assert "ORDER_REF=6468866" in call.request.body
+    assert f"AMOUNT={settled_transaction.amount}" in call.request.body
+
+    settled_transaction.refresh_from_db()
+    assert settled_transaction.state == Transaction.States.Refunded
+    assert settled_transaction.data["irn"] == {"code": "1", "message": "Confirmed."}
+
+    # already refunded
+    assert not payment_processor_triggered_v2.refund_transaction(settled_transaction)
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_refused_refunds(
+    update_document_state, payment_processor_triggered_v2, settled_transaction
+):
+    responses.add(responses.POST, PAYU_IRN_URL, body=irn_response(6, ""))
+
+    assert not payment_processor_triggered_v2.refund_transaction(settled_transaction)
+
+    settled_transaction.refresh_from_db()
+    assert settled_transaction.state == Transaction.States.Settled
+    assert settled_transaction.data["irn"] == {
+        "code": "6",
+        "message": "Error refunding the order.",
+    }
+
+
+@pytest.mark.django_db
+def test_void_transaction_payu_never_got(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    responses.add(
+        responses.POST,
+        PAYU_IOS_URL,
+        body="<Order><ORDER_STATUS>NOT_FOUND</ORDER_STATUS></Order>",
+    )
+
+    assert payment_processor_triggered_v2.void_transaction(transaction_triggered_v2)
+    assert len(responses.calls) == 1
+
+    transaction_triggered_v2.refresh_from_db()
+    assert transaction_triggered_v2.state == Transaction.States.Canceled
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_refund_command(update_document_state, settled_transaction, capsys):
+    responses.add(responses.POST, PAYU_IRN_URL, body=irn_response(7, "Refunded."))
+
+    call_command(
+        "refund_payu_transactions",
+        str(settled_transaction.uuid),
+        "e9b9b7d2-8d5b-4b0e-9a55-3b7b8c0e4f3a",
+        workers=1,
+    )
+
+    output = capsys.readouterr().out
+    assert f"{settled_transaction.uuid}: refunded" in output
+    assert "e9b9b7d2-8d5b-4b0e-9a55-3b7b8c0e4f3a: not found" in output
+    assert "Refunded 1 of 2 transactions." in output
@@ -0,0 +1,151 @@
+import json
+import random
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from mock import patch
+from silver.models import Transaction
+
+from silver_payu.errors import ErrorKinds, get_error_kind
+from silver_payu.payment_processors import PayUTriggered
+from silver_payu.retries import get_due_retries, get_retry_delay
+
+from .fixtures import *
+
+
+def test_error_kinds():
+    assert get_error_kind("603") == ErrorKinds.Transient
+    assert get_error_kind(605) == ErrorKinds.Transient
+    assert get_error_kind("2000") == ErrorKinds.Throttling
+    assert get_error_kind("602") == ErrorKinds.Permanent
+    assert get_error_kind("AUTHORIZATION_FAILED") == ErrorKinds.Permanent
+    assert get_error_kind("GW_ERROR_GENERIC") == ErrorKinds.Transient
+    assert get_error_kind("REQUEST_EXPIRED") == ErrorKinds.Throttling
+    assert get_error_kind("ALREADY_AUTHORIZED") == ErrorKinds.Unknown
+
+
+@override_settings(
+    SILVER_PAYU_RETRY_BASE_DELAY=10,
+    SILVER_PAYU_RETRY_THROTTLING_DELAY=100,
+    SILVER_PAYU_RETRY_MAX_DELAY=1000,
+)
+def test_retry_delay_backs_off_with_jitter():
+    rng = random.Random(1)
+
+    for attempt, delay in enumerate([10, 20, 40, 80, 160, 320, 640, 1000, 1000]):
+        assert delay / 2 <= get_retry_delay(attempt, ErrorKinds.Transient, rng) <= delay
+
+    assert 50 <= get_retry_delay(0, ErrorKinds.Throttling, rng) <= 100
+    assert len({get_retry_delay(3, ErrorKinds.Transient, rng) for _ in range(5)}) == 5
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_RETRY_MAX_ATTEMPTS=2)
+def test_transient_errors_are_retried(
+    payment_processor_triggered, transaction_triggered
+):
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.save()
+
+    failure = json.dumps({"code": 603, "message": "Temporary processing error"})
+
+    for attempt in [1, 2]:
+        assert not payment_processor_triggered._parse_result(transaction, failure)
+
+        transaction.refresh_from_db()
+        assert transaction.state == Transaction.States.Pending
+        assert transaction.data["retry"]["attempts"] == attempt
+        assert transaction.data["retry"]["error_code"] == "603"
+
+    assert not payment_processor_triggered._parse_result(transaction, failure)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "return_code", ["GW_ERROR_GENERIC", "REQUEST_EXPIRED", "ALREADY_AUTHORIZED"]
+)
+def test_alu_errors_are_retried(
+    payment_processor_triggered_v2, transaction_triggered_v2, return_code
+):
+    transaction = transaction_triggered_v2
+    transaction.process()
+    transaction.save()
+
+    failure = f"""<?xml version="1.0"?>
+    <EPAYMENT>
+        <STATUS>FAILED</STATUS>
+        <RETURN_CODE>{return_code}</RETURN_CODE>
+        <RETURN_MESSAGE>Failed.</RETURN_MESSAGE>
+    </EPAYMENT>
+    """
+    assert not payment_processor_triggered_v2._parse_result(transaction, failure)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    if return_code == "ALREADY_AUTHORIZED":
+        # left to reconciliation, see test_reconciliation
+        assert transaction.data["outcome_unknown"] == return_code
+        assert "retry" not in transaction.data
+    else:
+        assert transaction.data["retry"]["attempts"] == 1
+        assert transaction.data["retry"]["error_code"] == return_code
+
+
+@pytest.mark.django_db
+def test_permanent_errors_are_not_retried(
+    payment_processor_triggered, transaction_triggered
+):
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.save()
+
+    assert not payment_processor_triggered._parse_result(
+        transaction, json.dumps({"code": 602, "message": "Expired card"})
+    )
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+    assert transaction.fail_code == "expired_card"
+    assert "retry" not in transaction.data
+
+
+@pytest.mark.django_db
+def test_retry_command_charges_due_transactions(transaction_triggered):
+    transaction = transaction_triggered
+    transaction.process()
+    transaction.data["retry"] = {
+        "attempts": 1,
+        "next_attempt_at": (timezone.now() + timedelta(minutes=5)).isoformat(),
+        "error_code": "603",
+        "reason": "Temporary processing error",
+    }
+    transaction.save()
+
+    payment_method = transaction.payment_method
+    payment_method.verified = True
+    payment_method.save()
+
+    assert get_due_retries() == []
+    assert get_due_retries(timezone.now() + timedelta(minutes=6)) == [transaction.pk]
+
+    transaction.data["retry"]["next_attempt_at"] = timezone.now().isoformat()
+    transaction.save()
+
+    with patch.object(
+        PayUTriggered,
+        "_charge_transaction",
+        lambda self, transaction: self._parse_result(transaction, '{"code": 0}'),
+    ):
+        call_command("retry_payu_transactions", workers=1)
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Pending
+    assert "retry" not in transaction.data
+    assert get_due_retries() == []
@@ -0,0 +1,125 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from mock import patch
+from silver.fixtures.factories import (
+    InvoiceFactory,
+    ProformaFactory,
+    TransactionFactory,
+)
+from silver.models import Invoice, Transaction
+
+from silver_payu.models import PayUChargeLease
+from silver_payu.payment_processors import PayUTriggeredV2
+from silver_payu.scheduling import ShardScheduler, claim_transaction
+
+from .fixtures import *
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = timezone.now()
+
+    def __call__(self):
+        return self.now
+
+
+def create_transaction(customer, payment_method):
+    proforma = ProformaFactory.create(
+        state=Invoice.STATES.ISSUED, customer=customer, transaction_currency="RON"
+    )
+    invoice = InvoiceFactory.create(
+        related_document=proforma,
+        state=Invoice.STATES.ISSUED,
+        customer=customer,
+        transaction_currency="RON",
+    )
+
+    return TransactionFactory.create(
+        invoice=invoice,
+        proforma=proforma,
+        currency="RON",
+        amount=invoice.total,
+        payment_method=payment_method,
+    )
+
+
+@pytest.mark.django_db
+def test_leases_are_shared_between_workers():
+    clock = FakeClock()
+    first, second = [
+        ShardScheduler(name, shards=4, lease_duration=60, clock=clock)
+        for name in ["first", "second"]
+    ]
+
+    assert first.heartbeat() == [0, 1, 2, 3]
+    assert second.heartbeat() == []
+
+    clock.now += timedelta(seconds=10)
+    assert first.heartbeat() == [0, 1]
+    assert second.heartbeat() == [2, 3]
+
+    # the first worker dies
+    clock.now += timedelta(seconds=61)
+    assert second.heartbeat() == [0, 1, 2, 3]
+
+    second.release()
+    assert not PayUChargeLease.objects.exclude(owner="").exists()
+
+
+@pytest.mark.django_db
+def test_run_once_charges_only_leased_shards(customer, payment_method_triggered_v2):
+    payment_method_triggered_v2.verified = True
+    payment_method_triggered_v2.save()
+
+    transactions = [
+        create_transaction(customer, payment_method_triggered_v2) for _ in range(2)
+    ]
+    other_shard = transactions[1].pk % 2
+    PayUChargeLease.objects.create(
+        shard=other_shard,
+        owner="other",
+        expires_at=timezone.now() + timedelta(minutes=5),
+    )
+
+    scheduler = ShardScheduler("worker", shards=2)
+    with patch.object(
+        PayUTriggeredV2, "execute_transaction", return_value=True
+    ) as execute_transaction:
+        results = scheduler.run_once(max_workers=1)
+
+    assert scheduler.owned_shards == [1 - other_shard]
+    assert [(transaction.pk, result) for transaction, result in results] == [
+        (transactions[0].pk, True)
+    ]
+    execute_transaction.assert_called_once()
+
+    transactions[0].refresh_from_db()
+    assert transactions[0].state == Transaction.States.Pending
+    transactions[1].refresh_from_db()
+    assert transactions[1].state == Transaction.States.Initial
+
+
+@pytest.mark.django_db
+def test_expiring_leases_stop_charges(transaction_triggered_v2):
+    clock = FakeClock()
+    scheduler = ShardScheduler(
+        "worker", shards=1, lease_duration=60, margin=30, clock=clock
+    )
+    scheduler.heartbeat()
+
+    clock.now += timedelta(seconds=31)
+    assert scheduler.charge(transaction_triggered_v2) is None
+
+    transaction_triggered_v2.refresh_from_db()
+    assert transaction_triggered_v2.state == Transaction.States.Initial
+
+
+@pytest.mark.django_db
+def test_transactions_are_claimed_once(transaction_triggered_v2):
+    duplicate = Transaction.objects.get(pk=transaction_triggered_v2.pk)
+
+    assert claim_transaction(transaction_triggered_v2)
+    assert not claim_transaction(duplicate)
+    assert duplicate.state == Transaction.States.Pending
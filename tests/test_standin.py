@@ -0,0 +1,122 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from django.test import Client
+from faker import Faker
+from mock import patch
+from payu.models import PayUIPN
+from silver.models import Transaction
+
+from silver_payu.standin import ErrorMix, LatencyDistribution, PayUStandIn, build_ipn
+
+from .fixtures import *
+
+faker = Faker()
+
+
+@pytest.fixture()
+def standin():
+    with PayUStandIn(alu_errors={"AUTHORIZATION_FAILED": 0.5}, seed=1) as standin:
+        yield standin
+
+
+def test_latency_distributions():
+    rng = random.Random(1)
+
+    assert LatencyDistribution.parse("fixed:0.5").sample(rng) == 0.5
+    assert LatencyDistribution.parse(None).sample(rng) == 0
+    assert 0.1 <= LatencyDistribution.parse("uniform:0.1,0.2").sample(rng) <= 0.2
+    assert LatencyDistribution.parse("lognormal:-2,0.5").sample(rng) > 0
+
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("gaussian:1")
+
+
+def test_error_mix_only_accepts_known_codes():
+    assert ErrorMix.parse("603=1", {"603": {}}).pick(random.Random()) == "603"
+
+    with pytest.raises(ValueError):
+        ErrorMix.parse("999=0.1", {"603": {}})
+
+    with pytest.raises(ValueError):
+        ErrorMix.parse("603=0.7,605=0.7", {"603": {}, "605": {}})
+
+
+@pytest.mark.withoutresponses
+def test_stats_are_counted_across_threads(standin):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(8):
+            executor.submit(lambda: [standin.count("alu_200") for _ in range(1000)])
+
+    assert standin.get_stats() == {"alu_200": 8000}
+    assert requests.get(standin.url + "/stats").json() == {"alu_200": 8000}
+
+
+@pytest.mark.withoutresponses
+@pytest.mark.django_db
+def test_charging_against_the_standin(
+    standin, payment_processor_triggered_v2, transaction_triggered_v2
+):
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.save()
+
+    transaction = transaction_triggered_v2
+    states = set()
+    with patch("silver_payu.payments.PAYU_ALU_URL", standin.url + "/order/alu/v3"):
+        for _ in range(10):
+            transaction.state = Transaction.States.Pending
+            payment_processor_triggered_v2.execute_transaction(transaction)
+            states.add(transaction.state)
+
+    assert states == {Transaction.States.Pending, Transaction.States.Failed}
+
+    stats = requests.get(standin.url + "/stats").json()
+    assert stats["alu_200"] == 10
+
+
+@pytest.mark.withoutresponses
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_refunding_against_the_standin(
+    mocked_document, standin, payment_processor_triggered_v2, transaction_triggered_v2
+):
+    transaction = transaction_triggered_v2
+    transaction.settle()
+    transaction.external_reference = "6468866"
+    transaction.save()
+
+    with patch("silver_payu.payments.PAYU_IRN_URL", standin.url + "/order/irn.php"):
+        ((_, result),) = payment_processor_triggered_v2.refund_transactions(
+            [transaction], max_workers=1
+        )
+
+    assert result
+    assert transaction.state == Transaction.States.Refunded
+    assert requests.get(standin.url + "/stats").json()["irn_200"] == 1
+
+
+@pytest.mark.django_db
+@patch("silver.models.transactions.transaction.Transaction.update_document_state")
+def test_standin_ipns_are_accepted(mocked_document, transaction):
+    transaction.process()
+    transaction.save()
+
+    response = Client().post(
+        "/ipn/", dict(build_ipn(str(transaction.uuid), "123456789"))
+    )
+
+    assert response.status_code == 200
+    assert not PayUIPN.objects.get(REFNOEXT=transaction.uuid).flag
+
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Settled
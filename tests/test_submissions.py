@@ -0,0 +1,174 @@
+import pytest
+import responses
+from django.conf import settings
+from django.test import override_settings
+from faker import Faker
+from mock import patch
+from requests import ConnectionError
+from silver.models import Transaction
+
+from silver_payu.models import PayUSubmission
+from silver_payu.payment_processors import PayUTriggeredV2
+from silver_payu.payments import PAYU_IOS_URL
+
+from .fixtures import *
+
+faker = Faker()
+
+SUCCESS_RESPONSE = """<?xml version="1.0"?>
+<EPAYMENT>
+    <REFNO>6468866</REFNO>
+    <STATUS>SUCCESS</STATUS>
+    <RETURN_CODE>AUTHORIZED</RETURN_CODE>
+    <RETURN_MESSAGE>Authorized.</RETURN_MESSAGE>
+</EPAYMENT>
+"""
+
+
+def order_status(status):
+    return f"<Order><ORDER_STATUS>{status}</ORDER_STATUS></Order>"
+
+
+@pytest.fixture()
+def pending_transaction(transaction_triggered_v2):
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = {
+        "BILL_ADDRESS": faker.address(),
+        "BILL_CITY": faker.city(),
+        "BILL_EMAIL": faker.email(),
+        "BILL_FNAME": faker.first_name(),
+        "BILL_LNAME": faker.last_name(),
+        "BILL_PHONE": faker.phone_number(),
+    }
+    payment_method.save()
+
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    return transaction_triggered_v2
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_IDEMPOTENT_SUBMISSIONS=True)
+def test_successful_charges_are_not_submitted_again(
+    payment_processor_triggered_v2, pending_transaction
+):
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body=SUCCESS_RESPONSE)
+
+    for _ in range(2):
+        assert payment_processor_triggered_v2.execute_transaction(pending_transaction)
+
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_IDEMPOTENT_SUBMISSIONS=True)
+def test_responses_are_applied_after_crashes(
+    payment_processor_triggered_v2, pending_transaction
+):
+    responses.add(
+        responses.POST,
+        settings.PAYU_ALU_URL,
+        body=SUCCESS_RESPONSE.replace("SUCCESS", "FAILED"),
+    )
+
+    with patch.object(PayUTriggeredV2, "_parse_result", side_effect=SystemExit):
+        with pytest.raises(SystemExit):
+            payment_processor_triggered_v2.execute_transaction(pending_transaction)
+
+    transaction = Transaction.objects.get(pk=pending_transaction.pk)
+    assert transaction.state == Transaction.States.Pending
+    assert not payment_processor_triggered_v2.execute_transaction(transaction)
+
+    assert len(responses.calls) == 1
+    transaction.refresh_from_db()
+    assert transaction.state == Transaction.States.Failed
+    assert transaction.data["status"] == "FAILED"
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_IDEMPOTENT_SUBMISSIONS=True)
+@pytest.mark.parametrize(
+    "status, result, state",
+    [
+        ("COMPLETE", True, Transaction.States.Pending),
+        ("CARD_NOTAUTHORIZED", False, Transaction.States.Failed),
+        ("IN_PROGRESS", False, Transaction.States.Pending),
+        ("NOT_FOUND", False, Transaction.States.Failed),
+    ],
+)
+def test_unknown_outcomes_are_looked_up(
+    payment_processor_triggered_v2, pending_transaction, status, result, state
+):
+    responses.add(
+        responses.POST, settings.PAYU_ALU_URL, body=ConnectionError("Reset by peer")
+    )
+    responses.add(responses.POST, PAYU_IOS_URL, body=order_status(status))
+
+    execute_transaction = payment_processor_triggered_v2.execute_transaction
+    assert execute_transaction(pending_transaction) == result
+
+    pending_transaction.refresh_from_db()
+    assert pending_transaction.state == state
+    if status == "IN_PROGRESS":
+        assert pending_transaction.data["outcome_unknown"] == "order_status_pending"
+        assert "retry" not in pending_transaction.data
+
+
+@pytest.mark.django_db
+@override_settings(SILVER_PAYU_IDEMPOTENT_SUBMISSIONS=True)
+def test_orders_payu_never_got_are_submitted_again(
+    payment_processor_triggered_v2, pending_transaction
+):
+    PayUSubmission.objects.create(
+        order_ref=str(pending_transaction.uuid),
+        transaction=pending_transaction,
+        key="dead worker",
+        state=PayUSubmission.States.Submitting,
+    )
+    responses.add(responses.POST, PAYU_IOS_URL, body=order_status("NOT_FOUND"))
+    responses.add(responses.POST, settings.PAYU_ALU_URL, body=SUCCESS_RESPONSE)
+
+    assert payment_processor_triggered_v2.execute_transaction(pending_transaction)
+
+    assert len(responses.calls) == 2
+    assert responses.calls[0].request.url == PAYU_IOS_URL
+    submission = PayUSubmission.objects.get()
+    assert submission.state == PayUSubmission.States.Submitted
+    assert submission.is_applied(pending_transaction)
+
+
+@pytest.mark.django_db
+@override_settings(
+    SILVER_PAYU_IDEMPOTENT_SUBMISSIONS=True, SILVER_PAYU_RETRY_MAX_ATTEMPTS=1
+)
+def test_pending_orders_are_never_failed(
+    payment_processor_triggered_v2, pending_transaction
+):
+    PayUSubmission.objects.create(
+        order_ref=str(pending_transaction.uuid),
+        transaction=pending_transaction,
+        key="dead worker",
+        state=PayUSubmission.States.Submitting,
+    )
+    responses.add(responses.POST, PAYU_IOS_URL, body=order_status("IN_PROGRESS"))
+    responses.add(responses.POST, PAYU_IOS_URL, body=ConnectionError("Reset"))
+
+    # more attempts than retries allowed
+    for code in [
+        "order_status_pending",
+        "order_status_unknown",
+        "order_status_unknown",
+    ]:
+        assert not payment_processor_triggered_v2.execute_transaction(
+            pending_transaction
+        )
+
+        pending_transaction.refresh_from_db()
+        assert pending_transaction.state == Transaction.States.Pending
+        assert pending_transaction.data["outcome_unknown"] == code
+        assert "retry" not in pending_transaction.data
+
+    assert not [
+        call for call in responses.calls if call.request.url == settings.PAYU_ALU_URL
+    ]
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+import responses
+from django.conf import settings
+from django.test import override_settings
+from payu.conf import PAYU_TOKENS_URL
+
+from silver_payu import throttling
+from silver_payu.payments import ALUPayment, TokenPayment
+from silver_payu.throttling import AdaptiveConcurrency, Limiter, TokenBucket
+
+from .fixtures import *
+
+
+@pytest.fixture(autouse=True)
+def limiters():
+    throttling.reset_limiters()
+    yield
+    throttling.reset_limiters()
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(2, capacity=4, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        assert not bucket.try_acquire()
+    assert bucket.try_acquire() == 0.5
+
+    bucket.acquire()
+    assert clock.now == 0.5
+
+    # a single large amount empties a full bucket, going into debt
+    clock.now = 10
+    assert not bucket.try_acquire(10)
+    assert bucket.try_acquire() == 3.5
+
+
+def test_adaptive_concurrency():
+    concurrency = AdaptiveConcurrency(
+        initial=4, min_limit=2, max_limit=5, target_latency=1
+    )
+
+    for _ in range(4):
+        concurrency.acquire()
+    assert concurrency.in_flight == 4
+
+    for _ in range(4):
+        concurrency.release(latency=0.1)
+    limit = concurrency.limit
+    assert 4.8 < limit <= 5
+
+    concurrency.acquire()
+    concurrency.release(latency=0.1, throttled=True)
+    assert concurrency.limit == limit / 2
+
+    concurrency.acquire()
+    concurrency.release(latency=3)
+    assert concurrency.limit == 2
+
+
+def test_limiter_counts_amounts():
+    clock = FakeClock()
+    limiter = Limiter(amount_per_window=100, window=10, clock=clock, sleep=clock.sleep)
+
+    limiter.call(lambda: None, amount=60)
+    limiter.call(lambda: None, amount=40)
+    assert clock.now == 0
+
+    limiter.call(lambda: None, amount=20)
+    assert clock.now == pytest.approx(2)
+
+
+@override_settings(
+    SILVER_PAYU_RATE_LIMITS={"default": {"concurrency": 4, "max_concurrency": 8}}
+)
+def test_token_payment_throttling_lowers_concurrency():
+    responses.add(
+        responses.POST,
+        PAYU_TOKENS_URL,
+        body=json.dumps({"code": 2000, "message": "Amount limit exceeded"}),
+    )
+
+    TokenPayment({"AMOUNT": "10", "CURRENCY": "RON"}, "token").pay()
+
+    limiter = throttling.get_limiter("", "RON")
+    assert limiter.concurrency.limit == 2
+    assert limiter.concurrency.in_flight == 0
+
+
+@override_settings(
+    SILVER_PAYU_RATE_LIMITS={"default": {"concurrency": 4, "max_concurrency": 8}}
+)
+def test_alu_payment_throttling_lowers_concurrency():
+    responses.add(
+        responses.POST,
+        settings.PAYU_ALU_URL,
+        body="""<?xml version="1.0"?>
+        <EPAYMENT>
+            <STATUS>FAILED</STATUS>
+            <RETURN_CODE>REQUEST_EXPIRED</RETURN_CODE>
+            <RETURN_MESSAGE>The request has expired.</RETURN_MESSAGE>
+        </EPAYMENT>
+        """,
+    )
+
+    order = {"PRICES_CURRENCY": "RON", "ORDER": [{"PRICE": "10", "QTY": "1"}]}
+    payment = ALUPayment(order, "token")
+
+    # paying again rebuilds the payload from the whole order
+    for _ in range(2):
+        payment.pay()
+        assert payment._request["ORDER_PRICE[0]"] == "10"
+
+    assert "ORDER" in payment.order
+
+    # halved by each throttled payment
+    limiter = throttling.get_limiter("", "RON")
+    assert limiter.concurrency.limit == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_payments_are_not_limited_by_default():
+    assert throttling.get_limiter("MERCHANT", "RON") is None
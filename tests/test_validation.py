@@ -0,0 +1,96 @@
+import pytest
+import responses
+from silver.models import Transaction
+
+from silver_payu.validation import validate_alu_payment, validate_token_payment
+
+from .fixtures import *
+
+DETAILS = {
+    "AMOUNT": "10.00",
+    "CURRENCY": "RON",
+    "BILL_FNAME": "Ion",
+    "BILL_LNAME": "Popescu",
+    "BILL_EMAIL": "ion@example.com",
+    "BILL_PHONE": "0700000000",
+    "BILL_ADDRESS": "Str. Lunga 1",
+    "BILL_CITY": "Cluj",
+    "BILL_COUNTRYCODE": "RO",
+    "DELIVERY_FNAME": "Ion",
+    "DELIVERY_LNAME": "Popescu",
+    "DELIVERY_EMAIL": "ion@example.com",
+    "DELIVERY_PHONE": "0700000000",
+    "DELIVERY_ADDRESS": "Str. Lunga 1",
+    "DELIVERY_CITY": "Cluj",
+}
+
+
+@pytest.mark.parametrize(
+    "changes, code",
+    [
+        ({}, None),
+        ({"AMOUNT": "0.00"}, "1900"),
+        ({"AMOUNT": "-1"}, "1900"),
+        ({"CURRENCY": "lei"}, "2100"),
+        ({"BILL_LNAME": " "}, "2401"),
+        ({"BILL_FNAME": None}, "2402"),
+        ({"BILL_EMAIL": ""}, "2403"),
+        ({"BILL_EMAIL": "ion@example"}, "2404"),
+        ({"DELIVERY_EMAIL": ""}, None),
+        ({"DELIVERY_EMAIL": "ion"}, "2413"),
+        ({"BILL_COUNTRYCODE": "ROU"}, "2414"),
+    ],
+)
+def test_validate_token_payment(changes, code):
+    error = validate_token_payment({**DETAILS, **changes})
+
+    assert (error[0] if error else None) == code
+
+
+ALU_DETAILS = {
+    "PRICES_CURRENCY": "RON",
+    "BILL_FNAME": "Ion",
+    "BILL_LNAME": "Popescu",
+    "BILL_EMAIL": "ion@example.com",
+    "BILL_COUNTRYCODE": "RO",
+    "ORDER": [{"PRICE": "10.00"}],
+}
+
+
+@pytest.mark.parametrize(
+    "changes, code",
+    [
+        ({}, None),
+        # not required by ALU
+        ({"BILL_PHONE": "", "DELIVERY_CITY": None}, None),
+        ({"PRICES_CURRENCY": "lei"}, "INVALID_CURRENCY"),
+        ({"BILL_LNAME": " "}, "INVALID_CUSTOMER_INFO"),
+        ({"BILL_EMAIL": "ion@example"}, "INVALID_CUSTOMER_INFO"),
+        ({"BILL_COUNTRYCODE": "ROU"}, "INVALID_CUSTOMER_INFO"),
+    ],
+)
+def test_validate_alu_payment(changes, code):
+    error = validate_alu_payment({**ALU_DETAILS, **changes})
+
+    assert (error[0] if error else None) == code
+
+
+@pytest.mark.django_db
+def test_invalid_payments_are_not_sent(
+    payment_processor_triggered_v2, transaction_triggered_v2
+):
+    payment_method = transaction_triggered_v2.payment_method
+    payment_method.archived_customer = {**DETAILS, "BILL_EMAIL": "ion"}
+    payment_method.save()
+
+    transaction_triggered_v2.process()
+    transaction_triggered_v2.save()
+
+    assert not payment_processor_triggered_v2.execute_transaction(
+        transaction_triggered_v2
+    )
+    assert not responses.calls
+
+    transaction_triggered_v2.refresh_from_db()
+    assert transaction_triggered_v2.state == Transaction.States.Failed
+    assert transaction_triggered_v2.data["validation_error"] == "INVALID_CUSTOMER_INFO"